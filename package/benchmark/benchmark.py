@@ -0,0 +1,257 @@
+#    Benchmark harness for ConvertQC
+#    Run "python -m benchmark.benchmark -h" from the package directory for details.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from convertqc import cache, conversion, converter
+from . import generate
+
+# Stages of a conversion, in order
+STAGES = ["read", "parse", "lower", "translate", "write"]
+
+# Example scripts shipped with the repository, used as small baselines
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "examples")
+examples = [
+    ("example_basic_projectq", "example_basic_projectq.py", "projectq", "qutip"),
+    ("example_projectq", "example_projectq.py", "projectq", "qutip"),
+    ("example_qutip", "example_qutip.py", "qutip", "projectq")
+]
+
+
+def synthetic_cases(scale):
+    """
+    Synthetic scripts, growing linearly with scale
+    :param scale: Size multiplier
+    :return: List of (name, source, input format, output format)
+    """
+    return [
+        ("projectq_functions", generate.projectq_script(16, 50 * scale, 10, 1), "projectq", "qutip"),
+        ("projectq_nested", generate.projectq_script(16, 5 * scale, 10, 20), "projectq", "qutip"),
+        ("projectq_wide", generate.projectq_script(500 * scale, 10, 50, 1), "projectq", "qutip"),
+        ("qutip_functions", generate.qutip_script(16, 50 * scale, 10, 1), "qutip", "projectq"),
+        ("qutip_nested", generate.qutip_script(16, 5 * scale, 10, 20), "qutip", "projectq"),
+        ("qutip_flat", generate.flat_qutip_script(64, 5000 * scale), "qutip", "projectq")
+    ]
+
+
+def time_stages(filename, input_format, output_format):
+    """
+    Convert a script once, timing each stage
+    :param filename: Name of input script
+    :param input_format: Format of input script
+    :param output_format: Format to convert to
+    :return: Tuple of dictionary of stage times in seconds, and the circuit
+    """
+    times = {}
+    clock = time.perf_counter
+
+    start = clock()
+    source = conversion.read_input_source(filename)
+    times["read"] = clock() - start
+
+    reader = converter.frontends[input_format].Reader(source)
+    start = clock()
+    tree = reader.parse(source)
+    times["parse"] = clock() - start
+
+    start = clock()
+    circuit = reader.read_chunk(source, 1, tree)
+    reader.finish()
+    times["lower"] = clock() - start
+
+    writer = converter.frontends[output_format]
+    start = clock()
+    lines = writer.script_lines(circuit)
+    times["translate"] = clock() - start
+
+    start = clock()
+    output = conversion.OutputSink()
+    conversion.write_lines(output, writer.header_lines(circuit.num_qubits) + lines + writer.footer_lines())
+    times["write"] = clock() - start
+    return times, circuit
+
+
+def run_case(name, filename, input_format, output_format, repeat):
+    """
+    Time a script, keeping the fastest time of each stage over several runs
+    :return: Dictionary of results for the script
+    """
+    best = None
+    for _ in range(repeat):
+        times, circuit = time_stages(filename, input_format, output_format)
+        best = times if best is None else {stage: min(best[stage], times[stage]) for stage in STAGES}
+
+    with open(filename) as f:
+        num_lines = sum(1 for _ in f)
+    return {
+        "name": name,
+        "input_format": input_format,
+        "output_format": output_format,
+        "lines": num_lines,
+        "bytes": os.path.getsize(filename),
+        "gates": circuit.gate_count(),
+        "qubits": circuit.num_qubits,
+        "stages": best,
+        "total": sum(best.values())
+    }
+
+
+def run_benchmarks(scale=1, repeat=5, include_examples=True, only=None):
+    """
+    Run every benchmark case
+    :param scale: Size multiplier of synthetic scripts
+    :param repeat: Runs of each case, the fastest of which is kept
+    :param include_examples: Include the example scripts as baselines
+    :param only: Names of cases to run (default: all)
+    :return: Dictionary of results, ready for JSON
+    """
+    results = []
+    if include_examples:
+        for name, example, input_format, output_format in examples:
+            if only is None or name in only:
+                results.append(run_case(name, os.path.join(EXAMPLES_DIR, example), input_format, output_format,
+                                        repeat))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, source, input_format, output_format in synthetic_cases(scale):
+            if only is not None and name not in only:
+                continue
+            filename = os.path.join(temp_dir, name + ".py")
+            with open(filename, "w") as f:
+                f.write(source)
+            results.append(run_case(name, filename, input_format, output_format, repeat))
+
+    return {
+        "code_version": cache.get_code_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "scale": scale,
+        "repeat": repeat,
+        "results": results
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results against an earlier run
+    :param results: Results of this run
+    :param baseline: Results of earlier run
+    :param threshold: Ratio of times above which a case counts as a regression
+    :return: List of descriptions of regressions
+    """
+    earlier = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        before = earlier.get(result["name"])
+        if before is None or before["lines"] != result["lines"]:
+            continue
+        for stage in STAGES + ["total"]:
+            old = before["total"] if stage == "total" else before["stages"][stage]
+            new = result["total"] if stage == "total" else result["stages"][stage]
+            # Stages this short are mostly timer noise
+            if old > 0.0005 and new / old > threshold:
+                regressions.append(result["name"] + " " + stage + ": " + format_time(old) + " -> " +
+                                   format_time(new) + " (x" + "{:.2f}".format(new / old) + ")")
+    return regressions
+
+
+def format_time(seconds):
+    return "{:.2f}ms".format(seconds * 1000)
+
+
+def print_results(results):
+    print("{:<24}{:>8}{:>8}".format("case", "lines", "gates") +
+          "".join("{:>11}".format(stage) for stage in STAGES + ["total"]))
+    for result in results["results"]:
+        times = [result["stages"][stage] for stage in STAGES] + [result["total"]]
+        print("{:<24}{:>8}{:>8}".format(result["name"], result["lines"], result["gates"]) +
+              "".join("{:>11}".format(format_time(seconds)) for seconds in times))
+
+
+def main(argv=None):
+    """
+    Entry point for the benchmarks
+    :param argv: Command line arguments (default: sys.argv)
+    :return: None
+    """
+    args = process_args(argv)
+    results = run_benchmarks(args.scale, args.repeat, not args.no_examples, args.only)
+    print_results(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to " + args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+def process_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark.benchmark",
+        description="Time each stage of ConvertQC on example and synthetic scripts")
+    parser.add_argument(
+        "-s",
+        "--scale",
+        help="size multiplier of synthetic scripts (default: 1)",
+        type=int,
+        default=1)
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="runs of each script, keeping the fastest (default: 5)",
+        type=int,
+        default=5)
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="JSON file to write results to (default: benchmark_results.json)",
+        default="benchmark_results.json")
+    parser.add_argument(
+        "-c",
+        "--compare",
+        help="earlier results JSON file to check for regressions against")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        help="slowdown ratio counted as a regression (default: 1.2)",
+        type=float,
+        default=1.2)
+    parser.add_argument(
+        "--only",
+        help="only run the named cases",
+        nargs="+")
+    parser.add_argument(
+        "--no-examples",
+        help="skip the example scripts",
+        action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
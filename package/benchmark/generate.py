@@ -0,0 +1,136 @@
+#    Synthetic circuit scripts for benchmarking ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+# Gates cycled through by the generators, as (format string, qubits used)
+projectq_gates = [
+    ("H | {0}", 1),
+    ("X | {0}", 1),
+    ("Rz(0.5) | {0}", 1),
+    ("CNOT | ({0}, {1})", 2),
+    ("Swap | ({0}, {1})", 2),
+    ("Ry(pi / 4) | {0}", 1),
+    ("Toffoli | ({0}, {1}, {2})", 3)
+]
+qutip_gates = [
+    ("{c}.add_gate(\"SNOT\", targets={0})", 1),
+    ("{c}.add_gate(\"RX\", targets={0}, arg_value=pi / 2)", 1),
+    ("{c}.add_gate(\"PHASEGATE\", targets={0}, arg_value=pi / 4)", 1),
+    ("{c}.add_gate(\"CNOT\", controls={0}, targets={1})", 2),
+    ("{c}.add_gate(\"SWAP\", targets=[{0}, {1}])", 2),
+    ("{c}.add_gate(\"CRZ\", controls={0}, targets={1}, arg_value=0.25)", 2),
+    ("{c}.add_gate(\"TOFFOLI\", controls=[{0}, {1}], targets={2})", 3)
+]
+
+
+def gate_line(gates, position, num_qubits, name, **fields):
+    """
+    Pick the gate for a position in a script, spread over the register
+    :param gates: Gate table to cycle through
+    :param position: Position of gate in script
+    :param num_qubits: Size of register
+    :param name: Function giving the name of a qubit from its position
+    :return: Line applying gate
+    """
+    text, arity = gates[position % len(gates)]
+    if arity > num_qubits:
+        text, arity = gates[0]
+    qubits = [name((position * 5 + offset) % num_qubits) for offset in range(arity)]
+    return text.format(*qubits, **fields)
+
+
+def projectq_script(num_qubits=8, num_functions=4, gates_per_block=8, nesting=2):
+    """
+    Generate a ProjectQ script
+    :param num_qubits: Qubits allocated, one statement each
+    :param num_functions: Functions defined, each applying gates to the register
+    :param gates_per_block: Gates at each level of every function
+    :param nesting: Depth of alternating "with Control" and "with Dagger" blocks in every function
+    :return: Script as a string
+    """
+    lines = [
+        "from numpy import pi",
+        "from projectq import MainEngine",
+        "from projectq.meta import Control, Dagger",
+        "from projectq.ops import *",
+        "",
+        "eng = MainEngine()"
+    ]
+    lines.extend("q" + str(i) + " = eng.allocate_qubit()" for i in range(num_qubits))
+
+    position = 0
+    for function in range(num_functions):
+        lines.extend(["", "", "def circuit_" + str(function) + "(eng):"])
+        for depth in range(nesting + 1):
+            indent = "    " * (depth + 1)
+            lines.append(indent + "# Level " + str(depth))
+            for gate in range(gates_per_block):
+                lines.append(indent + gate_line(projectq_gates, position, num_qubits, lambda i: "q" + str(i)))
+                position += 1
+            if depth < nesting:
+                if depth % 2 == 0:
+                    lines.append(indent + "with Control(eng, q" + str(depth % num_qubits) + "):")
+                else:
+                    lines.append(indent + "with Dagger(eng):")
+
+    lines.extend(["", ""])
+    lines.extend("circuit_" + str(function) + "(eng)" for function in range(num_functions))
+    lines.append("eng.flush()")
+    return "\n".join(lines) + "\n"
+
+
+def qutip_script(num_qubits=8, num_functions=4, gates_per_block=8, nesting=2):
+    """
+    Generate a QuTiP script
+    :param num_qubits: Size of circuit
+    :param num_functions: Functions defined, each adding gates to the circuit
+    :param gates_per_block: Gates at each level of every function
+    :param nesting: Depth of nested loops in every function (QuTiP has no Control or Dagger blocks)
+    :return: Script as a string
+    """
+    lines = [
+        "from numpy import pi",
+        "from qutip import *",
+        "",
+        "circuit = QubitCircuit(" + str(num_qubits) + ")"
+    ]
+
+    position = 0
+    for function in range(num_functions):
+        lines.extend(["", "", "def circuit_" + str(function) + "(repeats):"])
+        for depth in range(nesting + 1):
+            indent = "    " * (depth + 1)
+            lines.append(indent + "# Level " + str(depth))
+            for gate in range(gates_per_block):
+                lines.append(indent + gate_line(qutip_gates, position, num_qubits, str, c="circuit"))
+                position += 1
+            if depth < nesting:
+                lines.append(indent + "for repeat_" + str(depth) + " in range(repeats):")
+
+    lines.extend(["", ""])
+    lines.extend("circuit_" + str(function) + "(2)" for function in range(num_functions))
+    return "\n".join(lines) + "\n"
+
+
+def flat_qutip_script(num_qubits=8, num_gates=1000):
+    """
+    Generate a machine-style QuTiP script: one long list of add_gate calls
+    :param num_qubits: Size of circuit
+    :param num_gates: Gates added
+    :return: Script as a string
+    """
+    lines = ["from numpy import pi", "from qutip import *", "", "circuit = QubitCircuit(" + str(num_qubits) + ")"]
+    lines.extend(gate_line(qutip_gates, position, num_qubits, str, c="circuit") for position in range(num_gates))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,202 @@
+#    Startup time benchmark for ConvertQC
+#    Run "python -m benchmark.startup -h" from the package directory for details.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import benchmark
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Runs the command line tool in a new interpreter, then lists the ConvertQC modules it imported
+RUN_COMMAND = """import sys
+from convertqc import convertqc
+sys.argv[0] = "convertqc"
+try:
+    convertqc.main()
+finally:
+    print("MODULES " + " ".join(sorted(name for name in sys.modules if name.startswith("convertqc."))))
+"""
+
+# Command lines timed, as (name, arguments). Interpreter startup alone is timed as "python", so it can be
+# told apart from ConvertQC's own
+cases = [
+    ("help", ["-h"]),
+    ("projectq_qutip", [os.path.join(benchmark.EXAMPLES_DIR, "example_projectq.py"), "projectq", "qutip"]),
+    ("qutip_projectq", [os.path.join(benchmark.EXAMPLES_DIR, "example_qutip.py"), "qutip", "projectq"])
+]
+
+
+def run_command(arguments, directory):
+    """
+    Run the command line tool once, without the cache or error log
+    :param arguments: Command line arguments
+    :param directory: Directory to run in, where output is written
+    :return: Tuple of seconds taken, and names of ConvertQC modules imported
+    """
+    if arguments != ["-h"]:
+        arguments = arguments + ["-e", "--no-cache"]
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(PACKAGE_DIR))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", RUN_COMMAND] + arguments, cwd=directory, env=env,
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+    seconds = time.perf_counter() - start
+    modules = output[output.rindex("MODULES ") + len("MODULES "):].split()
+    return seconds, modules
+
+
+def time_python(repeat):
+    """
+    :param repeat: Runs, the fastest of which is kept
+    :return: Seconds taken to start and stop an interpreter doing nothing
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def run_benchmarks(repeat=10, only=None):
+    """
+    Time every command line, keeping the fastest of several runs
+    :param repeat: Runs of each command line
+    :param only: Names of cases to run (default: all)
+    :return: Dictionary of results, ready for JSON
+    """
+    python = time_python(repeat)
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, arguments in cases:
+            if only is not None and name not in only:
+                continue
+            best = None
+            for _ in range(repeat):
+                seconds, modules = run_command(arguments, temp_dir)
+                best = seconds if best is None else min(best, seconds)
+            results.append({
+                "name": name,
+                "arguments": arguments,
+                "total": best,
+                "convertqc": max(best - python, 0),
+                "modules": modules
+            })
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": repeat,
+        "interpreter": python,
+        "results": results
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results against an earlier run
+    :param results: Results of this run
+    :param baseline: Results of earlier run
+    :param threshold: Ratio of times above which a case counts as a regression
+    :return: List of descriptions of regressions
+    """
+    earlier = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        before = earlier.get(result["name"])
+        if before is None:
+            continue
+        old = before["convertqc"]
+        new = result["convertqc"]
+        # Differences this small are mostly process startup noise
+        if old > 0.005 and new / old > threshold:
+            regressions.append(result["name"] + ": " + benchmark.format_time(old) + " -> " +
+                               benchmark.format_time(new) + " (x" + "{:.2f}".format(new / old) + ")")
+    return regressions
+
+
+def print_results(results):
+    print("Interpreter startup: " + benchmark.format_time(results["interpreter"]))
+    print("{:<24}{:>11}{:>11}{:>9}".format("case", "total", "convertqc", "modules"))
+    for result in results["results"]:
+        print("{:<24}{:>11}{:>11}{:>9}".format(result["name"], benchmark.format_time(result["total"]),
+                                               benchmark.format_time(result["convertqc"]), len(result["modules"])))
+
+
+def main(argv=None):
+    """
+    Entry point for the startup benchmark
+    :param argv: Command line arguments (default: sys.argv)
+    :return: None
+    """
+    args = process_args(argv)
+    results = run_benchmarks(args.repeat, args.only)
+    print_results(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to " + args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+def process_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark.startup",
+        description="Time starting the ConvertQC command line tool, and list the modules each command imports")
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="runs of each command line, keeping the fastest (default: 10)",
+        type=int,
+        default=10)
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="JSON file to write results to (default: startup_results.json)",
+        default="startup_results.json")
+    parser.add_argument(
+        "-c",
+        "--compare",
+        help="earlier results JSON file to check for regressions against")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        help="slowdown ratio counted as a regression (default: 1.2)",
+        type=float,
+        default=1.2)
+    parser.add_argument(
+        "--only",
+        help="only run the named cases",
+        nargs="+")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,10 @@
-from . import convertqc, conversion, error_cqc, process_projectq, process_qutip
\ No newline at end of file
+import importlib
+
+
+def __getattr__(name):
+    # Submodules are imported the first time they are used, so starting the command line tool only imports
+    # the modules a conversion needs
+    try:
+        return importlib.import_module("." + name, __name__)
+    except ModuleNotFoundError:
+        raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
@@ -0,0 +1,134 @@
+#    asyncio interface to ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+# Coroutines for services running an asyncio event loop. Files are read and written on threads, and scripts
+# converted on an executor, so the loop is never blocked. Failures raise the error_cqc.ConversionError
+# subclasses, and nothing here prints or exits.
+# Cancelling a conversion stops it from writing its output, but a script already being converted on a thread
+# runs to the end in the background - its result is thrown away
+
+import asyncio
+import os
+
+from . import binary, conversion, converter, error_cqc, instrument
+
+
+async def convert(source, src="projectq", dst="qutip", script_converter=None, executor=None, input_filename=""):
+    """
+    Convert a whole script held in memory
+    :param source: Input script as a string
+    :param src: Format of input script
+    :param dst: Format to convert to
+    :param script_converter: converter.Converter holding the options to convert with (default: default options)
+    :param executor: concurrent.futures executor to convert on (default: the event loop's thread pool)
+    :param input_filename: Name of file the script was read from, reported with its diagnostics
+    :return: converter.Result of conversion
+    :raises error_cqc.ConversionError: If the script cannot be converted
+    """
+    return await run(script_converter, executor, "convert", source, src, dst, input_filename)
+
+
+async def convert_file(input_filename, output_filename, src="projectq", dst="qutip", script_converter=None,
+                       executor=None):
+    """
+    Convert a script file, writing the converted script to another file. The output file is only written once
+    the whole script has converted, so is left as it was if the conversion fails or is cancelled before then
+    :param input_filename: Name of input file
+    :param output_filename: Name of output file, including extension
+    :param src: Format of input script, or binary.FORMAT
+    :param dst: Format to convert to, or binary.FORMAT
+    :param script_converter: converter.Converter holding the options to convert with (default: default options)
+    :param executor: concurrent.futures executor to convert on (default: the event loop's thread pool)
+    :return: converter.Result of conversion
+    :raises error_cqc.ConversionError: If the script cannot be converted
+    """
+    if script_converter is None:
+        script_converter = converter.Converter()
+    if binary.FORMAT in (src, dst):
+        # Circuit files are memory mapped, so are read as they are converted - only the output waits until then
+        result = await run(script_converter, executor, "read_circuit_file", input_filename, src, dst)
+        await asyncio.to_thread(script_converter.write_result, result, output_filename)
+        return result
+
+    stats = instrument.Stats()
+    try:
+        with stats.time(instrument.READ):
+            source = await asyncio.to_thread(conversion.read_input_source, input_filename)
+    except FileNotFoundError:
+        raise error_cqc.InputFileNotFoundError()
+    result = await run(script_converter, executor, "convert", source, src, dst, input_filename, stats)
+    await asyncio.to_thread(write_output, output_filename, result.code)
+    return result
+
+
+async def convert_many(files, src="projectq", dst="qutip", script_converter=None, executor=None, limit=None,
+                       return_exceptions=False):
+    """
+    Convert several script files at once
+    :param files: Iterable of (input filename, output filename)
+    :param src: Format of input scripts
+    :param dst: Format to convert to
+    :param script_converter: converter.Converter holding the options to convert with (default: default options)
+    :param executor: concurrent.futures executor to convert on (default: the event loop's thread pool)
+    :param limit: Most files converted at once (default: one per CPU)
+    :param return_exceptions: Give the ConversionError of each file which fails in place of its result, rather than
+                              raising the first and cancelling the rest
+    :return: List of converter.Result, in the order of files
+    :raises error_cqc.ConversionError: If a script cannot be converted, and return_exceptions is not set
+    """
+    if script_converter is None:
+        script_converter = converter.Converter()
+    semaphore = asyncio.Semaphore(limit or os.cpu_count() or 1)
+
+    async def convert_one(input_filename, output_filename):
+        async with semaphore:
+            return await convert_file(input_filename, output_filename, src, dst, script_converter, executor)
+
+    tasks = [asyncio.ensure_future(convert_one(input_filename, output_filename))
+             for input_filename, output_filename in files]
+    try:
+        if return_exceptions:
+            # Only conversion errors are given back - anything else is a bug, so is still raised
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException) and not isinstance(result, error_cqc.ConversionError):
+                    raise result
+            return results
+        return await asyncio.gather(*tasks)
+    finally:
+        # A failure, or this being cancelled, cancels the files still waiting
+        for task in tasks:
+            task.cancel()
+
+
+async def run(script_converter, executor, method, *args):
+    """
+    Call a method of a converter on an executor
+    :param script_converter: converter.Converter to call (default: one with default options)
+    :param executor: concurrent.futures executor to call it on, or None for the event loop's thread pool
+    :param method: Name of method
+    :param args: Arguments of method
+    :return: Value returned by method
+    """
+    if script_converter is None:
+        script_converter = converter.Converter()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, getattr(script_converter, method), *args)
+
+
+def write_output(output_filename, code):
+    with conversion.OutputSink(output_filename) as output:
+        output.write(code)
@@ -0,0 +1,335 @@
+#    Batch conversion of whole directories for ConvertQC
+#    Run "convertqc convert-dir -h" for details.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import argparse
+import collections
+import contextlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import cache, converter, diagnostics, error_cqc, instrument, plugins
+
+
+# Result cache of a worker process, made when it converts its first file
+worker_cache = None
+
+
+class FileResult:
+    """
+    Outcome of converting one file in a batch. Sent back from worker processes, so kept picklable
+    """
+    def __init__(self, relative_path, error_code=0, message="", error_lines=None, records=None, counts=None,
+                 stats=None):
+        """
+        :param relative_path: Path of input file, relative to the source directory
+        :param error_code: Code of the error which stopped conversion, or 0 if converted
+        :param message: Message of that error
+        :param error_lines: Lines which could not be translated
+        :param records: Diagnostics of the conversion, as dictionaries - dropped once written out
+        :param counts: Number of diagnostics of each category
+        :param stats: Counters and stage times of the conversion, from instrument.Stats.to_dict
+        """
+        self.relative_path = relative_path
+        self.error_code = error_code
+        self.message = message
+        self.error_lines = error_lines or []
+        self.records = records or []
+        self.counts = counts or {}
+        self.stats = stats
+
+    @property
+    def failed(self):
+        return self.error_code != 0
+
+
+def main(argv):
+    """
+    Entry point for "convertqc convert-dir"
+    :param argv: Arguments after the subcommand
+    :return: None
+    """
+    args = process_args(argv)
+    if args.input_format == args.output_format:
+        error_cqc.process_error(error_cqc.MATCHING_INPUT_OUTPUT, True)
+    if not os.path.isdir(args.source_dir):
+        error_cqc.process_error(error_cqc.INPUT_DIRECTORY_NOT_FOUND, True)
+
+    diagnostic_writer = diagnostics.open_writer(args.diagnostics) if args.diagnostics else None
+    try:
+        results = convert_directory(args.source_dir, args.output_dir, args.input_format, args.output_format,
+                                    args.jobs, args.mark, args.pep8, args.verbose, not args.no_cache,
+                                    diagnostic_writer, args.severity)
+    finally:
+        if diagnostic_writer is not None:
+            diagnostic_writer.close()
+
+    print_summary(results)
+    if args.stats:
+        print(total_stats(results).format(args.stats))
+    if args.error_log:
+        write_error_log(results)
+    if any(result.failed for result in results):
+        exit(1)
+
+
+def convert_directory(source_dir, output_dir, input_format, output_format, jobs=None, mark=True, pep8=False,
+                      verbose=False, use_cache=False, diagnostic_writer=None, severity=diagnostics.INFO):
+    """
+    Convert every script under a directory with the input format's extension, mirroring the tree into the output
+    directory with the output format's extension. An output directory inside the source directory is not searched.
+    Files are shared between a pool of worker processes, and a failed file does not stop the others
+    :param source_dir: Directory of input scripts
+    :param output_dir: Directory to write converted scripts to
+    :param input_format: Format of input scripts
+    :param output_format: Format to convert to
+    :param jobs: Number of worker processes (default: one per CPU). 1 converts in this process
+    :param mark: Add comments identifying untranslated lines
+    :param pep8: Format output with autopep8
+    :param verbose: Print each file as it finishes
+    :param use_cache: Reuse and store results in the cache shared by every worker
+    :param diagnostic_writer: diagnostics.DiagnosticWriter to write the diagnostics of each file to as it finishes
+    :param severity: Least severe diagnostic to report
+    :return: List of FileResult, in path order
+    """
+    tasks = [(source_dir, output_dir, relative_path, input_format, output_format, mark, pep8, use_cache, severity)
+             for relative_path in find_scripts(source_dir, plugins.get_format(input_format).extension,
+                                               os.path.abspath(output_dir))]
+    jobs = jobs or os.cpu_count() or 1
+
+    if jobs == 1 or len(tasks) <= 1:
+        results = map(convert_file, tasks)
+        return report_progress(results, verbose, diagnostic_writer)
+
+    # Several files per task keeps inter-process overhead low for large batches
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return report_progress(executor.map(convert_file, tasks, chunksize=chunksize), verbose, diagnostic_writer)
+
+
+def report_progress(results, verbose, diagnostic_writer=None):
+    collected = []
+    for result in results:
+        if verbose:
+            print(("FAILED " if result.failed else "Converted ") + result.relative_path)
+        if diagnostic_writer is not None:
+            for record in result.records:
+                diagnostic_writer.write(diagnostics.Diagnostic.from_dict(record, result.relative_path))
+        # Only the counts are kept for the summary, so a large batch does not hold every diagnostic
+        result.records = []
+        collected.append(result)
+    return collected
+
+
+def find_scripts(source_dir, extension=".py", excluded=None):
+    """
+    Find every script below a directory
+    :param source_dir: Directory to search
+    :param extension: Extension of scripts, as the input format's plugins.Format gives it
+    :param excluded: Absolute path of a directory not to search, e.g. the output directory (default: none)
+    :return: Sorted list of paths relative to source_dir
+    """
+    scripts = []
+    for root, dirs, files in os.walk(source_dir):
+        if excluded is not None and is_excluded(root, "", excluded):
+            dirs.clear()
+            continue
+        dirs.sort()
+        for name in files:
+            if name.endswith(extension):
+                scripts.append(os.path.relpath(os.path.join(root, name), source_dir))
+    return sorted(scripts)
+
+
+def is_excluded(source_dir, relative_path, excluded):
+    """
+    :param source_dir: Directory searched
+    :param relative_path: Path of script, relative to source_dir
+    :param excluded: Absolute path of directory not searched
+    :return: True if the script is inside the excluded directory
+    """
+    path = os.path.abspath(os.path.join(source_dir, relative_path))
+    return path == excluded or path.startswith(excluded + os.sep)
+
+
+def output_name(relative_path, output_format):
+    """
+    :param relative_path: Path of input script, relative to the source directory
+    :param output_format: Format converted to
+    :return: Path of converted script, relative to the output directory, with the output format's extension
+    """
+    return os.path.splitext(relative_path)[0] + plugins.get_format(output_format).extension
+
+
+def get_worker_cache():
+    """
+    :return: ResultCache of this process, shared by every file it converts so the cache keeps its running size
+    """
+    global worker_cache
+    if worker_cache is None:
+        worker_cache = cache.ResultCache()
+    return worker_cache
+
+
+def convert_file(task):
+    """
+    Convert one file of a batch. Runs in a worker process
+    :param task: Tuple of source directory, output directory, relative path, input format, output format,
+                 mark, pep8, use_cache and severity options
+    :return: FileResult
+    """
+    source_dir, output_dir, relative_path, input_format, output_format, mark, pep8, use_cache, severity = task
+    # Fatal errors only end this file - including not being able to make its output directory
+    try:
+        output_path = os.path.join(output_dir, output_name(relative_path, output_format))
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            script_converter = converter.Converter(mark, pep8, result_cache=get_worker_cache() if use_cache else None,
+                                                   severity=severity)
+            result = script_converter.convert_file(os.path.join(source_dir, relative_path), output_path,
+                                                   input_format, output_format)
+    except error_cqc.ConversionError as e:
+        return FileResult(relative_path, e.code, str(e))
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else error_cqc.UNEXPECTED_CONVERSION_ERROR
+        return FileResult(relative_path, code, error_cqc.error_messages.get(code, str(e.code)))
+    except Exception as e:
+        return FileResult(relative_path, error_cqc.UNEXPECTED_CONVERSION_ERROR, type(e).__name__ + ": " + str(e))
+    return FileResult(relative_path, error_lines=result.error_lines,
+                      records=[diagnostic.to_dict() for diagnostic in result.diagnostics], counts=dict(result.counts),
+                      stats=result.stats.to_dict())
+
+
+def print_summary(results):
+    """
+    Print one summary for the whole batch
+    :param results: List of FileResult
+    :return: None
+    """
+    failed = [result for result in results if result.failed]
+    untranslated = sum(len(result.error_lines) for result in results)
+    print("Converted " + str(len(results) - len(failed)) + " of " + str(len(results)) + " files")
+    print("    Failed files: " + str(len(failed)))
+    print("    Untranslated lines: " + str(untranslated))
+    counts = collections.Counter()
+    for result in results:
+        counts.update(result.counts)
+    if counts:
+        print("    Diagnostics: " + diagnostics.format_counts(counts))
+    for result in failed:
+        print("    " + result.relative_path + " - " + result.message)
+
+
+def total_stats(results):
+    """
+    :param results: List of FileResult
+    :return: instrument.Stats of every file converted - stage times are summed over every worker
+    """
+    total = instrument.Stats()
+    for result in results:
+        if result.stats is not None:
+            total.merge(result.stats)
+    return total
+
+
+def write_error_log(results, filename="error_log.txt"):
+    """
+    Merge the error logs of every file into one, each line prefixed by its file
+    :param results: List of FileResult
+    :param filename: Name of error log to write
+    :return: None
+    """
+    error_file = open(filename, "w+")
+    for result in results:
+        if result.failed:
+            print(result.relative_path + ": FAILED - " + result.message, file=error_file)
+        for line in result.error_lines:
+            print(result.relative_path + ": " + line, file=error_file)
+    error_file.close()
+
+
+def process_args(argv):
+    """
+    Creates the ArgumentParser for the convert-dir subcommand
+    :param argv: Arguments after the subcommand
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="convertqc convert-dir",
+        description="Convert every script in a directory tree")
+
+    parser.add_argument("source_dir", help="directory of input scripts")
+    parser.add_argument("output_dir", help="directory to write converted scripts to")
+    parser.add_argument(
+        "--from",
+        dest="input_format",
+        help="input format of your scripts",
+        choices=list(converter.readers),
+        required=True)
+    parser.add_argument(
+        "--to",
+        dest="output_format",
+        help="output format of your scripts",
+        choices=list(converter.writers),
+        required=True)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="number of worker processes (default: one per CPU)",
+        type=int)
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="print each file as it is converted",
+        action="store_true")
+    parser.add_argument(
+        "-m",
+        "--mark",
+        help="disable comments in code to identify untranslated lines",
+        action="store_false")
+    parser.add_argument(
+        "-e",
+        "--error_log",
+        help="disable outputting merged error log to file",
+        action="store_false")
+    parser.add_argument(
+        "-p",
+        "--pep8",
+        help="format output with autopep8 (must be installed)",
+        action="store_true")
+    parser.add_argument(
+        "--no-cache",
+        help="do not reuse or store conversion results in the cache",
+        action="store_true")
+    parser.add_argument(
+        "--stats",
+        nargs="?",
+        const="table",
+        help="print the total time spent in each stage of conversion over every file, and counts of lines, parses "
+             "and gates, as a table (default) or JSON",
+        choices=instrument.OUTPUT_FORMATS)
+    parser.add_argument(
+        "--diagnostics",
+        metavar="FILE",
+        help="write every untranslated construct in every file to FILE as JSON Lines, as each file finishes")
+    parser.add_argument(
+        "--severity",
+        help="least severe diagnostic to report (default: info)",
+        choices=diagnostics.SEVERITIES,
+        default=diagnostics.INFO)
+
+    return parser.parse_args(argv)
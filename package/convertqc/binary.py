@@ -0,0 +1,285 @@
+#    Binary circuit files for ConvertQC - save a converted circuit once, write it out in any format later
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import contextlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from . import circuit
+
+# Format name used on the command line, and file extension
+FORMAT = "cqc"
+EXTENSION = ".cqc"
+
+MAGIC = b"CQC\0"
+VERSION = 2
+# Magic, version, byte order, qubit count, entries, operands, then the number of strings in each string table:
+# opcode names, pool, qubit names, diagnostics (as JSON). The input format name is stored as a string table of its own
+HEADER = struct.Struct("<4sHcxIIIIIIII")
+
+# Columns of a circuit, in the order they are stored, with the array type of each
+COLUMNS = [
+    ("ops", "B"),
+    ("depths", "B"),
+    ("controls", "B"),
+    ("arities", "B"),
+    ("qubit_starts", "I"),
+    ("params", "i"),
+    ("lines", "I")
+]
+BYTE_ORDER = b"L" if sys.byteorder == "little" else b"B"
+
+
+def save_circuit(circuit_in, filename, input_format="", records=()):
+    """
+    Write a circuit to a binary circuit file. Each column of the circuit is stored as a fixed-width array,
+    followed by the string pool, so the file can be loaded without reading any of it.
+    The file is written beside its final name and only replaces it once complete
+    :param circuit_in: Circuit to save
+    :param filename: Name of file to write
+    :param input_format: Format the circuit was read from
+    :param records: Diagnostics found while reading the circuit, from ErrorLog.to_list
+    :return: None
+    """
+    names = [circuit.opcode_names.get(op, "") for op in range(max(circuit.opcode_names) + 1)]
+    tables = [names, circuit_in.pool, circuit_in.qubit_names, [json.dumps(record) for record in records],
+              [input_format]]
+    partial_filename = filename + ".part"
+    try:
+        with open(partial_filename, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER, circuit_in.num_qubits, len(circuit_in),
+                                len(circuit_in.qubit_args), *(len(table) for table in tables[:4]), 1))
+            for name, typecode in COLUMNS:
+                write_aligned(f, getattr(circuit_in, name))
+            write_aligned(f, circuit_in.qubit_args)
+            for table in tables:
+                write_strings(f, table)
+    except BaseException:
+        # The partial file may never have been created - the original error is the one to report
+        with contextlib.suppress(OSError):
+            os.remove(partial_filename)
+        raise
+    os.replace(partial_filename, filename)
+
+
+def write_aligned(f, data):
+    """
+    Write an array or bytes, padded so the next section starts on a 4 byte boundary
+    """
+    data = bytes(data)
+    f.write(data)
+    f.write(b"\0" * (-len(data) % 4))
+
+
+def write_strings(f, strings):
+    """
+    Write a string table: the end offset of each string, then every string as UTF-8
+    """
+    encoded = [string.encode("utf-8", "surrogateescape") for string in strings]
+    offsets = array("I")
+    end = 0
+    for data in encoded:
+        end += len(data)
+        offsets.append(end)
+    write_aligned(f, offsets)
+    write_aligned(f, b"".join(encoded))
+
+
+def load_circuit(filename):
+    """
+    Load a binary circuit file. The file is memory mapped and each column of the circuit is a view of it,
+    so nothing is copied and strings are only decoded when used - columns are only checked to stay in bounds.
+    A loaded circuit can be written out (and optimized, which copies it) but not added to, and keeps the file
+    mapped until it is closed:
+        circuit_in, input_format, records = load_circuit(filename)
+        with circuit_in:
+            ...
+    :param filename: Name of file to load
+    :return: Tuple of MappedCircuit, format it was read from, and diagnostics found while reading it, as dictionaries
+    :raises FileNotFoundError: If the file does not exist
+    :raises ValueError: If the file is not a binary circuit file this version can read, or is corrupt
+    """
+    with open(filename, "rb") as f:
+        try:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            raise ValueError("Not a ConvertQC circuit file")
+    reader = SectionReader(memoryview(mapping), HEADER.size)
+    result = MappedCircuit(mapping, reader.views)
+    try:
+        return read_sections(result, reader)
+    except (IndexError, struct.error) as e:
+        result.close()
+        raise ValueError("Circuit file is corrupt") from e
+    except BaseException:
+        result.close()
+        raise
+
+
+def read_sections(result, reader):
+    """
+    Fill in a loaded circuit from the sections of its file
+    :param result: MappedCircuit to fill in
+    :param reader: SectionReader of the file, before its first section
+    :return: Tuple of circuit, format it was read from, and diagnostics found while reading it
+    """
+    data = reader.data
+    if len(data) < HEADER.size:
+        raise ValueError("Not a ConvertQC circuit file")
+    header = HEADER.unpack_from(data)
+    magic, version, byte_order, num_qubits, entries, operands = header[:6]
+    table_sizes = header[6:]
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a ConvertQC circuit file, or made by a newer version")
+    reader.swap = byte_order != BYTE_ORDER
+    result.num_qubits = num_qubits
+    for name, typecode in COLUMNS:
+        setattr(result, name, reader.column(typecode, entries))
+    result.qubit_args = reader.column("i", operands)
+    names, result.pool, result.qubit_names, records, input_format = \
+        [reader.strings(size) for size in table_sizes]
+
+    # Every index into another column or the string pool is checked once here, so writing the circuit out
+    # cannot fail part way through
+    pool_size = len(result.pool)
+    if not (in_bounds(result.ops, 0, len(names) - 1) and in_bounds(result.params, circuit.NO_PARAM, pool_size - 1)
+            and in_bounds(result.qubit_args, -pool_size, None) and len(input_format) == 1):
+        raise ValueError("Circuit file is corrupt")
+
+    # Opcodes are renumbered if they have changed since the file was written
+    if list(names) != [circuit.opcode_names.get(op, "") for op in range(len(names))]:
+        opcodes = dict((name, op) for op, name in circuit.opcode_names.items())
+        try:
+            renumber = [opcodes[name] if name else 0 for name in names]
+        except KeyError:
+            raise ValueError("Circuit file uses gates this version does not have")
+        result.ops = array("B", (renumber[op] for op in result.ops))
+    return result, input_format[0], [json.loads(record) for record in records]
+
+
+def in_bounds(column, lowest, highest):
+    """
+    :param column: Column of a loaded circuit
+    :param lowest: Least value allowed
+    :param highest: Greatest value allowed, or None if no limit
+    :return: True if every value in the column is within the limits
+    """
+    if not len(column):
+        return True
+    return min(column) >= lowest and (highest is None or max(column) <= highest)
+
+
+class MappedCircuit(circuit.Circuit):
+    """
+    A circuit loaded from a binary circuit file, whose columns are views of the memory mapped file.
+    Closing it releases the views and unmaps the file, after which it can no longer be used
+    """
+    def __init__(self, mapping, views):
+        """
+        :param mapping: mmap of the file
+        :param views: List of every view of the mapping, filled in as the file is read
+        """
+        super().__init__()
+        self.mapping = mapping
+        self.views = views
+
+    def close(self):
+        for view in self.views:
+            view.release()
+        self.views.clear()
+        self.mapping.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SectionReader:
+    """
+    Reads the sections of a binary circuit file in order, each as a view of the file
+    """
+    def __init__(self, data, offset, swap=False):
+        """
+        :param data: memoryview of whole file
+        :param offset: Position of first section
+        :param swap: File was written with the other byte order, so columns are copied and swapped
+        """
+        self.data = data
+        self.offset = offset
+        self.swap = swap
+        # Every view taken of the file, so they can all be released before it is unmapped
+        self.views = [data]
+
+    def take(self, size):
+        if self.offset + size > len(self.data):
+            raise ValueError("Circuit file is truncated")
+        section = self.data[self.offset:self.offset + size]
+        self.views.append(section)
+        self.offset += size + (-size % 4)
+        return section
+
+    def column(self, typecode, length):
+        """
+        :return: Array-like view of the next column
+        """
+        size = array(typecode).itemsize
+        section = self.take(length * size)
+        if not self.swap:
+            column = section.cast(typecode)
+            self.views.append(column)
+            return column
+        column = array(typecode, section.tobytes())
+        column.byteswap()
+        return column
+
+    def strings(self, count):
+        offsets = self.column("I", count)
+        # Offsets only ever increase, so none can be past the end of the table
+        if count and max(offsets) != offsets[-1]:
+            raise ValueError("Circuit file is corrupt")
+        return StringTable(self.take(offsets[-1] if count else 0), offsets)
+
+
+class StringTable:
+    """
+    Strings stored in a binary circuit file, decoded when looked up
+    """
+    def __init__(self, data, offsets):
+        """
+        :param data: View of every string as UTF-8
+        :param offsets: End offset of each string
+        """
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.offsets)
+        start = self.offsets[index - 1] if index > 0 else 0
+        return bytes(self.data[start:self.offsets[index]]).decode("utf-8", "surrogateescape")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self.offsets)))
@@ -0,0 +1,221 @@
+#    On-disk cache of conversion results for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# Cache size before least recently used results are removed
+MAX_BYTES = 64 * 1024 * 1024
+# Share of the largest size kept once a cache grows past it, so a full cache is not scanned on every store
+EVICT_TO = 0.75
+
+# Fingerprint of this package's source, worked out on first use
+code_version = None
+
+
+def default_directory():
+    """
+    Directory used when none is given: $CONVERTQC_CACHE_DIR, or convertqc in the user's cache directory
+    :return: Path of cache directory
+    """
+    directory = os.environ.get("CONVERTQC_CACHE_DIR")
+    if directory:
+        return directory
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "convertqc")
+
+
+def get_code_version():
+    """
+    Fingerprint the source of ConvertQC itself, so results are never reused after the converter changes
+    :return: Hex digest of every module in the package
+    """
+    global code_version
+    if code_version is None:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(package_dir)):
+            if name.endswith(".py"):
+                digest.update(name.encode())
+                with open(os.path.join(package_dir, name), "rb") as f:
+                    digest.update(f.read())
+        code_version = digest.hexdigest()
+    return code_version
+
+
+class ResultCache:
+    """
+    Converted scripts and their diagnostics stored on disk, one file per result, keyed by a hash of
+    everything that affects the output. Reading a result marks it as recently used; once the
+    cache is larger than max_bytes the least recently used results are removed.
+    Results are written atomically, so several processes can share one cache directory.
+    The directory is only scanned on the first store and when the cache is full - in between, its size is kept
+    as a running total of the results this cache stores, so results stored by other processes are only counted
+    at the next scan. One cache can be shared by threads - the running total and removing results are locked
+    """
+    def __init__(self, directory=None, max_bytes=MAX_BYTES):
+        """
+        :param directory: Directory to store results in (default: default_directory())
+        :param max_bytes: Largest total size of stored results
+        """
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        # Total size of stored results, or None until the directory is scanned
+        self.size = None
+        self.lock = threading.Lock()
+
+    def key(self, source, input_format, output_format, options):
+        """
+        :param source: Input script as a string, or as bytes (e.g. a memory mapped file)
+        :param input_format: Format of input script
+        :param output_format: Format to convert to
+        :param options: Tuple of every option which changes the output
+        :return: Cache key
+        """
+        digest = hashlib.sha256()
+        header = [get_code_version(), input_format, output_format, repr(options)]
+        digest.update("\n".join(header).encode())
+        digest.update(b"\n")
+        if isinstance(source, str):
+            source = source.encode("utf-8", "surrogateescape")
+        digest.update(source)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up a stored result
+        :param key: Cache key
+        :return: Tuple of converted script and diagnostics, or None if not stored
+        """
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["code"], entry["diagnostics"]
+
+    def put(self, key, code, records):
+        """
+        Store a result, then remove old results if the cache has grown too large.
+        A cache which cannot be written to, or a result which cannot be stored, is skipped - conversion carries
+        on without it
+        :param key: Cache key
+        :param code: Converted script
+        :param records: Diagnostics of the conversion, from ErrorLog.to_list
+        :return: None
+        """
+        path = self.path(key)
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(handle, "w") as f:
+                json.dump({"code": code, "diagnostics": records}, f)
+            with self.lock:
+                added = os.path.getsize(temp_path) - stored_size(path)
+                os.replace(temp_path, path)
+                temp_path = None
+                if self.size is None:
+                    self.scan()
+                else:
+                    self.size += added
+                if self.size > self.max_bytes:
+                    self.remove_oldest(int(self.max_bytes * EVICT_TO))
+        except (OSError, TypeError, ValueError):
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def scan(self):
+        """
+        Find every stored result, and update the running total of their size. The caller holds the lock
+        :return: Tuple of list of (modification time, size, path) of each result, and their total size
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        self.size = total
+        return entries, total
+
+    def evict(self, max_bytes=None):
+        """
+        Remove least recently used results until the cache fits
+        :param max_bytes: Size to fit in (default: max_bytes of the cache)
+        :return: None
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        with self.lock:
+            self.remove_oldest(max_bytes)
+
+    def remove_oldest(self, max_bytes):
+        """
+        Evict with the lock held
+        :param max_bytes: Size to fit in
+        :return: None
+        """
+        entries, total = self.scan()
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        self.size = total
+
+    def clear(self):
+        """
+        Remove every stored result
+        :return: None
+        """
+        if os.path.isdir(self.directory):
+            self.evict(0)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+
+def stored_size(path):
+    """
+    :param path: Path of a stored result
+    :return: Size of the result, or 0 if there is none
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -0,0 +1,257 @@
+#    Framework-neutral circuit representation for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+from array import array
+
+# OPCODES
+# Script entries - keep the Python code around the gates, text held in the pool
+BLANK = 0
+COMMENT = 1
+STATEMENT = 2
+BLOCK = 3
+UNTRANSLATED = 4
+UNTRANSLATED_BLOCK = 5
+
+# Gates - controlled versions use the same opcode with a control count (CNOT is X with one control)
+FIRST_GATE = 16
+H = 16
+X = 17
+Y = 18
+Z = 19
+S = 20
+SDAG = 21
+T = 22
+TDAG = 23
+SQRTX = 24
+RX = 25
+RY = 26
+RZ = 27
+PHASE = 28
+SWAP = 29
+SQRTSWAP = 30
+ISWAP = 31
+MEASURE = 32
+BARRIER = 33
+# Operations which are not unitary, so have no controlled version
+NON_UNITARY = {MEASURE, BARRIER}
+
+opcode_names = {
+    BLANK: "BLANK",
+    COMMENT: "COMMENT",
+    STATEMENT: "STATEMENT",
+    BLOCK: "BLOCK",
+    UNTRANSLATED: "UNTRANSLATED",
+    UNTRANSLATED_BLOCK: "UNTRANSLATED_BLOCK",
+    H: "H",
+    X: "X",
+    Y: "Y",
+    Z: "Z",
+    S: "S",
+    SDAG: "SDAG",
+    T: "T",
+    TDAG: "TDAG",
+    SQRTX: "SQRTX",
+    RX: "RX",
+    RY: "RY",
+    RZ: "RZ",
+    PHASE: "PHASE",
+    SWAP: "SWAP",
+    SQRTSWAP: "SQRTSWAP",
+    ISWAP: "ISWAP",
+    MEASURE: "MEASURE",
+    BARRIER: "BARRIER"
+}
+
+NO_PARAM = -1
+
+# How a gate in a frontend's gate table treats an angle given in the script
+ANGLE = 0  # Only read with an angle, which becomes the gate parameter
+NO_ANGLE = 1  # Only read without an angle
+ANY_ANGLE = 2  # Read with or without an angle, which is dropped
+
+
+def is_gate(op):
+    """
+    Check whether an opcode is a gate rather than a script entry
+    :param op: Opcode to check
+    :return: True if gate
+    """
+    return op >= FIRST_GATE
+
+
+def compile_gate_table(gates):
+    """
+    Compile a frontend's table of gates into a dictionary, so reading a gate is a single lookup
+    :param gates: List of (key, gate, angle handling) - key identifying the gate in a script (e.g. name and
+                  qubit count), gate being what it is read as (e.g. opcode), and angle handling ANGLE, NO_ANGLE
+                  or ANY_ANGLE
+    :return: Dictionary from key plus whether an angle was given, to tuple of gate and whether the angle is kept
+    """
+    table = {}
+    for key, gate, handling in gates:
+        if handling != NO_ANGLE:
+            table[key + (True,)] = (gate, handling == ANGLE)
+        if handling != ANGLE:
+            table[key + (False,)] = (gate, False)
+    return table
+
+
+class Circuit:
+    """
+    A converted script, stored as parallel typed arrays with one position per entry.
+    Entries are either gates or the surrounding script (comments, statements, block headers),
+    so any frontend can be written out by any emitter.
+
+    Qubit operands are held in one flat array. Positive operands are positions in the circuit's
+    register; negative operands are symbolic (e.g. a function parameter), where -1 - operand is
+    the position of its expression in the string pool. Angles and script text share the same pool.
+    """
+    def __init__(self, num_qubits=0):
+        self.num_qubits = num_qubits
+        # Names given to register positions by the input script, if any
+        self.qubit_names = []
+
+        self.ops = array('B')
+        self.depths = array('B')
+        self.controls = array('B')
+        self.arities = array('B')
+        self.qubit_starts = array('I')
+        self.params = array('i')
+        self.lines = array('I')
+        self.qubit_args = array('i')
+
+        self.pool = []
+        self.pool_index = {}
+
+    def __len__(self):
+        return len(self.ops)
+
+    def intern(self, text):
+        """
+        Add a string to the pool, reusing any identical entry
+        :param text: String to add
+        :return: Position of string in pool
+        """
+        index = self.pool_index.get(text)
+        if index is None:
+            index = len(self.pool)
+            self.pool.append(text)
+            self.pool_index[text] = index
+        return index
+
+    def add_text(self, op, text, depth=0, line=0):
+        """
+        Add a script entry (comment, statement, block header...)
+        :param op: Script opcode
+        :param text: Source text of the entry
+        :param depth: Block depth of the entry
+        :param line: Line number in the input script
+        :return: Position of new entry
+        """
+        return self.append(op, (), 0, None if text is None else self.intern(text), depth, line)
+
+    def add_gate(self, op, targets, controls=(), param=None, depth=0, line=0):
+        """
+        Add a gate
+        :param op: Gate opcode
+        :param targets: Target qubits - positions as int, or symbolic expressions as str
+        :param controls: Control qubits, as targets
+        :param param: Gate parameter (angle) expression, if any
+        :param depth: Block depth of the gate
+        :param line: Line number in the input script
+        :return: Position of new entry
+        """
+        operands = [self.operand(qubit) for qubit in controls]
+        operands.extend(self.operand(qubit) for qubit in targets)
+        return self.append(op, operands, len(controls), None if param is None else self.intern(str(param)),
+                           depth, line)
+
+    def append(self, op, operands, control_count, param, depth, line):
+        self.ops.append(op)
+        self.depths.append(depth)
+        self.controls.append(control_count)
+        self.arities.append(len(operands))
+        self.qubit_starts.append(len(self.qubit_args))
+        self.params.append(NO_PARAM if param is None else param)
+        self.lines.append(line)
+        self.qubit_args.extend(operands)
+        return len(self.ops) - 1
+
+    def truncate(self, length):
+        """
+        Remove every entry from a position on
+        :param length: Number of entries to keep
+        :return: None
+        """
+        if length >= len(self.ops):
+            return
+        del self.qubit_args[self.qubit_starts[length]:]
+        for column in (self.ops, self.depths, self.controls, self.arities, self.qubit_starts, self.params,
+                       self.lines):
+            del column[length:]
+
+    def operand(self, qubit):
+        """
+        Encode a qubit for the operand array
+        :param qubit: Position as int, or symbolic expression as str
+        :return: Encoded operand
+        """
+        if isinstance(qubit, int):
+            if qubit >= self.num_qubits:
+                self.num_qubits = qubit + 1
+            return qubit
+        return -1 - self.intern(qubit)
+
+    def text(self, index):
+        """
+        Get the text of a script entry, or the parameter of a gate
+        :param index: Position of entry
+        :return: String, or None if entry has none
+        """
+        param = self.params[index]
+        if param == NO_PARAM:
+            return None
+        return self.pool[param]
+
+    param = text
+
+    def qubits(self, index):
+        """
+        Get the control and target qubits of a gate
+        :param index: Position of gate
+        :return: Tuple of control qubits and tuple of target qubits - int positions or str expressions
+        """
+        start = self.qubit_starts[index]
+        split = start + self.controls[index]
+        end = start + self.arities[index]
+        args = self.qubit_args
+        pool = self.pool
+        controls = tuple(q if q >= 0 else pool[-1 - q] for q in args[start:split])
+        targets = tuple(q if q >= 0 else pool[-1 - q] for q in args[split:end])
+        return controls, targets
+
+    def qubit_name(self, qubit):
+        """
+        Get the name the input script used for a register position
+        :param qubit: Register position
+        :return: Name, or None if the input script did not name it
+        """
+        if 0 <= qubit < len(self.qubit_names):
+            return self.qubit_names[qubit]
+        return None
+
+    def gate_count(self):
+        return sum(1 for op in self.ops if op >= FIRST_GATE)
@@ -14,8 +14,26 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>
 
+import ast
+import contextlib
+import copy
+import io
+import mmap
+import os
 import re
-error_lines = []
+import threading
+from . import circuit, diagnostics, error_cqc
+
+# ast.TryStar only exists from Python 3.11
+TRY_NODES = (ast.Try, getattr(ast, "TryStar", ast.Try))
+MARK_COMMENT = "# *!* ERROR - COULD NOT TRANSFER LINE BELOW COMMENT. PLEASE CHECK MANUALLY: *!*"
+# Gates which are their own inverse, and pairs of gates inverse to each other
+SELF_INVERSE = {circuit.H, circuit.X, circuit.Y, circuit.Z, circuit.SWAP, circuit.BARRIER}
+INVERSES = {circuit.S: circuit.SDAG, circuit.SDAG: circuit.S, circuit.T: circuit.TDAG, circuit.TDAG: circuit.T}
+# Characters of output collected before an OutputSink writes them out
+BUFFER_SIZE = 1024 * 1024
+# Python 3.11 can fail building syntax trees in two threads at once, so whole scripts are parsed one at a time
+PARSE_LOCK = threading.Lock()
 
 
 # Source - https://stackoverflow.com/questions/3277503/how-to-read-a-file-line-by-line-into-a-list
@@ -29,6 +47,56 @@ def read_input_file(filename):
         return f.readlines()
 
 
+def read_input_source(filename):
+    """
+    Reads the specified input filename as a single string, ready for ast.parse
+    :param filename: Name of file to open
+    :return: Contents of input file
+    """
+    with open(filename) as f:
+        return f.read()
+
+
+@contextlib.contextmanager
+def map_input_source(filename):
+    """
+    Map the specified input filename into memory, so it can be read without first being copied into a string.
+    Use as "with map_input_source(filename) as buffer:" - the buffer can only be used inside the with block
+    :param filename: Name of file to open
+    :return: Context manager giving the contents of input file as a bytes-like buffer
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            yield b""
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield buffer
+
+
+def decode_source(buffer):
+    """
+    Decode a script mapped by map_input_source, with line endings translated as read_input_source does.
+    Scripts are read as UTF-8, the encoding of Python source
+    :param buffer: Contents of input file, or part of it, as a bytes-like buffer
+    :return: Contents as a string
+    """
+    return str(buffer, "utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def parse_source(source):
+    """
+    Parse a whole input script into a syntax tree in one go
+    :param source: Contents of input file
+    :return: ast.Module of the input script
+    """
+    try:
+        with PARSE_LOCK:
+            return ast.parse(source)
+    except SyntaxError:
+        raise error_cqc.InputSyntaxError()
+
+
 def open_output_file(filename):
     """
     Opens the output file to write converted lines to
@@ -47,114 +115,175 @@ def close_output_file(file):
     return file.close()
 
 
-def add_new_error_line(line_no, untranslated_line):
+class OutputSink:
     """
-
-    :param line_no: Line number in input file which failed to translate
-    :param untranslated_line: Untranslated line
-    :return: None
+    Collects output in memory and writes it out in large blocks.
+    Output to a file goes to a partial file beside it, which only replaces the file once the sink is closed,
+    so a failed conversion never leaves a half written script. Without a filename, output is kept in memory
     """
-    line = str(line_no) + " - " + chomp(str(untranslated_line).strip())
-    error_lines.append(line)
+    def __init__(self, filename=None, buffer_size=BUFFER_SIZE):
+        """
+        :param filename: Name of file to write to (default: keep output in memory)
+        :param buffer_size: Characters collected before they are written out
+        """
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.fragments = []
+        self.size = 0
+        self.closed = False
+        if filename is None:
+            self.partial_filename = None
+            self.file = io.StringIO()
+        else:
+            self.partial_filename = filename + ".part"
+            self.file = open(self.partial_filename, "w")
 
+    def write(self, text):
+        """
+        :param text: Text to add to output
+        :return: None
+        """
+        self.fragments.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
 
-def get_error_lines():
-    """
-    Returns the dictionary of files unable to be translated
-    :return: Dictionary of line numbers and untranslated lines
-    """
-    return error_lines
+    def write_lines(self, lines):
+        """
+        :param lines: Lines to add to output, without line breaks
+        :return: None
+        """
+        if lines:
+            self.write("\n".join(lines) + "\n")
+
+    def flush(self):
+        if self.fragments:
+            self.file.write("".join(self.fragments))
+            self.fragments = []
+            self.size = 0
+
+    def getvalue(self):
+        """
+        :return: Everything written so far, if output is kept in memory
+        """
+        self.flush()
+        return self.file.getvalue()
+
+    def close(self):
+        """
+        Finish the output, replacing the output file with everything written
+        :return: None
+        """
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        if self.filename is not None:
+            self.file.close()
+            os.replace(self.partial_filename, self.filename)
+
+    def discard(self):
+        """
+        Abandon the output, leaving any existing output file as it was
+        :return: None
+        """
+        if self.closed:
+            return
+        self.fragments = []
+        self.closed = True
+        if self.filename is not None:
+            self.file.close()
+            os.remove(self.partial_filename)
 
+    def __enter__(self):
+        return self
 
-def output_error_log():
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+# Each conversion logs what it could not translate in its own ErrorLog
+ErrorLog = diagnostics.ErrorLog
+
+
+def output_error_log(lines):
     """
     Opens the error log file, outputs the failed lines, closes file
+    :param lines: Error lines to output, from ErrorLog.lines
     :return: None
     """
-    error_file = open("error_log.txt", "w+")
-    for line in error_lines:
-        print(line, file=error_file)
-    error_file.close()
+    with open("error_log.txt", "w+") as error_file:
+        error_file.write("".join(line + "\n" for line in lines))
 
 
 # Writes disclaimer at beginning of output file
 # Includes contact details, a warning, and a "not my problem" message
-def write_output_copyright(output_file, input_format, output_format):
+def write_output_copyright(output_file, input_format, output_format, comment="#"):
     """
     Write disclaimer at beginning of output file.
     Contains contact details, warranty warning, etc.
     :param output_file: Output file to write to
     :param input_format: Input script format (ProjectQ, QuTiP, etc.)
     :param output_format: Output script format (ProjectQ, QuTiP, etc.)
+    :param comment: Line comment of the output format
     :return:
     """
-    print(
+    output_file.write("\n".join(copyright_lines(input_format, output_format, comment)) + "\n")
+
+
+def copyright_lines(input_format, output_format, comment="#"):
+    """
+    :param input_format: Input script format (ProjectQ, QuTiP, etc.)
+    :param output_format: Output script format (ProjectQ, QuTiP, etc.)
+    :param comment: Line comment of the output format
+    :return: Lines of disclaimer, without line breaks
+    """
+    lines = [
         "######################################################################",
-        file=output_file)
-    print(
         "#                                                                    #",
-        file=output_file)
-    print(
         "# This file has been auto-generated as part of convert_qc.py         #",
-        file=output_file)
-    print(
         "# There may be errors, mis-translations, or other mistakes           #",
-        file=output_file)
-    print(
         "# This file is presented as-is, with no guarantee of support, and is #",
-        file=output_file)
-    print(
         "#     covered under the GNU GPL v3.0 License                         #",
-        file=output_file)
-    print(
         "# I recommend giving a careful read to check before running          #",
-        file=output_file)
-    print(
         "#                                                                    #",
-        file=output_file)
-    print(
         "# For any questions or comments, please email convertqc@gmail.com    #",
-        file=output_file)
-    print(
         "# For citations, please pretend I wrote an academic paper            #",
-        file=output_file)
-    print(
         "#                                                                    #",
-        file=output_file)
-
-    new_line = "# Input format: " + input_format
-    while len(new_line) < 69:
-        new_line += " "
-    new_line += "#"
-    print(new_line, file=output_file)
-
-    new_line = "# Output format: " + output_format
-    while len(new_line) < 69:
-        new_line += " "
-    new_line += "#"
-    print(new_line, file=output_file)
-
-    print(
+        ("# Input format: " + input_format).ljust(69) + "#",
+        ("# Output format: " + output_format).ljust(69) + "#",
         "#                                                                    #",
-        file=output_file)
-    print(
-        "######################################################################",
-        file=output_file)
-
+        "######################################################################"
+    ]
+    if comment != "#":
+        lines = [comment + line[1:] for line in lines]
+    return lines
 
-def untranslateable_line(line, line_no, mark, file):
-    if mark:
-        print("# *!* ERROR - COULD NOT TRANSFER LINE BELOW COMMENT. PLEASE CHECK MANUALLY: *!* \n" + str(line),
-              file=file)
-    add_new_error_line(line_no, line)
 
-
-def debug_print(number, text):
-    print(str(number) + " DEBUG: " + text)
+def debug_print(number, text, *args):
+    """
+    Print a debug message. Like logging, arguments are only formatted into the message when it is printed, and
+    callers check the debug flag first, so a disabled debug mode builds no text at all
+    :param number: Line number the message is about
+    :param text: Message, with %-style placeholders for args
+    :param args: Values of placeholders
+    :return: None
+    """
+    print(str(number) + " DEBUG: " + (text % args if args else text))
 
 
-def verbose_print(number, text):
-    print(str(number) + ": " + text)
+def verbose_print(number, text, *args):
+    """
+    Print a verbose message, formatting it only when printed - see debug_print
+    :param number: Line number the message is about
+    :param text: Message, with %-style placeholders for args
+    :param args: Values of placeholders
+    :return: None
+    """
+    print(str(number) + ": " + (text % args if args else text))
 
 
 # Source -
@@ -182,3 +311,666 @@ def chomp(x):
     if x.endswith("\n") or x.endswith("\r"):
         return x[:-1]
     return x
+
+
+class ScriptReader(ast.NodeVisitor):
+    """
+    Lowers a whole input script into a Circuit with a single parse and a single pass over its tree.
+    Frontends subclass this and add visit_ methods for the statements of their framework.
+    Any statement without one is carried through to the output unchanged; blocks (def, if, for...)
+    are carried through with their bodies lowered in turn.
+    Comments and blank lines are recovered from the source between statements, as the AST does not keep them
+    """
+    def __init__(self, source, verbose=False, debug=False, error_log=None):
+        """
+        :param source: Input script as a string
+        :param verbose: Run in verbose mode
+        :param debug: Run in debug mode
+        :param error_log: ErrorLog to add untranslated lines to
+        """
+        self.error_log = ErrorLog() if error_log is None else error_log
+        self.source = source
+        self.source_lines = source.splitlines()
+        self.verbose = verbose
+        self.debug = debug
+        self.circuit = circuit.Circuit()
+        self.depth = 0
+        self.first_line = 1
+        self.next_line = 1
+
+    def read(self):
+        """
+        Parse and lower the input script
+        :return: Circuit of the input script
+        """
+        result = self.read_chunk(self.source)
+        self.finish()
+        return result
+
+    def read_chunk(self, source, first_line=1, tree=None):
+        """
+        Parse and lower part of a script, made up of whole top level statements, into a circuit of its own.
+        Everything found in earlier parts (qubits, circuit definitions...) carries over
+        :param source: Part of the input script
+        :param first_line: Line number of its first line in the whole script
+        :param tree: ast.Module of source, if already parsed
+        :return: Circuit of this part
+        """
+        if tree is None:
+            tree = parse_source(source)
+        self.circuit = circuit.Circuit(self.circuit.num_qubits)
+        return self.lower_chunk(source, first_line, tree)
+
+    def lower_chunk(self, source, first_line, tree):
+        """
+        Lower part of a script, made up of whole top level statements, onto the end of the current circuit
+        :param source: Part of the input script
+        :param first_line: Line number of its first line in the whole script
+        :param tree: ast.Module of source
+        :return: Current circuit
+        """
+        if first_line > 1:
+            ast.increment_lineno(tree, first_line - 1)
+        self.source = source
+        self.source_lines = source.splitlines()
+        self.first_line = first_line
+        self.next_line = first_line
+        self.lower_body(tree.body)
+        self.lower_gap(first_line + len(self.source_lines))
+        return self.circuit
+
+    def parse(self, source):
+        """
+        Parse part of a script made up of whole top level statements
+        :param source: Part of a script
+        :return: ast.Module of source
+        :raises SyntaxError: If the part does not parse, e.g. as a bracket is closed in a later part
+        """
+        with PARSE_LOCK:
+            return ast.parse(source)
+
+    def split_statements(self, input_file):
+        """
+        Split a script into top level statements without parsing it, for reading a part at a time
+        :param input_file: Open input file, or any iterable of lines
+        :return: Generator of (first line number, source, number of lines) for each statement
+        """
+        from . import streaming
+        return streaming.split_statements(input_file)
+
+    def finish(self):
+        """
+        Called once the whole script has been read. Frontends check here for anything the script must contain
+        :return: None
+        """
+
+    def get_state(self):
+        """
+        Everything found so far which changes how later statements are lowered,
+        so reading can be picked up part way through a script with set_state
+        :return: Dictionary of JSON compatible values
+        """
+        return {"num_qubits": self.circuit.num_qubits}
+
+    def set_state(self, state):
+        """
+        Carry on reading from a state returned by get_state
+        :param state: Dictionary returned by get_state
+        :return: None
+        """
+        self.circuit.num_qubits = state["num_qubits"]
+
+    def lower_body(self, statements):
+        for statement in statements:
+            self.lower_statement(statement)
+
+    def lower_statement(self, node):
+        self.lower_gap(node.lineno)
+        self.visit(node)
+        self.next_line = max(self.next_line, node.end_lineno + 1)
+
+    def generic_visit(self, node):
+        """
+        Statements not handled by the frontend are copied verbatim
+        :param node: Statement node
+        :return: None
+        """
+        if is_compound(node):
+            self.lower_block(node)
+        else:
+            self.add_statement(node)
+
+    def lower_block(self, node, untranslated=False):
+        """
+        Add the header of a compound statement (def, if, for, with...) then lower its bodies
+        :param node: Compound statement node
+        :param untranslated: Header could not be translated, and is flagged (body is still lowered)
+        :return: None
+        """
+        if untranslated:
+            header = self.get_segment(node).split("\n")[0]
+            self.circuit.add_text(circuit.UNTRANSLATED_BLOCK, header, self.depth, node.lineno)
+            self.error_log.add(node.lineno, header, diagnostics.UNTRANSLATED_BLOCK, node.col_offset + 1)
+        else:
+            self.add_header(node, circuit.BLOCK)
+        self.next_line = max(self.next_line, node.lineno + 1)
+        self.lower_nested(node.body)
+
+        for handler in getattr(node, "handlers", []):
+            self.lower_gap(handler.lineno)
+            self.add_header(handler, circuit.BLOCK)
+            self.lower_nested(handler.body)
+
+        orelse = getattr(node, "orelse", [])
+        if isinstance(node, ast.If) and len(orelse) == 1 and isinstance(orelse[0], ast.If) \
+                and orelse[0].col_offset == node.col_offset:
+            # elif - lowered as a block header of its own at the same depth
+            self.lower_gap(orelse[0].lineno)
+            position = len(self.circuit)
+            self.lower_block(orelse[0])
+            self.circuit.params[position] = self.circuit.intern("el" + self.circuit.text(position))
+        elif orelse:
+            self.circuit.add_text(circuit.BLOCK, "else:", self.depth)
+            self.lower_nested(orelse)
+
+        finalbody = getattr(node, "finalbody", [])
+        if finalbody:
+            self.circuit.add_text(circuit.BLOCK, "finally:", self.depth)
+            self.lower_nested(finalbody)
+
+    def lower_nested(self, statements):
+        self.depth += 1
+        self.lower_body(statements)
+        self.depth -= 1
+
+    def add_header(self, node, op):
+        header = copy.copy(node)
+        header.body = [ast.Pass()]
+        for field in ("orelse", "handlers", "finalbody"):
+            if hasattr(header, field):
+                setattr(header, field, [])
+        if isinstance(node, TRY_NODES):
+            header_lines = ["try:"]
+        else:
+            # Drop the placeholder "pass" unparsed into the body
+            header_lines = ast.unparse(header).split("\n")[:-1]
+        self.circuit.add_text(op, "\n".join(header_lines), self.depth, node.lineno)
+
+    def add_statement(self, node):
+        """
+        Carry a statement through to the output unchanged
+        :param node: Statement node
+        :return: None
+        """
+        self.circuit.add_text(circuit.STATEMENT, ast.unparse(node), self.depth, node.lineno)
+
+    def add_untranslated(self, node):
+        """
+        Carry a statement through verbatim, flagging it and adding it to the error log
+        :param node: Statement node
+        :return: None
+        """
+        segment = self.get_segment(node)
+        self.circuit.add_text(circuit.UNTRANSLATED, segment, self.depth, node.lineno)
+        self.error_log.add(node.lineno, segment, diagnostics.UNTRANSLATED_STATEMENT, node.col_offset + 1)
+
+    def add_gate(self, node, op, targets, controls=(), param=None):
+        """
+        Add a gate found at a statement to the circuit
+        :param node: Statement applying the gate
+        :param op: Gate opcode
+        :param targets: Target qubits
+        :param controls: Control qubits
+        :param param: Gate parameter expression
+        :return: None
+        """
+        self.circuit.add_gate(op, targets, controls, param, self.depth, node.lineno)
+
+    def add_comment(self, node, text):
+        self.circuit.add_text(circuit.COMMENT, text, self.depth, node.lineno)
+
+    def lower_gap(self, up_to):
+        """
+        Add comments and blank lines found between the last lowered statement and the next one
+        :param up_to: Line number of the next statement
+        :return: None
+        """
+        for line_no in range(self.next_line, up_to):
+            stripped = self.source_lines[line_no - self.first_line].strip()
+            if not stripped:
+                self.circuit.add_text(circuit.BLANK, None, self.depth, line_no)
+            elif stripped[0] == "#":
+                self.circuit.add_text(circuit.COMMENT, stripped, self.depth, line_no)
+        self.next_line = max(self.next_line, up_to)
+
+    def get_segment(self, node):
+        """
+        Get the original source of a node, without its first line's indentation
+        :param node: Node to find source for
+        :return: Source text of node
+        """
+        lines = self.source_lines[node.lineno - self.first_line:node.end_lineno - self.first_line + 1]
+        lines[-1] = lines[-1][:node.end_col_offset]
+        lines[0] = lines[0][node.col_offset:]
+        return "\n".join(chomp(line) for line in lines)
+
+
+def invert_gate(op, param):
+    """
+    Find the inverse of a gate, as applied inside a Dagger block
+    :param op: Gate opcode
+    :param param: Gate parameter expression, or None
+    :return: Tuple of opcode and parameter of inverse, or None if the circuit has no inverse gate
+    """
+    if op in SELF_INVERSE:
+        return op, param
+    if op in INVERSES:
+        return INVERSES[op], param
+    if op in (circuit.RX, circuit.RY, circuit.RZ, circuit.PHASE):
+        return op, negate_angle(param)
+    return None
+
+
+def negate_angle(angle):
+    node = ast.parse(angle, mode="eval").body
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return ast.unparse(node.operand)
+    return ast.unparse(ast.UnaryOp(ast.USub(), node))
+
+
+def script_lines(circuit_in, write_gate, mark=True, error_log=None):
+    """
+    Translate every entry of a circuit into lines of a script, indented canonically
+    :param circuit_in: Circuit to write
+    :param write_gate: Function taking the circuit and a gate position, returning the translated line.
+                       Returns an empty string if the gate needs no equivalent, or None if it has none
+    :param mark: Add comments identifying untranslated lines
+    :param error_log: ErrorLog to add gates with no equivalent to
+    :return: List of lines, without line breaks
+    """
+    if error_log is None:
+        error_log = ErrorLog()
+    lines = []
+    ops = circuit_in.ops
+    depths = circuit_in.depths
+    # Depth of the last block header still waiting for a statement
+    open_block = None
+
+    for i in range(len(ops)):
+        op = ops[i]
+        depth = depths[i]
+        indent = "    " * depth
+        if open_block is not None and depth <= open_block:
+            # Every statement in the block was removed during translation
+            lines.append("    " * (open_block + 1) + "pass")
+            open_block = None
+
+        if op == circuit.BLANK:
+            lines.append("")
+            continue
+        if op == circuit.COMMENT:
+            lines.append(indent + circuit_in.text(i))
+            continue
+
+        if op >= circuit.FIRST_GATE:
+            text = write_gate(circuit_in, i)
+            if text is None:
+                text = describe_gate(circuit_in, i)
+                error_log.add(circuit_in.lines[i], text, diagnostics.NO_EQUIVALENT_GATE)
+                if mark:
+                    lines.append(indent + MARK_COMMENT)
+                lines.append(indent + "# " + text)
+                continue
+            if not text:
+                continue
+        elif op == circuit.UNTRANSLATED or op == circuit.UNTRANSLATED_BLOCK:
+            # Original source - continuation lines keep their own indentation
+            if mark:
+                lines.append(indent + MARK_COMMENT)
+            lines.append(indent + circuit_in.text(i))
+            open_block = depth if op == circuit.UNTRANSLATED_BLOCK else None
+            continue
+        else:
+            text = circuit_in.text(i)
+
+        lines.append(indent + text.replace("\n", "\n" + indent))
+        open_block = depth if op == circuit.BLOCK else None
+
+    if open_block is not None:
+        lines.append("    " * (open_block + 1) + "pass")
+    return lines
+
+
+def write_lines(output_file, lines):
+    """
+    Tidy blank lines to PEP8 and write lines to the output file in one go
+    :param output_file: Output file to write to
+    :param lines: Lines to write, without line breaks
+    :return: None
+    """
+    output_file.write("\n".join(tidy_blank_lines(lines)) + "\n")
+
+
+def tidy_blank_lines(lines):
+    """
+    Normalise blank lines the way autopep8 would
+    :param lines: Lines of a script
+    :return: Tidied lines
+    """
+    return BlankLineTidier().tidy(lines)
+
+
+class BlankLineTidier:
+    """
+    Normalises blank lines the way autopep8 would: two around top level definitions, at most one
+    inside blocks, none straight after a block header and none at the end.
+    Comments directly above a definition are kept with it.
+    A script can be tidied a part at a time, as long as comments are in the same part as the line they are above
+    """
+    def __init__(self):
+        # Last line kept, and blank lines seen since
+        self.previous = None
+        self.blanks = 0
+        self.after_definition = False
+        # A top level comment or decorator is attached to the next line
+        self.attached = False
+
+    def tidy(self, lines):
+        """
+        Tidy the next part of a script
+        :param lines: Lines following those already tidied
+        :return: Tidied lines
+        """
+        result = []
+        previous = self.previous
+        blanks = self.blanks
+        after_definition = self.after_definition
+        attached = self.attached
+
+        for i, line in enumerate(lines):
+            line = line.rstrip()
+            if not line:
+                blanks += 1
+                continue
+
+            if previous is None:
+                wanted = min(blanks, 2)
+            elif previous.endswith(":") and not previous.lstrip().startswith("#"):
+                wanted = 0
+            elif line[0].isspace():
+                wanted = min(blanks, 1)
+                if is_definition(line.lstrip()) and not attached and blanks == 0:
+                    wanted = 1
+            elif attached and blanks == 0:
+                wanted = 0
+            else:
+                head = i
+                while lines[head].startswith("#") and head + 1 < len(lines) and lines[head + 1].startswith("#"):
+                    head += 1
+                if lines[head].startswith("#") and head + 1 < len(lines):
+                    head += 1
+                if is_definition(lines[head]) or after_definition:
+                    wanted = 2
+                else:
+                    wanted = min(blanks, 2)
+
+            result.extend([""] * wanted)
+            result.append(line)
+            previous = line
+            blanks = 0
+
+            if not line[0].isspace():
+                attached = line[0] == "#" or (line[0] == "@" and not is_decorated_definition(line))
+                if not attached:
+                    after_definition = is_definition(line)
+            else:
+                attached = line.lstrip()[0] == "#" or (line.lstrip()[0] == "@" and not is_decorated_definition(line))
+
+        self.previous = previous
+        self.blanks = blanks
+        self.after_definition = after_definition
+        self.attached = attached
+        return result
+
+
+def is_definition(line):
+    """
+    Check whether a line starts a function or class definition
+    :param line: Line to check, without indentation
+    :return: True if definition or decorator
+    """
+    return line.startswith(("def ", "async def ", "class ", "@"))
+
+
+def is_decorated_definition(line):
+    """
+    Check whether a line is a whole decorated definition header - block headers are written as one entry,
+    decorators and all, e.g. "@decorator\ndef f():"
+    :param line: Line to check
+    :return: True if the line holds a def or class as well as its decorators
+    """
+    return "\n" in line and any(is_definition(part.lstrip()) and not part.lstrip().startswith("@")
+                                for part in line.split("\n"))
+
+
+def format_source(source):
+    """
+    Run autopep8 over a script in-process, if it is installed
+    :param source: Script to format
+    :return: Formatted script
+    """
+    try:
+        import autopep8
+    except ImportError:
+        error_cqc.process_error(error_cqc.AUTOPEP8_NOT_INSTALLED, False)
+        return source
+    return autopep8.fix_code(source, options={"aggressive": 2})
+
+
+def formatter_version():
+    """
+    Version of autopep8 used by format_source
+    :return: Version string, or None if not installed
+    """
+    try:
+        import autopep8
+    except ImportError:
+        return None
+    return autopep8.__version__
+
+
+def broadcast(qubit_lists):
+    """
+    Work out the gates made by applying a gate to whole registers, as QASM and Qiskit allow. The gate is applied
+    to each qubit of the registers in turn, along with the qubit of the same position in any other register;
+    arguments of a single qubit are used by every gate
+    :param qubit_lists: List of the qubits of each argument of the gate
+    :return: List of the qubits of each gate, or None if registers given differ in size
+    """
+    sizes = set(len(qubits) for qubits in qubit_lists if len(qubits) != 1)
+    if len(sizes) > 1:
+        return None
+    size = sizes.pop() if sizes else 1
+    return [[qubits[i] if len(qubits) > 1 else qubits[0] for qubits in qubit_lists] for i in range(size)]
+
+
+def describe_gate(circuit_in, index):
+    """
+    Describe a gate in framework-neutral terms, for gates with no equivalent in the output format
+    :param circuit_in: Circuit containing gate
+    :param index: Position of gate
+    :return: Description of gate
+    """
+    controls, targets = circuit_in.qubits(index)
+    name = circuit.opcode_names[circuit_in.ops[index]]
+    param = circuit_in.param(index)
+    if param is not None:
+        name += "(" + param + ")"
+    if controls:
+        name = "C" * len(controls) + "-" + name
+    return "No equivalent gate: " + name + " on qubits " + ", ".join(str(q) for q in controls + targets)
+
+
+def is_compound(node):
+    """
+    Check whether a statement contains a block of further statements
+    :param node: Statement node
+    :return: True if compound statement (def, if, for, with...)
+    """
+    return isinstance(getattr(node, "body", None), list) and not isinstance(node, getattr(ast, "Match", ()))
+
+
+def get_call_name(node):
+    """
+    Get the name of the function or method called by a node
+    :param node: Node to check
+    :return: Name called, or None if node is not a call
+    """
+    if not isinstance(node, ast.Call):
+        return None
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return None
+
+
+class Resolution:
+    """
+    The qubits a qubit expression in a script refers to
+    """
+    # Kinds of resolution
+    REGISTER = "register"
+    PARAMETER = "parameter"
+    UNRESOLVED = "unresolved"
+
+    def __init__(self, kind, qubits, expression):
+        """
+        :param kind: REGISTER if found in the register, PARAMETER if a function parameter, otherwise UNRESOLVED
+        :param qubits: Circuit qubits - positions, or symbolic expressions where positions are not known
+        :param expression: Source of the expression
+        """
+        self.kind = kind
+        self.qubits = qubits
+        self.expression = expression
+
+    @property
+    def resolved(self):
+        return self.kind != Resolution.UNRESOLVED
+
+
+class SymbolTable:
+    """
+    Qubit names in a script, and their positions in the circuit's register.
+    Every allocation goes into the one register, so allocated names are visible from anywhere after them;
+    inside a function, its parameters shadow them. Every lookup is a dictionary or set lookup
+    """
+    def __init__(self):
+        # Name of allocated qubit or qureg, to its first position and size
+        self.registers = {}
+        # Name of each register position
+        self.names = []
+        # Parameter names of each function being read, innermost last
+        self.scopes = []
+
+    def allocate(self, name, size=1):
+        """
+        Add an allocated qubit (size 1) or qureg to the end of the register
+        :param name: Name assigned to
+        :param size: Number of qubits
+        :return: None
+        """
+        start = len(self.names)
+        self.registers[name] = (start, size)
+        if size == 1:
+            self.names.append(name)
+        else:
+            self.names.extend(name + "[" + str(i) + "]" for i in range(size))
+
+    def push_scope(self, parameters):
+        self.scopes.append(set(parameters))
+
+    def pop_scope(self):
+        self.scopes.pop()
+
+    def is_parameter(self, name):
+        return any(name in scope for scope in self.scopes)
+
+    def lookup(self, name):
+        """
+        :param name: Qubit name
+        :return: Tuple of first position and size, or None if not an allocated qubit here
+        """
+        if self.scopes and self.is_parameter(name):
+            return None
+        return self.registers.get(name)
+
+    def resolve(self, node):
+        """
+        Find the qubits a qubit expression refers to - a name, an index into a qureg or a slice of one
+        :param node: Qubit expression
+        :return: Resolution
+        """
+        expression = ast.unparse(node)
+        if isinstance(node, ast.Name):
+            register = self.lookup(node.id)
+            if register is not None:
+                return Resolution(Resolution.REGISTER, list(range(register[0], register[0] + register[1])), expression)
+            if self.is_parameter(node.id):
+                return Resolution(Resolution.PARAMETER, [expression], expression)
+        elif isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name):
+            register = self.lookup(node.value.id)
+            if register is not None:
+                qubits = get_register_slice(register, node.slice)
+                if qubits is not None:
+                    return Resolution(Resolution.REGISTER, qubits, expression)
+            elif self.is_parameter(node.value.id):
+                return Resolution(Resolution.PARAMETER, [expression], expression)
+        return Resolution(Resolution.UNRESOLVED, [expression], expression)
+
+    def get_state(self):
+        return {"registers": dict(self.registers), "names": list(self.names)}
+
+    def set_state(self, state):
+        self.registers = {name: tuple(register) for name, register in state["registers"].items()}
+        self.names = list(state["names"])
+
+
+def get_register_slice(register, index):
+    """
+    Positions of an index or slice of a qureg
+    :param register: Tuple of first position and size of qureg
+    :param index: Index or slice node
+    :return: List of positions, a symbolic position if the index is not a literal, or None if out of range
+    """
+    start, size = register
+    if isinstance(index, ast.Slice):
+        bounds = [get_int(part) for part in (index.lower, index.upper, index.step)]
+        if any(bound is False for bound in bounds) or bounds[2] == 0:
+            return None
+        return [start + i for i in range(*slice(*bounds).indices(size))]
+    position = get_int(index)
+    if position is False:
+        # Index worked out when the script runs - position is relative to the start of the qureg
+        expression = ast.unparse(index)
+        return [expression if start == 0 else str(start) + " + " + expression]
+    if position < 0:
+        position += size
+    if not 0 <= position < size:
+        return None
+    return [start + position]
+
+
+def get_int(node):
+    """
+    :param node: Expression, or None
+    :return: Value of integer literal, None if no expression, or False if expression is not an integer literal
+    """
+    if node is None:
+        return None
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = get_int(node.operand)
+        return False if value is None or value is False else -value
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        return node.value
+    return False
@@ -0,0 +1,429 @@
+#    Library interface for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import contextlib
+import os
+
+from . import binary, conversion, diagnostics, error_cqc, instrument, plugins
+
+# Functions lowering a script into a circuit, and writing a circuit out as a script.
+# Each format's module is only imported once a conversion uses it
+readers = plugins.Functions("read_script", "reads")
+writers = plugins.Functions("write_script", "writes")
+# Modules of each format, which stream scripts a part at a time
+frontends = plugins.Modules()
+CIRCUIT_FILE_NAME = "ConvertQC circuit"
+
+
+def format_name(name):
+    """
+    :param name: Name of format
+    :return: Display name of format, used in the output file header
+    """
+    if name == binary.FORMAT:
+        return CIRCUIT_FILE_NAME
+    return plugins.get_format(name).display_name
+
+
+def comment(name):
+    """
+    :param name: Name of output format
+    :return: Line comment of format
+    """
+    return getattr(frontends[name], "COMMENT", "#")
+
+
+class Result:
+    """
+    Outcome of a single conversion
+    """
+    def __init__(self, code, error_log, circuit, input_format, output_format, cached=False, optimization=None,
+                 stats=None):
+        """
+        :param code: Converted script, or None if it was streamed to a file
+        :param error_log: ErrorLog of the conversion
+        :param circuit: Circuit the input script was read into, if it was read
+        :param input_format: Format of input script
+        :param output_format: Format of converted script
+        :param cached: Result was stored by an earlier conversion, so the script was not read into a circuit
+        :param optimization: Gates removed by each optimization pass, if the circuit was optimized
+        :param stats: instrument.Stats of the conversion
+        """
+        self.code = code
+        # Lines which could not be translated, as "<line number> - <line>"
+        self.error_lines = error_log.lines
+        self.diagnostics = error_log.records
+        self.counts = error_log.counts
+        self.circuit = circuit
+        self.input_format = input_format
+        self.output_format = output_format
+        self.cached = cached
+        self.optimization = optimization
+        self.stats = stats
+
+
+class Converter:
+    """
+    Converts scripts between formats. Only options are held on the converter - everything a
+    conversion builds up lives in that call, so one converter can be shared between threads
+    """
+    def __init__(self, mark=True, pep8=False, verbose=False, debug=False, result_cache=None, passes=None,
+                 diagnostic_writer=None, severity=diagnostics.INFO):
+        """
+        :param mark: Add comments identifying untranslated lines
+        :param pep8: Format output with autopep8
+        :param verbose: Run in verbose mode
+        :param debug: Run in debug mode
+        :param result_cache: cache.ResultCache to reuse earlier results from (default: no caching)
+        :param passes: Names of optimization passes to run on the circuit, e.g. optimize.PASSES
+                       (default: none). Only whole-script conversions are optimized
+        :param diagnostic_writer: diagnostics.DiagnosticWriter every conversion writes its diagnostics to as they
+                                  are found (default: none)
+        :param severity: Least severe diagnostic to report
+        """
+        self.mark = mark
+        self.pep8 = pep8
+        self.verbose = verbose
+        self.debug = debug
+        self.result_cache = result_cache
+        self.passes = passes
+        self.diagnostic_writer = diagnostic_writer
+        self.severity = severity
+
+    def convert(self, source, src="projectq", dst="qutip", input_filename="", stats=None):
+        """
+        Convert a whole script held in memory
+        :param source: Input script as a string, or as bytes (e.g. a memory mapped file)
+        :param src: Format of input script
+        :param dst: Format to convert to
+        :param input_filename: Name of file the script was read from, reported with its diagnostics
+        :param stats: instrument.Stats to add to, e.g. holding the time taken to read the file (default: new)
+        :return: Result of conversion
+        :raises error_cqc.ConversionError: If the script cannot be converted
+        """
+        self.check_formats(src, dst)
+        if stats is None:
+            stats = instrument.Stats()
+        stats.count_lines(source)
+        if self.result_cache is not None:
+            key = self.cache_key(source, src, dst)
+            stored = self.result_cache.get(key)
+            if stored is not None:
+                if self.verbose:
+                    print("Using cached conversion")
+                error_log = self.error_log(input_filename)
+                error_log.extend(stored[1])
+                stats.count(instrument.UNTRANSLATED, error_log.errors)
+                return Result(stored[0], error_log, None, src, dst, True, stats=stats)
+        error_log = self.error_log(input_filename)
+        circuit, optimization = self.read_circuit(source, src, error_log, stats)
+        converted = self.write_circuit(circuit, src, dst, error_log, stats)
+        if self.result_cache is not None:
+            self.result_cache.put(key, converted, error_log.to_list())
+        stats.count(instrument.UNTRANSLATED, error_log.errors)
+        return Result(converted, error_log, circuit, src, dst, optimization=optimization, stats=stats)
+
+    def error_log(self, input_filename=""):
+        """
+        :param input_filename: Name of file being converted
+        :return: New ErrorLog for a conversion, writing to the converter's diagnostic writer
+        """
+        return diagnostics.ErrorLog(input_filename, self.diagnostic_writer, self.severity)
+
+    def read_circuit(self, source, src, error_log, stats):
+        """
+        Read a script into a circuit, optimizing it if any passes were chosen
+        :param source: Input script as a string, or as bytes (e.g. a memory mapped file)
+        :param src: Format of input script
+        :param error_log: ErrorLog to add untranslated lines to
+        :param stats: instrument.Stats to add to
+        :return: Tuple of circuit, and gates removed by each optimization pass (None if not optimized)
+        """
+        # Every input format is read into the same circuit, which any output format can write.
+        # Parsing and lowering are done separately, so each is timed
+        circuit = None
+        if not isinstance(source, str):
+            reader = frontends[src].Reader("", self.verbose, self.debug, error_log)
+            if hasattr(reader, "read_mapped"):
+                # Parsed a part at a time as it is lowered, so all timed as lowering
+                with stats.time(instrument.CONVERT):
+                    try:
+                        circuit = reader.read_mapped(source, stats)
+                    except SyntaxError:
+                        raise error_cqc.InputSyntaxError()
+            if circuit is None:
+                source = conversion.decode_source(source)
+        if circuit is None:
+            reader = frontends[src].Reader(source, self.verbose, self.debug, error_log)
+            with stats.time(instrument.PRESCAN):
+                try:
+                    tree = reader.parse(source)
+                except SyntaxError:
+                    raise error_cqc.InputSyntaxError()
+            stats.count(instrument.PARSES)
+            with stats.time(instrument.CONVERT):
+                circuit = reader.read_chunk(source, 1, tree)
+        optimization = None
+        with stats.time(instrument.CONVERT):
+            reader.finish()
+            if self.passes:
+                from . import optimize
+                circuit, optimization = optimize.optimize_circuit(circuit, self.passes)
+        if optimization is not None and self.verbose:
+            from . import optimize
+            print("Optimized circuit: " + optimize.format_stats(optimization))
+        stats.count_gates(circuit)
+        return circuit, optimization
+
+    def write_circuit(self, circuit, src, dst, error_log, stats):
+        """
+        Write a circuit out as a script
+        :param circuit: Circuit to write
+        :param src: Format the circuit was read from
+        :param dst: Format to write
+        :param error_log: ErrorLog to add gates with no equivalent to
+        :param stats: instrument.Stats to add to
+        :return: Converted script
+        """
+        # Output is written canonically in memory, and only formatted further if requested
+        with stats.time(instrument.EMIT):
+            output = conversion.OutputSink()
+            conversion.write_output_copyright(output, format_name(src), format_name(dst), comment(dst))
+            writers[dst](circuit, output, self.mark, error_log)
+            converted = output.getvalue()
+        if self.pep8:
+            with stats.time(instrument.FORMAT):
+                converted = conversion.format_source(converted)
+        return converted
+
+    def cache_key(self, source, src, dst):
+        # Only options which change the output or its diagnostics are part of the key
+        formatter = conversion.formatter_version() if self.pep8 else None
+        passes = sorted(self.passes) if self.passes else None
+        return self.result_cache.key(source, src, dst, (self.mark, self.pep8, formatter, passes, self.severity))
+
+    def check_formats(self, src, dst, circuit_files=False, streamed=False):
+        """
+        :param circuit_files: Also allow binary circuit files as the input or output format
+        :param streamed: Both formats must support converting a statement at a time
+        """
+        if src == dst:
+            raise error_cqc.MatchingFormatsError()
+        readable = (circuit_files and src == binary.FORMAT) or src in readers
+        writable = (circuit_files and dst == binary.FORMAT) or dst in writers
+        if not readable or not writable:
+            raise error_cqc.UnsupportedFormatError()
+        if streamed and not (plugins.get_format(src).streams and plugins.get_format(dst).streams):
+            raise error_cqc.UnsupportedStreamingError()
+
+    def convert_file(self, input_filename, output_filename, src="projectq", dst="qutip"):
+        """
+        Convert a script file, writing the converted script to another file
+        Either format may be binary.FORMAT, to save the circuit the script was read into, or write out
+        a circuit saved before without reading the script again
+        :param input_filename: Name of input file
+        :param output_filename: Name of output file, including extension
+        :param src: Format of input script
+        :param dst: Format to convert to
+        :return: Result of conversion
+        :raises error_cqc.ConversionError: If the script cannot be converted
+        """
+        if binary.FORMAT in (src, dst):
+            return self.convert_circuit_file(input_filename, output_filename, src, dst)
+        self.check_formats(src, dst)
+        stats = instrument.Stats()
+        with contextlib.ExitStack() as stack:
+            source = self.read_source(input_filename, src, stack, stats)
+            result = self.convert(source, src, dst, input_filename, stats)
+        with conversion.OutputSink(output_filename) as output:
+            output.write(result.code)
+        return result
+
+    def convert_circuit_file(self, input_filename, output_filename, src, dst):
+        """
+        Convert a script file to a binary circuit file, or a binary circuit file to a script file.
+        Lines which could not be translated are kept in the circuit file, and reported again by every
+        script written from it
+        :param input_filename: Name of input file
+        :param output_filename: Name of output file, including extension
+        :param src: Format of input script, or binary.FORMAT
+        :param dst: Format to convert to, or binary.FORMAT
+        :return: Result of conversion, without the circuit if it was loaded from a circuit file
+        :raises error_cqc.ConversionError: If the script cannot be converted
+        """
+        result = self.read_circuit_file(input_filename, src, dst)
+        self.write_result(result, output_filename)
+        return result
+
+    def read_circuit_file(self, input_filename, src, dst):
+        """
+        Do everything convert_circuit_file does apart from writing the output file, so the output can be
+        written separately (e.g. only once an asynchronous conversion has not been cancelled) with write_result
+        :return: Result of conversion - with the converted script if src is binary.FORMAT, otherwise with the
+                 circuit to save
+        """
+        self.check_formats(src, dst, True)
+        error_log = self.error_log(input_filename)
+        stats = instrument.Stats()
+        if src == binary.FORMAT:
+            try:
+                with stats.time(instrument.READ):
+                    circuit, src, records = binary.load_circuit(input_filename)
+            except FileNotFoundError:
+                raise error_cqc.InputFileNotFoundError()
+            except ValueError:
+                raise error_cqc.InvalidCircuitFileError()
+            # The circuit is a view of the mapped file, so is closed once written out rather than returned
+            with circuit:
+                if src not in frontends:
+                    raise error_cqc.InvalidCircuitFileError()
+                error_log.extend(records)
+                stats.count_gates(circuit)
+                converted = self.write_circuit(circuit, src, dst, error_log, stats)
+            stats.count(instrument.UNTRANSLATED, error_log.errors)
+            return Result(converted, error_log, None, src, dst, stats=stats)
+
+        with contextlib.ExitStack() as stack:
+            source = self.read_source(input_filename, src, stack, stats)
+            stats.count_lines(source)
+            circuit, optimization = self.read_circuit(source, src, error_log, stats)
+        stats.count(instrument.UNTRANSLATED, error_log.errors)
+        return Result(None, error_log, circuit, src, dst, optimization=optimization, stats=stats)
+
+    @staticmethod
+    def write_result(result, output_filename):
+        """
+        Write the output of a conversion to a file - a binary circuit file if it was converted to binary.FORMAT
+        :param result: Result of conversion, with the converted script or the circuit
+        :param output_filename: Name of output file, including extension
+        :return: None
+        """
+        if result.output_format == binary.FORMAT:
+            with result.stats.time(instrument.EMIT):
+                binary.save_circuit(result.circuit, output_filename, result.input_format,
+                                    [diagnostic.to_dict() for diagnostic in result.diagnostics])
+            return
+        with conversion.OutputSink(output_filename) as output:
+            output.write(result.code)
+
+    def read_source(self, input_filename, src, stack, stats):
+        """
+        Read a script file for convert or read_circuit. Files in formats whose reader has read_mapped are
+        memory mapped rather than read, so large generated scripts are never copied into a string
+        :param input_filename: Name of input file
+        :param src: Format of input script
+        :param stack: contextlib.ExitStack the file is mapped until the end of
+        :param stats: instrument.Stats to time reading in
+        :return: Input script as a string, or a bytes-like buffer
+        """
+        try:
+            with stats.time(instrument.READ):
+                if hasattr(frontends[src].Reader, "read_mapped"):
+                    return stack.enter_context(conversion.map_input_source(input_filename))
+                return conversion.read_input_source(input_filename)
+        except FileNotFoundError:
+            raise error_cqc.InputFileNotFoundError()
+
+    def convert_stream(self, input_filename, output_filename, src="projectq", dst="qutip"):
+        """
+        Convert a script file a part at a time, for scripts too large to hold in memory.
+        Output is the same as convert_file, except that it is never run through autopep8 or optimized
+        :param input_filename: Name of input file
+        :param output_filename: Name of output file, including extension
+        :param src: Format of input script
+        :param dst: Format to convert to
+        :return: Result of conversion, without the converted script or circuit
+        :raises error_cqc.ConversionError: If the script cannot be converted
+        """
+        from . import streaming
+        self.check_formats(src, dst, streamed=True)
+        error_log = self.error_log(input_filename)
+        reader = frontends[src].Reader("", self.verbose, self.debug, error_log)
+        try:
+            input_file = open(input_filename)
+        except FileNotFoundError:
+            raise error_cqc.InputFileNotFoundError()
+        stats = instrument.Stats()
+        # Output is only replaced once the whole script has converted
+        with input_file, conversion.OutputSink(output_filename) as output:
+            conversion.write_output_copyright(output, format_name(src), format_name(dst), comment(dst))
+            streaming.convert_stream(input_file, output, reader, frontends[dst], self.mark, error_log, stats=stats)
+        stats.count(instrument.UNTRANSLATED, error_log.errors)
+        return Result(None, error_log, None, src, dst, stats=stats)
+
+    def convert_incremental(self, input_filename, output_filename, src="projectq", dst="qutip"):
+        """
+        Convert a script file, only translating the top level statements which changed since the last
+        incremental conversion to the same output file. Translations are kept in a manifest next to the output.
+        The circuit is never optimized, as statements are translated separately
+        :param input_filename: Name of input file
+        :param output_filename: Name of output file, including extension
+        :param src: Format of input script
+        :param dst: Format to convert to
+        :return: Result of conversion, without the circuit
+        :raises error_cqc.ConversionError: If the script cannot be converted
+        """
+        from . import cache, incremental
+        self.check_formats(src, dst, streamed=True)
+        settings = [cache.get_code_version(), src, dst, self.mark]
+        manifest_filename = incremental.manifest_filename(output_filename)
+        units = {}
+        if os.path.exists(output_filename):
+            units = incremental.load_manifest(manifest_filename, settings)
+
+        error_log = self.error_log(input_filename)
+        reader = frontends[src].Reader("", self.verbose, self.debug, error_log)
+        try:
+            input_file = open(input_filename)
+        except FileNotFoundError:
+            raise error_cqc.InputFileNotFoundError()
+        stats = instrument.Stats()
+        with input_file:
+            body, units = incremental.convert_units(input_file, reader, frontends[dst], units, self.mark, error_log,
+                                                    stats)
+        reader.finish()
+
+        writer = frontends[dst]
+        with stats.time(instrument.EMIT):
+            output = conversion.OutputSink()
+            conversion.write_output_copyright(output, format_name(src), format_name(dst), comment(dst))
+            conversion.write_lines(output, writer.header_lines(reader.circuit.num_qubits) + body +
+                                   writer.footer_lines())
+            converted = output.getvalue()
+        if self.pep8:
+            with stats.time(instrument.FORMAT):
+                converted = conversion.format_source(converted)
+
+        with conversion.OutputSink(output_filename) as output:
+            output.write(converted)
+        incremental.save_manifest(manifest_filename, settings, units)
+        stats.count(instrument.UNTRANSLATED, error_log.errors)
+        return Result(converted, error_log, None, src, dst, stats=stats)
+
+
+def convert(source, src="projectq", dst="qutip", mark=True, pep8=False, passes=None):
+    """
+    Convert a whole script held in memory with default options
+    :param source: Input script as a string
+    :param src: Format of input script
+    :param dst: Format to convert to
+    :param mark: Add comments identifying untranslated lines
+    :param pep8: Format output with autopep8
+    :param passes: Names of optimization passes to run (default: none)
+    :return: Result of conversion
+    :raises error_cqc.ConversionError: If the script cannot be converted
+    """
+    return Converter(mark, pep8, passes=passes).convert(source, src, dst)
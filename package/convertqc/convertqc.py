@@ -18,17 +18,15 @@
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>
 
 import argparse   # Processing arguments
-import argcomplete
 import os         # Check for input file existing
-from . import process_projectq, error_cqc, process_qutip, conversion, process_qiskit
+import sys
+from . import binary, diagnostics, error_cqc, conversion, converter, instrument, plugins
 
-# List of possible input and output formats
+# List of built in input and output formats. Modules reading and writing each are only imported when used,
+# so starting up does not depend on how many formats there are. Installed packages can add more (see plugins.py),
+# which are only searched for when a format is not built in
 
-valid_program_types = [
-    'projectq',
-    'qutip',
-    'qiskit'
-]
+valid_program_types = list(plugins.formats) + [binary.FORMAT]
 
 filename = ""
 args = None
@@ -40,34 +38,125 @@ def main():
     :return: None
     """
 
+    # Subcommands have their own arguments
+    if sys.argv[1:2] == ["convert-dir"]:
+        from . import batch
+        batch.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["watch"]:
+        from . import watch
+        watch.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["serve"]:
+        from . import server
+        server.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["formats"]:
+        print_formats()
+        return
+
     process_args()
     if args.input_format == args.output_format:
         error_cqc.process_error(error_cqc.MATCHING_INPUT_OUTPUT, True)
-    convert_script()
-
-    autopep8_file(filename)
+    error_lines = convert_script()
 
     if args.error_log:
-        conversion.output_error_log()
+        conversion.output_error_log(error_lines)
 
 
 def convert_script():
     """
-    Calls separate script depending on script input format
-    :return: None
+    Reads the input script into a circuit, then writes the circuit in the output format
+    :return: Lines which could not be translated
     """
 
     if not os.path.exists(args.input_filename):
         error_cqc.process_error(error_cqc.INPUT_FILE_NOT_FOUND, True)
     set_output_filename()
-    autopep8_file(str(args.input_filename))
 
-    if args.input_format == "projectq":
-        process_projectq.process_projectq(args, filename)
-    elif args.input_format == "qutip":
-        process_qutip.process_qutip(args, filename)
-    elif args.input_format == "qiskit":
-        process_qiskit.process_qiskit(args, filename)
+    result_cache = None
+    if not args.no_cache:
+        from . import cache
+        result_cache = cache.ResultCache()
+    passes = None
+    if args.optimize:
+        from . import optimize
+        passes = optimize.PASSES
+    # Diagnostics are written out as they are found
+    diagnostic_writer = diagnostics.open_writer(args.diagnostics) if args.diagnostics else None
+    script_converter = converter.Converter(args.mark, args.pep8, args.verbose, args.debug, result_cache, passes,
+                                           diagnostic_writer, args.severity)
+    try:
+        if args.stream:
+            result = script_converter.convert_stream(args.input_filename, filename, args.input_format,
+                                                     args.output_format)
+        elif args.incremental:
+            result = script_converter.convert_incremental(args.input_filename, filename, args.input_format,
+                                                          args.output_format)
+        else:
+            result = script_converter.convert_file(args.input_filename, filename, args.input_format,
+                                                   args.output_format)
+    except error_cqc.ConversionError as e:
+        error_cqc.process_error(e.code, True)
+    finally:
+        if diagnostic_writer is not None:
+            diagnostic_writer.close()
+    if diagnostic_writer is not None and result.counts:
+        print("Diagnostics: " + diagnostics.format_counts(result.counts))
+    if result.optimization is not None and not args.verbose:
+        from . import optimize
+        print("Optimized circuit: " + optimize.format_stats(result.optimization))
+    if args.stats:
+        print(result.stats.format(args.stats))
+    return result.error_lines
+
+
+def print_formats():
+    """
+    Prints every format, including those added by installed packages, and what each can do
+    :return: None
+    """
+
+    print("{:<12}{:<22}{:<7}{:<7}{:<9}{}".format("format", "name", "reads", "writes", "streams", "gates written"))
+    for name in plugins.names():
+        try:
+            format_in = plugins.get_format(name)
+            gates = ", ".join(plugins.supported_gates(name)) if format_in.writes else ""
+        except (ImportError, KeyError):
+            print("{:<12}could not be loaded".format(name))
+            continue
+        print("{:<12}{:<22}{:<7}{:<7}{:<9}{}".format(name, format_in.display_name, yes_no(format_in.reads),
+                                                     yes_no(format_in.writes), yes_no(format_in.streams), gates))
+    print("{:<12}{:<22}{:<7}{:<7}{:<9}{}".format(binary.FORMAT, converter.CIRCUIT_FILE_NAME, "yes", "yes", "no",
+                                                 "any"))
+
+
+def yes_no(value):
+    return "yes" if value else "no"
+
+
+def check_format(parser, name):
+    """
+    Checks a format given on the command line is built in or added by an installed package, and can be loaded,
+    exiting if not
+    :param parser: ArgumentParser, to report the error with
+    :param name: Name of format
+    :return: None
+    """
+
+    if name == binary.FORMAT:
+        return
+    try:
+        plugins.load(name)
+    except KeyError:
+        parser.error("unknown format '" + name + "' (choose from " + ", ".join(plugins.names() + [binary.FORMAT]) +
+                     ", or run 'convertqc formats')")
+    except ImportError as e:
+        parser.error("format '" + name + "' could not be loaded - its package may be broken (" + str(e) + ")")
+
+
+def complete_formats(**kwargs):
+    return plugins.names() + [binary.FORMAT]
 
 
 def set_output_filename():
@@ -89,22 +178,13 @@ def set_output_filename():
             print("Output filename valid")
         filename = str(args.output_filename)
 
-    # Set the file extension. Currently only one option, but easy to expand in future
-    if args.output_format == "qutip" or args.output_format == "projectq" or args.output_format == "qiskit":
-        filename += ".py"
-        if args.debug:
-            print("Output filename: ", filename)
-
-
-def autopep8_file(name):
-    """
-    Runs autopep8 on specified filename
-    :param name: Filename to run autopep8 on (must be string)
-    :return:
-    """
-
-    command = "autopep8 " + name + " --in-place --aggressive --aggressive"
-    os.system(command)
+    # Set the file extension - scripts use their format's, circuits saved for later use their own
+    if args.output_format == binary.FORMAT:
+        filename += binary.EXTENSION
+    else:
+        filename += plugins.get_format(args.output_format).extension
+    if args.debug:
+        print("Output filename: ", filename)
 
 
 def process_args():
@@ -120,16 +200,17 @@ def process_args():
 
     # Reguired - input filename
     parser.add_argument("input_filename", help="input filename")
-    # Required - input format
+    # Required - input and output formats. Not given as choices, so formats added by installed packages
+    # are only searched for when one is used
+    formats = ", ".join(valid_program_types)
     parser.add_argument(
         "input_format",
-        help="input format of your script",
-        choices=valid_program_types)
-    # Required - output format
+        help="input format of your script: " + formats + ", or one added by a plugin (see 'convertqc formats')"
+    ).completer = complete_formats
     parser.add_argument(
         "output_format",
-        help="output format of your script",
-        choices=valid_program_types)
+        help="output format of your script: " + formats + ", or one added by a plugin"
+    ).completer = complete_formats
 
     # Optional - user defined output name
     parser.add_argument(
@@ -154,6 +235,55 @@ def process_args():
         "--error_log",
         help="disable outputting error log to file",
         action="store_false")
+    # Optional - format output with autopep8, in-process
+    parser.add_argument(
+        "-p",
+        "--pep8",
+        help="format output with autopep8 (must be installed)",
+        action="store_true")
+    # Optional - convert a part at a time, for very large scripts
+    parser.add_argument(
+        "-s",
+        "--stream",
+        help="convert large scripts a part at a time, with bounded memory (not formatted by autopep8)",
+        action="store_true")
+    # Optional - only translate statements changed since the last incremental conversion
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        help="only translate statements changed since the last incremental conversion to the same output file",
+        action="store_true")
+    # Optional - simplify the circuit before writing it
+    parser.add_argument(
+        "-O",
+        "--optimize",
+        help="cancel adjacent inverse gates, merge adjacent rotations and remove identity rotations "
+             "(not with -s or -i)",
+        action="store_true")
+    # Optional - always convert, ignoring results stored by earlier runs
+    parser.add_argument(
+        "--no-cache",
+        help="do not reuse or store conversion results in the cache (default: ~/.cache/convertqc)",
+        action="store_true")
+    # Optional - counters and time spent in each stage
+    parser.add_argument(
+        "--stats",
+        nargs="?",
+        const="table",
+        help="print the time spent in each stage of conversion, and counts of lines, parses and gates of each "
+             "type, as a table (default) or JSON",
+        choices=instrument.OUTPUT_FORMATS)
+    # Optional - structured diagnostics, for tools to read
+    parser.add_argument(
+        "--diagnostics",
+        metavar="FILE",
+        help="write every untranslated construct to FILE as JSON Lines, with its line, column, category and "
+             "a suggestion")
+    parser.add_argument(
+        "--severity",
+        help="least severe diagnostic to report (default: info)",
+        choices=diagnostics.SEVERITIES,
+        default=diagnostics.INFO)
     # Optional - debug mode
     parser.add_argument(
         "-d",
@@ -161,8 +291,13 @@ def process_args():
         help="enable debug mode",
         action="store_true")
 
-    argcomplete.autocomplete(parser)
+    # argcomplete is only needed while the shell is completing arguments, which it sets _ARGCOMPLETE for
+    if "_ARGCOMPLETE" in os.environ:
+        import argcomplete
+        argcomplete.autocomplete(parser)
     args = parser.parse_args()
+    check_format(parser, args.input_format)
+    check_format(parser, args.output_format)
 
     if args.debug:
         args.verbose = True
@@ -0,0 +1,209 @@
+#    Structured diagnostics for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import collections
+import json
+import threading
+
+# Severities, least severe first
+INFO = "info"
+WARNING = "warning"
+ERROR = "error"
+SEVERITIES = [INFO, WARNING, ERROR]
+
+# Categories of diagnostic
+UNTRANSLATED_STATEMENT = "untranslated-statement"
+UNTRANSLATED_BLOCK = "untranslated-block"
+NO_EQUIVALENT_GATE = "no-equivalent-gate"
+NO_EQUIVALENT_STATEMENT = "no-equivalent-statement"
+UNRESOLVED_QUBIT = "unresolved-qubit"
+UNRESOLVED_SIZE = "unresolved-size"
+OVERLAPPING_QUBITS = "overlapping-qubits"
+
+# What to do about each category
+SUGGESTIONS = {
+    UNTRANSLATED_STATEMENT: "Translate the statement by hand, or remove it if the output does not need it",
+    UNTRANSLATED_BLOCK: "Translate the block header by hand - the statements inside it were translated",
+    NO_EQUIVALENT_GATE: "Decompose the gate into gates the output format has",
+    NO_EQUIVALENT_STATEMENT: "Rewrite the statement as gates, as the output format has no equivalent",
+    UNRESOLVED_QUBIT: "Allocate the qubit before it is used, or pass it into the function as a parameter",
+    UNRESOLVED_SIZE: "Give the number of qubits as a positive whole number literal, so the register can be sized",
+    OVERLAPPING_QUBITS: "Control the gate with qubits other than the ones it is applied to"
+}
+
+# Diagnostics each ErrorLog keeps in memory. Any more are still counted and written out, but not kept
+MAX_RECORDS = 10000
+
+
+class Diagnostic:
+    """
+    One problem found while converting a script
+    """
+    __slots__ = ("file", "line", "column", "category", "severity", "source", "suggestion")
+
+    def __init__(self, file, line, column, category, severity, source, suggestion=""):
+        """
+        :param file: Name of input file, or "" if not converted from a file
+        :param line: Line number in input file
+        :param column: Column in input file, counting from 1, or 0 if not known
+        :param category: One of the categories above
+        :param severity: INFO, WARNING or ERROR
+        :param source: First line of the source it was found at
+        :param suggestion: What to do about it
+        """
+        self.file = file
+        self.line = line
+        self.column = column
+        self.category = category
+        self.severity = severity
+        self.source = source
+        self.suggestion = suggestion
+
+    def format(self):
+        """
+        :return: Line of the text error log, "<line number> - <source>"
+        """
+        return str(self.line) + " - " + self.source
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in Diagnostic.__slots__)
+
+    @staticmethod
+    def from_dict(data, file="", line_offset=0):
+        """
+        Rebuild a diagnostic stored with to_dict, e.g. in a cached result
+        :param data: Dictionary from to_dict
+        :param file: Name of the input file it is now reported for
+        :param line_offset: Lines the source has moved by since it was stored
+        :return: Diagnostic
+        """
+        return Diagnostic(file, data["line"] + line_offset, data["column"], data["category"], data["severity"],
+                          data["source"], data["suggestion"])
+
+
+class ErrorLog:
+    """
+    Diagnostics found during a single conversion.
+    Each conversion has its own, so conversions can run side by side. Diagnostics less severe than the
+    log's severity are ignored. Every diagnostic is counted by category and written to the log's writer
+    as it is found, but only the first `limit` are kept in memory
+    """
+    def __init__(self, file="", writer=None, severity=INFO, limit=MAX_RECORDS):
+        """
+        :param file: Name of input file, given to every diagnostic
+        :param writer: DiagnosticWriter to write diagnostics to as they are found, or None
+        :param severity: Least severe diagnostic to keep
+        :param limit: Most diagnostics kept in memory
+        """
+        self.file = file
+        self.writer = writer
+        self.level = SEVERITIES.index(severity)
+        self.limit = limit
+        self.records = []
+        self.counts = collections.Counter()
+        # Errors found, kept or not - the lines which could not be translated
+        self.errors = 0
+        # Diagnostics counted and written, but not kept
+        self.dropped = 0
+
+    def add(self, line_no, source, category=UNTRANSLATED_STATEMENT, column=0, severity=ERROR, suggestion=None):
+        """
+        :param line_no: Line number in input file
+        :param source: Source the problem was found at - only its first line is kept
+        :param category: One of the categories above
+        :param column: Column in input file, counting from 1, or 0 if not known
+        :param severity: INFO, WARNING or ERROR
+        :param suggestion: What to do about it (default: the suggestion for the category)
+        :return: None
+        """
+        if SEVERITIES.index(severity) < self.level:
+            return
+        source = str(source).strip().split("\n")[0]
+        if suggestion is None:
+            suggestion = SUGGESTIONS.get(category, "")
+        self.record(Diagnostic(self.file, line_no, column, category, severity, source, suggestion))
+
+    def record(self, diagnostic):
+        if SEVERITIES.index(diagnostic.severity) < self.level:
+            return
+        self.counts[diagnostic.category] += 1
+        if diagnostic.severity == ERROR:
+            self.errors += 1
+        if self.writer is not None:
+            self.writer.write(diagnostic)
+        if len(self.records) < self.limit:
+            self.records.append(diagnostic)
+        else:
+            self.dropped += 1
+
+    def extend(self, records, line_offset=0):
+        """
+        Add diagnostics stored with Diagnostic.to_dict, or kept by another log, as found in this log's file
+        :param records: Iterable of dictionaries or Diagnostics
+        :param line_offset: Lines the source has moved by since they were found
+        :return: None
+        """
+        for data in records:
+            if isinstance(data, Diagnostic):
+                data = data.to_dict()
+            self.record(Diagnostic.from_dict(data, self.file, line_offset))
+
+    def to_list(self):
+        return [diagnostic.to_dict() for diagnostic in self.records]
+
+    @property
+    def lines(self):
+        """
+        :return: Text error log lines of every error kept - the lines which could not be translated
+        """
+        return [diagnostic.format() for diagnostic in self.records if diagnostic.severity == ERROR]
+
+
+class DiagnosticWriter:
+    """
+    Writes diagnostics to a file as JSON Lines - one JSON object per line - as they are found.
+    Can be shared between threads, and between the logs of many conversions
+    """
+    def __init__(self, output_file):
+        """
+        :param output_file: Open text file to write to
+        """
+        self.output_file = output_file
+        self.lock = threading.Lock()
+
+    def write(self, diagnostic):
+        line = json.dumps(diagnostic.to_dict()) + "\n"
+        with self.lock:
+            self.output_file.write(line)
+
+    def close(self):
+        self.output_file.close()
+
+
+def open_writer(filename):
+    """
+    :param filename: Name of JSON Lines file to write diagnostics to
+    :return: DiagnosticWriter
+    """
+    return DiagnosticWriter(open(filename, "w"))
+
+
+def format_counts(counts):
+    """
+    :param counts: Counter of diagnostics by category
+    :return: Counts as text, most common first, e.g. "untranslated-statement: 3, no-equivalent-gate: 1"
+    """
+    return ", ".join(category + ": " + str(count) for category, count in counts.most_common())
@@ -18,20 +18,90 @@
 INPUT_FILE_NOT_FOUND = 1
 OUTPUT_FILENAME_INVALID_CHARACTER = 2
 MATCHING_INPUT_OUTPUT = 3
+INPUT_FILE_SYNTAX_ERROR = 4
+AUTOPEP8_NOT_INSTALLED = 5
+INPUT_DIRECTORY_NOT_FOUND = 6
+UNEXPECTED_CONVERSION_ERROR = 7
+UNSUPPORTED_FORMAT = 8
+INVALID_CIRCUIT_FILE = 9
+UNSUPPORTED_STREAMING = 10
+INVALID_REQUEST = 11
 
 QUTIP_NO_QUBIT_DEFINITIONS = 21
 
 forbidden_filename_chars = ['/', '<', '>', ':', '"', '\\', '|', '.', '?', '*']
 
 
+error_messages = {
+    1: "Input file not found",
+    2: "Output filename contains invalid characters",
+    3: "Input file format matches output file format",
+    4: "Input file could not be parsed in its input format",
+    5: "autopep8 is not installed - output left unformatted",
+    6: "Input directory not found",
+    7: "Unexpected error during conversion",
+    8: "Conversion between these formats is not supported yet",
+    9: "Input file is not a ConvertQC circuit file, or was made by a newer version",
+    10: "These formats cannot be converted a part at a time - convert the whole script instead",
+    11: "Request is not a JSON object with source, from and to",
+    21: "No qubits allocated in input script"
+}
+
+
+class ConversionError(Exception):
+    """
+    Raised by the library when a conversion cannot continue. The command line reports these with process_error.
+    Each error code has its own subclass below, so callers can catch only the errors they handle
+    """
+    code = UNEXPECTED_CONVERSION_ERROR
+
+    def __init__(self, code=None):
+        """
+        :param code: Error code (default: the code of the subclass)
+        """
+        if code is not None:
+            self.code = code
+        super().__init__(error_messages.get(self.code))
+
+    def __reduce__(self):
+        # Rebuilt from the code, e.g. when raised in a worker process
+        return type(self), (self.code,)
+
+
+class InputFileNotFoundError(ConversionError):
+    code = INPUT_FILE_NOT_FOUND
+
+
+class MatchingFormatsError(ConversionError):
+    code = MATCHING_INPUT_OUTPUT
+
+
+class InputSyntaxError(ConversionError):
+    code = INPUT_FILE_SYNTAX_ERROR
+
+
+class UnsupportedFormatError(ConversionError):
+    code = UNSUPPORTED_FORMAT
+
+
+class InvalidCircuitFileError(ConversionError):
+    code = INVALID_CIRCUIT_FILE
+
+
+class UnsupportedStreamingError(ConversionError):
+    code = UNSUPPORTED_STREAMING
+
+
+class InvalidRequestError(ConversionError):
+    code = INVALID_REQUEST
+
+
+class NoQubitsError(ConversionError):
+    code = QUTIP_NO_QUBIT_DEFINITIONS
+
+
 def process_error(code, is_fatal):
-    switch = {
-        1: "Input file not found",
-        2: "Output filename contains invalid characters",
-        3: "Input file format matches output file format",
-        21: "No qubits allocated in input script"
-    }
-    print_error(code, switch.get(code), is_fatal)
+    print_error(code, error_messages.get(code), is_fatal)
 
 
 def print_error(code, error_msg, is_fatal):
@@ -0,0 +1,236 @@
+#    Incremental re-conversion of changed statements for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import copy
+import hashlib
+import json
+import os
+import tempfile
+
+from . import conversion, error_cqc, instrument
+
+# Manifest of translated statements, kept next to the output file
+MANIFEST_SUFFIX = ".cqc.json"
+
+
+def manifest_filename(output_filename):
+    return output_filename + MANIFEST_SUFFIX
+
+
+def load_manifest(filename, settings):
+    """
+    Read the translated statements of an earlier conversion
+    :param filename: Name of manifest file
+    :param settings: Everything which changes every translation (converter version, formats, options)
+    :return: Dictionary of units, empty if there is no manifest or it was made with other settings
+    """
+    try:
+        with open(filename) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("settings") != settings:
+        return {}
+    return manifest.get("units", {})
+
+
+def save_manifest(filename, settings, units):
+    """
+    Write the translated statements of a conversion, replacing any earlier manifest in one step
+    :param filename: Name of manifest file
+    :param settings: Settings passed to load_manifest
+    :param units: Dictionary of units returned by convert_units
+    :return: None
+    """
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp")
+    with os.fdopen(handle, "w") as f:
+        json.dump({"settings": settings, "units": units}, f)
+    os.replace(temp_path, filename)
+
+
+def convert_units(input_file, reader, writer, units, mark=True, error_log=None, stats=None):
+    """
+    Translate a script one top level statement (unit) at a time, reusing the translation of every unit
+    whose source and incoming reader state match one in units. Only changed units are parsed and lowered.
+    Each unit keeps a digest of the reader state after it, and what it changed of the state (if anything),
+    so reusing a unit costs the same however many registers the script has, and the state is only set on
+    the reader again when a changed unit is reached
+    :param input_file: Open input file, or any iterable of lines
+    :param reader: ScriptReader of the input format
+    :param writer: Module of the output format, with script_lines
+    :param units: Dictionary of units from an earlier conversion
+    :param mark: Add comments identifying untranslated lines
+    :param error_log: ErrorLog to add the diagnostics of every unit to
+    :param stats: instrument.Stats to add to - only changed units are parsed, lowered and counted (default: none kept)
+    :return: Tuple of translated lines, and dictionary of units for the next conversion
+    """
+    if error_log is None:
+        error_log = conversion.ErrorLog()
+    if stats is None:
+        stats = instrument.Stats()
+    with stats.time(instrument.READ):
+        statements = list(reader.split_statements(input_file))
+    stats.count(instrument.LINES, sum(statement[2] for statement in statements))
+    lines = []
+    new_units = {}
+    state = get_state(reader)
+    digest = source_hash(json.dumps(state, sort_keys=True))
+    # Reused units have changed the state since it was last set on the reader
+    reader_behind = False
+
+    i = 0
+    while i < len(statements):
+        first_line = statements[i][0]
+        key = unit_key(statements[i][1], digest)
+        unit = units.get(key)
+        if unit is None or unit["hash"] != source_hash(join_statements(statements, i, unit["parts"])):
+            if reader_behind:
+                reader.set_state(state)
+                reader_behind = False
+            unit, state = translate_unit(statements, i, reader, writer, mark, stats, state, digest)
+        elif "delta" in unit:
+            apply_delta(state, unit["delta"])
+            reader_behind = True
+
+        new_units[key] = unit
+        lines.extend(unit["lines"])
+        error_log.extend(unit["errors"], first_line)
+        digest = unit["digest"]
+        i += unit["parts"]
+
+    if reader_behind:
+        reader.set_state(state)
+    return lines, new_units
+
+
+def translate_unit(statements, start, reader, writer, mark, stats, state, digest):
+    """
+    Parse, lower and translate the statement at start. A statement which only parses with those after it
+    (e.g. a string or bracket left open) is joined with them, doubling each time to keep this linear
+    :param statements: List of statements from the reader's split_statements
+    :param start: Position of statement
+    :param reader: ScriptReader of the input format
+    :param writer: Module of the output format
+    :param mark: Add comments identifying untranslated lines
+    :param stats: instrument.Stats to add to
+    :param state: Reader state before the unit, from get_state
+    :param digest: Digest of the reader state before the unit
+    :return: Tuple of new unit, and reader state after it
+    """
+    parts = 1
+    while True:
+        source = join_statements(statements, start, parts)
+        stats.count(instrument.PARSES)
+        try:
+            with stats.time(instrument.PRESCAN):
+                tree = reader.parse(source)
+            break
+        except SyntaxError:
+            if start + parts >= len(statements):
+                raise error_cqc.InputSyntaxError()
+            parts = min(parts * 2, len(statements) - start)
+
+    first_line = statements[start][0]
+    unit_log = conversion.ErrorLog()
+    reader.error_log = unit_log
+    with stats.time(instrument.CONVERT):
+        part = reader.read_chunk(source, first_line, tree)
+    stats.count_gates(part)
+    with stats.time(instrument.EMIT):
+        lines = writer.script_lines(part, mark, unit_log)
+
+    # Diagnostics are kept relative to the unit, as earlier changes can move it
+    errors = unit_log.to_list()
+    for error in errors:
+        error["line"] -= first_line
+    unit = {
+        "parts": parts,
+        "hash": source_hash(source),
+        "digest": digest,
+        "lines": lines,
+        "errors": errors
+    }
+    new_state = get_state(reader)
+    delta = state_delta(state, new_state)
+    if delta:
+        unit["delta"] = delta
+        unit["digest"] = source_hash(digest + "\n" + json.dumps(delta, sort_keys=True))
+    return unit, new_state
+
+
+def get_state(reader):
+    """
+    :param reader: ScriptReader
+    :return: Reader state as it is stored in a manifest - only JSON types, and sharing nothing with the reader
+    """
+    return json.loads(json.dumps(reader.get_state()))
+
+
+def state_delta(old, new):
+    """
+    What a unit changed of the reader state. Readers mostly add registers and names to their state, so lists
+    which grew are stored as the items added, and dictionaries as the entries added or changed
+    :param old: State before unit
+    :param new: State after unit
+    :return: Dictionary from each changed key of the state, to a list of how it changed and the change
+    """
+    delta = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if value == previous:
+            continue
+        if isinstance(value, list) and isinstance(previous, list) and value[:len(previous)] == previous:
+            delta[key] = ["extend", value[len(previous):]]
+        elif isinstance(value, dict) and isinstance(previous, dict) and previous.keys() <= value.keys():
+            delta[key] = ["update", dict((name, item) for name, item in value.items()
+                                         if name not in previous or previous[name] != item)]
+        else:
+            delta[key] = ["set", value]
+    return delta
+
+
+def apply_delta(state, delta):
+    """
+    Change a state in place, as the unit a delta was found for did
+    :param state: State before unit
+    :param delta: Dictionary from state_delta
+    :return: None
+    """
+    for key, (change, value) in delta.items():
+        if change == "extend":
+            state[key].extend(copy.deepcopy(value))
+        elif change == "update":
+            state[key].update(copy.deepcopy(value))
+        else:
+            state[key] = copy.deepcopy(value)
+
+
+def join_statements(statements, start, parts):
+    return "".join(statement[1] for statement in statements[start:start + parts])
+
+
+def source_hash(source):
+    return hashlib.sha256(source.encode("utf-8", "surrogateescape")).hexdigest()
+
+
+def unit_key(source, digest):
+    """
+    A statement translates the same way whenever its source and the reader state before it are the same
+    :param source: Source of first statement of unit
+    :param digest: Digest of reader state before unit
+    :return: Key of unit
+    """
+    return source_hash(digest + "\n" + source)
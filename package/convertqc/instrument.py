@@ -0,0 +1,167 @@
+#    Conversion counters and stage timers for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import collections
+import json
+import time
+
+from . import circuit
+
+# Stages of a conversion, in order: reading the input file, parsing (or splitting) it, lowering it into a circuit
+# (and optimizing it), writing the circuit out as a script, and formatting the script with autopep8
+READ = "read"
+PRESCAN = "pre-scan"
+CONVERT = "convert"
+EMIT = "emit"
+FORMAT = "format"
+STAGES = [READ, PRESCAN, CONVERT, EMIT, FORMAT]
+
+# Counters
+LINES = "lines"
+PARSES = "parses"
+GATES = "gates"
+UNTRANSLATED = "untranslated"
+# Gates of each type are counted as "gates.<name>", named as in conversion.describe_gate, e.g. "gates.C-X"
+GATE_PREFIX = GATES + "."
+
+# Formats --stats can print in
+OUTPUT_FORMATS = ["table", "json"]
+# Bytes of a memory mapped script searched for line ends at a time
+COUNT_BLOCK_SIZE = 1024 * 1024
+
+
+class Stats:
+    """
+    Counters and stage timers of one or more conversions.
+    Each conversion fills in its own, so conversions can run side by side. Timing a stage reads the clock twice,
+    and counting is a dictionary update, so stats are always collected
+    """
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.timers = dict.fromkeys(STAGES, 0.0)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def time(self, stage):
+        """
+        Time a stage, adding to any earlier time of the same stage:
+            with stats.time(instrument.EMIT):
+                ...
+        :param stage: One of STAGES
+        :return: Context manager
+        """
+        return StageTimer(self.timers, stage)
+
+    def count_gates(self, circuit_in):
+        """
+        Count the gates of a circuit, by type
+        :param circuit_in: Circuit
+        :return: None
+        """
+        for (op, controls), number in collections.Counter(zip(circuit_in.ops, circuit_in.controls)).items():
+            if op >= circuit.FIRST_GATE:
+                self.counters[GATES] += number
+                self.counters[GATE_PREFIX + gate_name(op, controls)] += number
+
+    def count_lines(self, source):
+        """
+        :param source: Input script as a string, or as bytes (e.g. a memory mapped file)
+        :return: None
+        """
+        if isinstance(source, str):
+            lines = source.count("\n")
+            newline = "\n"
+        else:
+            # Memory maps cannot be searched in place, so are copied a block at a time
+            lines = sum(source[start:start + COUNT_BLOCK_SIZE].count(b"\n")
+                        for start in range(0, len(source), COUNT_BLOCK_SIZE))
+            newline = b"\n"
+        if len(source) and source[-1:] != newline:
+            lines += 1
+        self.counters[LINES] += lines
+
+    def merge(self, other):
+        """
+        Add the counters and timers of other, e.g. to total a batch of conversions
+        :param other: Stats, or dictionary from to_dict
+        :return: None
+        """
+        if isinstance(other, Stats):
+            other = other.to_dict()
+        self.counters.update(other["counters"])
+        for stage, seconds in other["timers"].items():
+            self.timers[stage] = self.timers.get(stage, 0.0) + seconds
+
+    def to_dict(self):
+        return {"counters": dict(self.counters), "timers": dict(self.timers)}
+
+    def format_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    def format_table(self):
+        """
+        :return: Lines of a table of stage times, then counters - gate types most common first
+        """
+        lines = ["Stage        Seconds"]
+        lines.extend(stage.ljust(12) + " " + format(seconds, ".6f") for stage, seconds in self.timers.items())
+        lines.append("total".ljust(12) + " " + format(sum(self.timers.values()), ".6f"))
+        lines.append("")
+        lines.append("Counter                Count")
+        for name in (LINES, PARSES, GATES, UNTRANSLATED):
+            lines.append(name.ljust(22) + " " + str(self.counters[name]))
+        gates = sorted((item for item in self.counters.items() if item[0].startswith(GATE_PREFIX)),
+                       key=lambda item: (-item[1], item[0]))
+        lines.extend(("  " + name[len(GATE_PREFIX):]).ljust(22) + " " + str(number) for name, number in gates)
+        return lines
+
+    def format(self, output_format="table"):
+        """
+        :param output_format: One of OUTPUT_FORMATS
+        :return: Stats as text
+        """
+        if output_format == "json":
+            return self.format_json()
+        return "\n".join(self.format_table())
+
+
+class StageTimer:
+    """
+    Adds the time spent inside a with statement to a stage timer
+    """
+    __slots__ = ("timers", "stage", "start")
+
+    def __init__(self, timers, stage):
+        self.timers = timers
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timers[self.stage] += time.perf_counter() - self.start
+
+
+def gate_name(op, controls):
+    """
+    :param op: Gate opcode
+    :param controls: Number of control qubits
+    :return: Name of gate, prefixed by a C for each control, e.g. "CC-X"
+    """
+    name = circuit.opcode_names.get(op, str(op))
+    return "C" * controls + "-" + name if controls else name
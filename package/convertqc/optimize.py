@@ -0,0 +1,276 @@
+#    Circuit optimization passes for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import ast
+import math
+from fractions import Fraction
+
+from . import circuit, conversion
+
+# Passes, in the order they are listed in stats
+CANCEL = "cancel"  # Remove adjacent pairs of gates which undo each other (X X, CNOT CNOT, S Sdag...)
+MERGE = "merge"  # Merge adjacent rotations about the same axis by adding their angles
+IDENTITY = "identity"  # Remove rotations by a multiple of a full turn
+PASSES = [CANCEL, MERGE, IDENTITY]
+
+# Gates which are their own inverse - barriers are kept, as they only separate other gates
+SELF_INVERSE = conversion.SELF_INVERSE - {circuit.BARRIER}
+# Rotation gates, and the angle after which each is the identity, even when controlled
+ROTATIONS = {circuit.RX: 4 * math.pi, circuit.RY: 4 * math.pi, circuit.RZ: 4 * math.pi, circuit.PHASE: 2 * math.pi}
+# Gates whose targets can be given in any order
+SYMMETRIC = {circuit.SWAP, circuit.SQRTSWAP, circuit.ISWAP}
+
+# Names an angle may use for pi
+PI_NAMES = {"pi", "np.pi", "numpy.pi", "math.pi"}
+
+
+def optimize_circuit(circuit_in, passes=PASSES):
+    """
+    Remove and merge gates which have no effect together, in a single pass over the circuit.
+    Only gates next to each other on the same qubits are combined - gates on other qubits may come between them,
+    but any other script entry (a statement, block, measurement...) ends the sequence, as does a change of depth.
+    A gate on a symbolic qubit (e.g. a function parameter) could be any qubit, so only combines with the gate
+    directly before it
+    :param circuit_in: Circuit to optimize
+    :param passes: Names of passes to run (default: all of PASSES)
+    :return: Tuple of optimized circuit, and dictionary of gates removed by each pass
+    """
+    stats = dict((name, 0) for name in PASSES if name in passes)
+    ops = circuit_in.ops
+    depths = circuit_in.depths
+    keep = bytearray(b"\x01") * len(ops)
+    # Gate parameters changed by merging
+    params = {}
+
+    run_depth = None
+    # Live gates of the current sequence on each qubit, in order
+    wires = {}
+    # Live gates of the current sequence, in order, and those on symbolic qubits
+    order = []
+    symbolic = []
+    # Qubits and comparison key of each live gate in the current sequence
+    gate_qubits = {}
+    gate_keys = {}
+
+    for i in range(len(ops)):
+        op = ops[i]
+        if op < circuit.FIRST_GATE or depths[i] != run_depth:
+            if op == circuit.BLANK or op == circuit.COMMENT:
+                continue
+            # Start a new sequence
+            run_depth = depths[i] if op >= circuit.FIRST_GATE else None
+            wires = {}
+            order = []
+            symbolic = []
+            gate_qubits = {}
+            gate_keys = {}
+            if op < circuit.FIRST_GATE:
+                continue
+
+        param = circuit_in.param(i)
+        if IDENTITY in stats and op in ROTATIONS and is_identity(op, param):
+            keep[i] = 0
+            stats[IDENTITY] += 1
+            continue
+
+        controls, targets = circuit_in.qubits(i)
+        qubits = controls + targets
+        key = (frozenset(controls), frozenset(targets) if op in SYMMETRIC else targets)
+        is_symbolic = any(not isinstance(qubit, int) for qubit in qubits)
+        previous = find_previous(qubits, is_symbolic, wires, order, symbolic, keep)
+
+        if previous is not None and gate_keys[previous] == key:
+            previous_op = ops[previous]
+            inverse = previous_op == op and op in SELF_INVERSE or conversion.INVERSES.get(previous_op) == op
+            if CANCEL in stats and inverse:
+                remove(previous, gate_qubits, wires, keep)
+                keep[i] = 0
+                stats[CANCEL] += 2
+                continue
+            if MERGE in stats and previous_op == op and op in ROTATIONS:
+                angle = add_angles(params.get(previous, circuit_in.param(previous)), param)
+                keep[i] = 0
+                stats[MERGE] += 1
+                if IDENTITY in stats and is_identity(op, angle):
+                    remove(previous, gate_qubits, wires, keep)
+                    stats[IDENTITY] += 1
+                else:
+                    params[previous] = angle
+                continue
+
+        for qubit in qubits:
+            wires.setdefault(qubit, []).append(i)
+        order.append(i)
+        if is_symbolic:
+            symbolic.append(i)
+        gate_qubits[i] = qubits
+        gate_keys[i] = key
+
+    return copy_circuit(circuit_in, keep, params), stats
+
+
+def find_previous(qubits, is_symbolic, wires, order, symbolic, keep):
+    """
+    Find the live gate a gate could combine with - the last gate on all of its qubits
+    :return: Position of gate, or None if there is none
+    """
+    if is_symbolic:
+        while order and not keep[order[-1]]:
+            order.pop()
+        return order[-1] if order else None
+
+    previous = None
+    for qubit in qubits:
+        gates = wires.get(qubit)
+        if not gates or (previous is not None and gates[-1] != previous):
+            return None
+        previous = gates[-1]
+    while symbolic and not keep[symbolic[-1]]:
+        symbolic.pop()
+    if symbolic and symbolic[-1] > previous:
+        # A symbolic qubit since may have been any of these
+        return None
+    return previous
+
+
+def remove(position, gate_qubits, wires, keep):
+    # A gate being combined is always the last live gate on each of its qubits
+    keep[position] = 0
+    for qubit in gate_qubits.pop(position):
+        wires[qubit].pop()
+
+
+def copy_circuit(circuit_in, keep, params):
+    """
+    Copy the kept entries of a circuit into a new circuit
+    :param circuit_in: Circuit to copy
+    :param keep: Whether to keep each entry
+    :param params: Replacement gate parameters, by position
+    :return: New circuit
+    """
+    result = circuit.Circuit(circuit_in.num_qubits)
+    result.qubit_names = list(circuit_in.qubit_names)
+    ops = circuit_in.ops
+    for i in range(len(ops)):
+        if not keep[i]:
+            continue
+        op = ops[i]
+        if op >= circuit.FIRST_GATE:
+            controls, targets = circuit_in.qubits(i)
+            result.add_gate(op, targets, controls, params.get(i, circuit_in.param(i)), circuit_in.depths[i],
+                            circuit_in.lines[i])
+        else:
+            result.add_text(op, circuit_in.text(i), circuit_in.depths[i], circuit_in.lines[i])
+    return result
+
+
+def angle_value(expression):
+    """
+    Work out the value of an angle made of numbers and pi
+    :param expression: Angle expression
+    :return: Value as float, or None if it depends on anything else
+    """
+    try:
+        node = ast.parse(expression, mode="eval").body
+    except SyntaxError:
+        return None
+    return evaluate(node)
+
+
+def evaluate(node):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return float(node.value)
+    if isinstance(node, (ast.Name, ast.Attribute)) and ast.unparse(node) in PI_NAMES:
+        return math.pi
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = evaluate(node.operand)
+        if value is None:
+            return None
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+        left = evaluate(node.left)
+        right = evaluate(node.right)
+        if left is None or right is None or (isinstance(node.op, ast.Div) and right == 0):
+            return None
+        if isinstance(node.op, ast.Add):
+            return left + right
+        if isinstance(node.op, ast.Sub):
+            return left - right
+        if isinstance(node.op, ast.Mult):
+            return left * right
+        return left / right
+    return None
+
+
+def add_angles(first, second):
+    """
+    Add two angles, working out the sum if both are numbers and pi
+    :param first: Angle expression
+    :param second: Angle expression
+    :return: Expression of sum
+    """
+    first_value = angle_value(first)
+    second_value = angle_value(second)
+    if first_value is not None and second_value is not None:
+        return format_angle(first_value + second_value)
+    # Unparsing a sum of both trees adds any brackets needed
+    return ast.unparse(ast.BinOp(ast.parse(first, mode="eval").body, ast.Add(), ast.parse(second, mode="eval").body))
+
+
+def format_angle(value):
+    """
+    Write an angle as a simple fraction of pi where it is one, e.g. 3 * pi / 4
+    :param value: Angle
+    :return: Angle expression
+    """
+    fraction = Fraction(value / math.pi).limit_denominator(1024)
+    if abs(float(fraction) * math.pi - value) > 1e-9:
+        return repr(value)
+    if fraction == 0:
+        return "0"
+    numerator = fraction.numerator
+    if numerator == 1:
+        text = "pi"
+    elif numerator == -1:
+        text = "-pi"
+    else:
+        text = str(numerator) + " * pi"
+    if fraction.denominator != 1:
+        text += " / " + str(fraction.denominator)
+    return text
+
+
+def is_identity(op, angle):
+    """
+    Check whether a rotation has no effect
+    :param op: Rotation opcode
+    :param angle: Angle expression
+    :return: True if angle is a multiple of a full turn of the gate
+    """
+    value = angle_value(angle) if angle is not None else None
+    if value is None:
+        return False
+    turns = value / ROTATIONS[op]
+    return abs(turns - round(turns)) < 1e-9
+
+
+def format_stats(stats):
+    """
+    :param stats: Dictionary of gates removed by each pass
+    :return: One line summary
+    """
+    return ", ".join(name + " removed " + str(removed) + (" gate" if removed == 1 else " gates")
+                     for name, removed in stats.items())
@@ -0,0 +1,192 @@
+#    Registry of script formats for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import importlib
+from collections.abc import Mapping
+
+# Entry point group other packages add formats under. Each entry point names a Format, e.g. in setup.py
+#     entry_points={'convertqc.formats': ['cirq = convertqc_cirq:FORMAT']}
+ENTRY_POINT_GROUP = "convertqc.formats"
+
+
+class Format:
+    """
+    A script format, the module which reads and/or writes it, and what that module can do.
+    The module is only imported the first time a conversion uses the format, so converting between two
+    formats never imports the others
+    """
+    __slots__ = ("module_name", "display_name", "extension", "reads", "writes", "streams", "gates")
+
+    def __init__(self, module_name, display_name, extension=".py", reads=True, writes=True, streams=True,
+                 gates=None):
+        """
+        :param module_name: Full name of module, e.g. "convertqc.process_projectq"
+        :param display_name: Name of format, used in the output file header
+        :param extension: Extension of script files in the format
+        :param reads: Module reads scripts - it has read_script and a Reader class
+        :param writes: Module writes scripts - it has write_script, header_lines, footer_lines and script_lines
+        :param streams: Module can read and write a statement at a time, so supports streamed (-s) and
+                        incremental (-i) conversion
+        :param gates: Names of the gates written, as instrument.gate_name gives them (e.g. "C-X"), or None to
+                      take them from the module's write_templates
+        """
+        self.module_name = module_name
+        self.display_name = display_name
+        self.extension = extension
+        self.reads = reads
+        self.writes = writes
+        self.streams = streams
+        self.gates = gates
+
+
+# Formats scripts are read from and written to, by name. Formats added by other packages are only added
+# once a format is asked for which is not here
+formats = {
+    'projectq': Format('convertqc.process_projectq', 'ProjectQ'),
+    'qutip': Format('convertqc.process_qutip', 'QuTiP'),
+    'qiskit': Format('convertqc.process_qiskit', 'Qiskit'),
+    'qasm': Format('convertqc.process_qasm', 'OpenQASM 2.0', '.qasm'),
+    'qasm3': Format('convertqc.process_qasm3', 'OpenQASM 3.0', '.qasm')
+}
+
+# Entry points of formats added by other packages, by name, or None if installed packages have not been
+# searched yet. Each is loaded the first time its format is asked for
+entry_points = None
+
+
+def register(name, module_name, display_name, extension=".py", **capabilities):
+    """
+    Add a script format, or replace one.
+    Its module needs the same functions as the process_ modules for what it can do. If it is not written
+    as Python, it also needs COMMENT, its line comment
+    :param name: Name of format, as given on the command line
+    :param module_name: Full name of module reading and/or writing the format
+    :param display_name: Name of format, used in the output file header
+    :param extension: Extension of script files in the format
+    :param capabilities: reads, writes, streams and gates, as taken by Format
+    :return: None
+    """
+    formats[name] = Format(module_name, display_name, extension, **capabilities)
+
+
+def discover():
+    """
+    Find the formats installed packages add, without loading them. Only done once
+    :return: Dictionary of entry points by format name
+    """
+    global entry_points
+    if entry_points is None:
+        # Searching installed packages takes longer than starting up, so is only done when needed
+        import importlib.metadata
+        found = importlib.metadata.entry_points()
+        if hasattr(found, "select"):
+            found = found.select(group=ENTRY_POINT_GROUP)
+        else:
+            # Python 3.9 gives a dictionary of groups
+            found = found.get(ENTRY_POINT_GROUP, [])
+        entry_points = {entry_point.name: entry_point for entry_point in found}
+    return entry_points
+
+
+def get_format(name):
+    """
+    :param name: Name of format
+    :return: Format, loaded from its entry point if an installed package adds it
+    :raises KeyError: If no format has the name
+    """
+    if name not in formats:
+        entry_point = discover()[name]
+        loaded = entry_point.load()
+        if not isinstance(loaded, Format):
+            raise KeyError(name)
+        formats[name] = loaded
+    return formats[name]
+
+
+def names():
+    """
+    :return: Names of every format, including those installed packages add
+    """
+    return list(formats) + [name for name in discover() if name not in formats]
+
+
+def load(name):
+    """
+    :param name: Name of format
+    :return: Module reading and/or writing the format, imported if this is the first time it is used
+    :raises KeyError: If no format has the name
+    """
+    return importlib.import_module(get_format(name).module_name)
+
+
+def supported_gates(name):
+    """
+    :param name: Name of format
+    :return: Names of gates the format's module writes, e.g. "C-X" - "Cn-X" for any number of controls
+    """
+    from . import instrument
+    format_in = get_format(name)
+    if format_in.gates is not None:
+        return list(format_in.gates)
+    module = load(name)
+    gates = [instrument.gate_name(op, controls) for op, controls in getattr(module, "write_templates", {})]
+    gates.extend("Cn-" + instrument.gate_name(op, 0) for op in getattr(module, "controlled_templates", {}))
+    return gates
+
+
+class Modules(Mapping):
+    """
+    Module of each format, by name. Modules are imported as they are looked up
+    """
+    def capable(self, format_in):
+        return True
+
+    def __getitem__(self, name):
+        if not self.capable(get_format(name)):
+            raise KeyError(name)
+        return load(name)
+
+    def __contains__(self, name):
+        # Built in formats are checked without importing anything. A format whose package is broken is left out
+        try:
+            return self.capable(get_format(name))
+        except (KeyError, ImportError):
+            return False
+
+    def __iter__(self):
+        return (name for name in names() if name in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class Functions(Modules):
+    """
+    One function of each module able to do something, by name, e.g. read_script of every format read
+    """
+    def __init__(self, function_name, capability):
+        """
+        :param function_name: Name of function
+        :param capability: Attribute of Format the module needs, e.g. "reads"
+        """
+        self.function_name = function_name
+        self.capability = capability
+
+    def capable(self, format_in):
+        return getattr(format_in, self.capability)
+
+    def __getitem__(self, name):
+        return getattr(super().__getitem__(name), self.function_name)
@@ -1,4 +1,4 @@
-#    Functions for translating from ProjectQ to QuTiP
+#    Functions for reading and writing ProjectQ scripts
 #    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
 #
 #    This program is free software: you can redistribute it and/or modify
@@ -14,429 +14,485 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>
 
-import sys
-import re
-from . import conversion
 import ast
-
-file_as_list = []
-args = None
-filename = ""
-output_file = None
-qubits = []
-current_function = ""
-line_is_expression = False
-dagger_next_line = False
-meta_whitespace = ""
-current_line_no = 0
-
-
-def process_projectq(input_args, output_filename):
+from . import circuit, conversion, diagnostics
+
+# Meta functions which wrap a block of gates
+meta_tags = ["Dagger", "Control"]
+
+# ProjectQ gates read into the circuit, as ((name, qubits used), (opcode, control qubits), angle handling).
+# Control qubits come before targets
+read_gate_table = [
+    (("H", 1), (circuit.H, 0), circuit.ANY_ANGLE),
+    (("X", 1), (circuit.X, 0), circuit.ANY_ANGLE),
+    (("Y", 1), (circuit.Y, 0), circuit.ANY_ANGLE),
+    (("Z", 1), (circuit.Z, 0), circuit.ANY_ANGLE),
+    (("S", 1), (circuit.S, 0), circuit.ANY_ANGLE),
+    (("Sdag", 1), (circuit.SDAG, 0), circuit.ANY_ANGLE),
+    (("T", 1), (circuit.T, 0), circuit.ANY_ANGLE),
+    (("Tdag", 1), (circuit.TDAG, 0), circuit.ANY_ANGLE),
+    (("SqrtX", 1), (circuit.SQRTX, 0), circuit.ANY_ANGLE),
+    (("Rx", 1), (circuit.RX, 0), circuit.ANGLE),
+    (("Ry", 1), (circuit.RY, 0), circuit.ANGLE),
+    (("Rz", 1), (circuit.RZ, 0), circuit.ANGLE),
+    (("R", 1), (circuit.PHASE, 0), circuit.ANGLE),
+    (("CNOT", 2), (circuit.X, 1), circuit.ANY_ANGLE),
+    (("CX", 2), (circuit.X, 1), circuit.ANY_ANGLE),
+    (("CZ", 2), (circuit.Z, 1), circuit.ANY_ANGLE),
+    (("Toffoli", 3), (circuit.X, 2), circuit.ANY_ANGLE),
+    (("Swap", 2), (circuit.SWAP, 0), circuit.ANY_ANGLE),
+    (("SqrtSwap", 2), (circuit.SQRTSWAP, 0), circuit.ANY_ANGLE),
+    (("Measure", 1), (circuit.MEASURE, 0), circuit.ANY_ANGLE)
+]
+read_gates = circuit.compile_gate_table(read_gate_table)
+
+# Circuit gates written as ProjectQ, with {0} standing for the gate parameter
+write_gate_names = {
+    circuit.H: "H",
+    circuit.X: "X",
+    circuit.Y: "Y",
+    circuit.Z: "Z",
+    circuit.S: "S",
+    circuit.SDAG: "Sdag",
+    circuit.T: "T",
+    circuit.TDAG: "Tdag",
+    circuit.SQRTX: "SqrtX",
+    circuit.RX: "Rx({0})",
+    circuit.RY: "Ry({0})",
+    circuit.RZ: "Rz({0})",
+    circuit.PHASE: "R({0})",
+    circuit.SWAP: "Swap",
+    circuit.SQRTSWAP: "SqrtSwap",
+    circuit.MEASURE: "Measure",
+    circuit.BARRIER: "Barrier"
+}
+# Controlled gates with a ProjectQ name of their own, by (opcode, control qubits)
+write_controlled_names = {
+    (circuit.X, 1): "CNOT",
+    (circuit.X, 2): "Toffoli",
+    (circuit.Z, 1): "CZ"
+}
+
+
+def compile_write_templates():
     """
-    Entry point for converting from ProjectQ
-    :param input_args: Input arguments from command line call
-    :param output_filename: Desired name of output file
-    :return: None
+    Build the format templates of every gate written, with {0} the gate parameter, {1} the qubits
+    and {2} the number of controls
+    :return: Tuple of templates by (opcode, control qubits), and templates of other controlled gates by opcode
     """
-    global args
-    global filename
-    global output_file
-    global file_as_list
-    args = input_args
-    filename = output_filename
-    if args.verbose:
-        print("Processing ProjectQ input file...")
+    templates = {(op, 0): name + " | {1}" for op, name in write_gate_names.items()}
+    templates.update((key, name + " | {1}") for key, name in write_controlled_names.items())
+    controlled = {op: "C(" + name + ", {2}) | {1}" for op, name in write_gate_names.items()
+                  if op not in circuit.NON_UNITARY}
+    return templates, controlled
+
 
-    output_file = conversion.open_output_file(filename)
-    file_as_list = conversion.read_input_file(args.input_filename)
-    conversion.write_output_copyright(output_file, "ProjectQ", "QuTiP")
-    print_imports()
-    convert_script()
-    conversion.close_output_file(output_file)
+write_templates, controlled_templates = compile_write_templates()
 
 
-def check_for_qubits():
+def read_script(source, verbose=False, debug=False, error_log=None):
     """
-    Searches the input file for relevant lines adding qubits to a system
-    :return: Number of qubits
+    Lower a whole ProjectQ script into a circuit with a single parse and a single tree pass
+    :param source: ProjectQ script as a string
+    :param verbose: Run in verbose mode
+    :param debug: Run in debug mode
+    :param error_log: ErrorLog to add untranslated lines to
+    :return: Circuit of the script
     """
-    qubit_count = 0
-    for line in file_as_list:
-        if ".allocate_qubit()" in line and line[0] is not "#":
-            qubit_count += 1
-            qubits.append(line.strip().split()[0])
-    if args.verbose:
-        conversion.verbose_print(current_line_no, "Qubits counted: " + str(qubit_count))
-    return qubit_count
+    if verbose:
+        print("Processing ProjectQ input file...")
+    return Reader(source, verbose, debug, error_log).read()
 
 
-def convert_gate(line):
+def write_script(circuit_in, output_file, mark=True, error_log=None):
     """
-    Convert quantum gates into appropriate format
-    :param line: Line to translate
+    Write a circuit out as a ProjectQ script
+    :param circuit_in: Circuit to write
+    :param output_file: Output file to write to
+    :param mark: Add comments identifying untranslated lines
+    :param error_log: ErrorLog to add gates with no equivalent to
     :return: None
     """
-    whitespace = conversion.get_leading_spaces(line)
-
-    split_line = line.strip().split()
-    gate = split_line[0]
-    if args.debug:
-        print("Gate - " + gate)
-
-    # Pauli-X
-    if gate == "X":
-        qubit = get_qubit_from_list(split_line[2])
-        rotation_gate(whitespace, "X", qubit, "pi")
-    # Pauli-Y
-    elif gate == "Y":
-        qubit = get_qubit_from_list(split_line[2])
-        rotation_gate(whitespace, "Y", qubit, "pi")
-    # Pauli-Z
-    elif gate == "Z":
-        qubit = get_qubit_from_list(split_line[2])
-        rotation_gate(whitespace, "Z", qubit, "pi")
-    elif gate == "H":
-        print(whitespace +
-              "quantum_circuit.add_gate(\"SNOT\", " +
-              str(get_qubit_from_list(split_line[2])) +
-              ")", file=output_file, end='')
-    # elif gate == "Measure":
-    # print("TEMPORARY MEASURE")
-    elif gate == "CNOT":
-        invalid_chars = "(,) "
-        qubit_one = split_line[2]
-        qubit_two = split_line[3]
-        for char in invalid_chars:
-            qubit_one = qubit_one.replace(char, "")
-        for char in invalid_chars:
-            qubit_two = qubit_two.replace(char, "")
-        print(
-            whitespace +
-            "quantum_circuit.add_gate(\"CNOT\", " +
-            qubit_one +
-            ", " +
-            qubit_two +
-            ")",
-            file=output_file,
-            end='')
-    # Non-Pauli Rotation Gate
-    elif gate[0] == "R" and (gate[1] == "x" or gate[1] == "y" or gate[1] == "z"):
-        # Find the string between the two brackets
-        angle = gate[gate.find("(") + 1:gate.find(")")]
-        rotation_gate(
-            whitespace, str(
-                gate[1]).upper(), angle, str(
-                get_qubit_from_list(
-                    split_line[2])))
-    # C-Phase Gate
-    elif gate[0] == "R" and (gate[1] == "("):
-        if args.mark:
-            print("# Unknown formatting of below line: Please manually check", file=output_file)
-        rotation = line[line.find("R(")+2:line.find(")")]
-        qubit = line[line.find("|")+1:].strip()
-        print(conversion.get_leading_spaces(line) + "quantum_circuit.add_gate(\"CPHASE\", " + qubit + ", " + rotation
-              + ")", file=output_file)
-
-
-def rotation_gate(whitespace, orientation, qubit, angle):
+    lines = header_lines(circuit_in.num_qubits)
+    lines.extend(script_lines(circuit_in, mark, error_log))
+    lines.extend(footer_lines())
+    conversion.write_lines(output_file, lines)
+
+
+def header_lines(num_qubits):
     """
-    Handles conversion for all rotation gates
-    :param whitespace: Whitespace of translated line to maintain control
-    :param orientation: Direction of rotation
-    :param qubit: Qubit to apply rotation to
-    :param angle: Angle of rotation
-    :return: None
+    Imports, engine and register written before the converted script
+    :param num_qubits: Size of register
+    :return: List of lines
     """
-    if orientation == "X":
-        print(
-            whitespace +
-            "quantum_circuit.add_gate(\"RX\", " +
-            str(qubit) +
-            ", " +
-            str(angle) +
-            ")",
-            file=output_file,
-            end='')
-        if args.debug:
-            print(
-                "Converted to: quantum_circuit.add_gate(\"RX\", " +
-                str(qubit) +
-                ", " +
-                str(angle) +
-                ")", )
-    elif orientation == "Y":
-        print(
-            whitespace +
-            "quantum_circuit.add_gate(\"RY\", " +
-            str(qubit) +
-            ", " +
-            str(angle) +
-            ")",
-            file=output_file,
-            end='')
-        if args.debug:
-            print(
-                "Converted to: quantum_circuit.add_gate(\"RY\", " +
-                str(qubit) +
-                ", " +
-                str(angle) +
-                ")", )
-    elif orientation == "Z":
-        print(
-            whitespace +
-            "quantum_circuit.add_gate(\"RZ\", " +
-            str(qubit) +
-            ", " +
-            str(angle) +
-            ")",
-            file=output_file,
-            end='')
-        if args.debug:
-            print("Converted to: quantum_circuit.add_gate(\"RZ\", " +
-                  str(qubit) +
-                  ", " +
-                  str(angle) +
-                  ")")
-
-
-def get_qubit_from_list(qubit_name):
+    return [
+        "",
+        "from numpy import pi",
+        "from projectq import MainEngine",
+        "from projectq.ops import *",
+        "",
+        "eng = MainEngine()",
+        "qureg = eng.allocate_qureg(" + str(num_qubits) + ")",
+        ""
+    ]
+
+
+def footer_lines():
     """
-    ProjectQ qubits are named objects, whilst QuTiP is a position in an array
-    This function converts from object to position based on the list from earlier
-    :param qubit_name: Name of qubit in ProjectQ
-    :return: Position of input qubit in array
+    Lines written after the converted script
+    :return: List of lines
     """
-    try:
-        # Qubit in the list found by searching input file
-        return qubits.index(qubit_name)
-    except BaseException:
-        # Qubit not in list - possible function parameter
+    return [
+        "",
+        "eng.flush()",
+        "",
+        "# TODO - Add desired measurements"
+    ]
+
 
-        # https://stackoverflow.com/questions/1059559/split-strings-into-words-with-multiple-word-boundary-delimiters
-        split_line = re.findall(r"[\w']+", qubit_name)
-        if qubit_name in split_line:
-            return qubit_name
+def script_lines(circuit_in, mark=True, error_log=None):
+    return conversion.script_lines(circuit_in, write_gate, mark, error_log)
 
 
-def process_variable_definition(line):
+def write_gate(circuit_in, index):
     """
-    Checks for certain lines and whether they're needed in QuTiP.
-    Will later be expanded
-    :param line: Line to convert
-    :return: True if conversion needed, False otherwise
+    Translate a single gate into ProjectQ
+    :param circuit_in: Circuit containing gate
+    :param index: Position of gate
+    :return: Translated line, or None if no ProjectQ equivalent
     """
-    if "allocate_qubit(" in line:
-        # Allocate qubit not needed in QuTiP
-        return False
-    else:
-        return True
+    op = circuit_in.ops[index]
+    controls, targets = circuit_in.qubits(index)
+    template = write_templates.get((op, len(controls)))
+    if template is None and controls:
+        template = controlled_templates.get(op)
+    if template is None:
+        return None
+    return template.format(circuit_in.param(index), get_qubit_tuple(controls + targets), len(controls))
 
 
-def convert_script():
+def get_qubit_tuple(qubits):
     """
-    Run through all input lines and convert (if able) to desired output
-    :return: None
+    Format the qubits a gate is applied to
+    :param qubits: Circuit qubits - positions or symbolic index expressions
+    :return: Single qubit, or tuple of qubits, from the output register
     """
-    global current_function
-    # Flag to add a dagger (inversion) to next line
-    global dagger_next_line
-
-    global current_line_no
-
-    defined_variables = []
-
-    current_line_no = 1
+    if len(qubits) == 1:
+        return "qureg[" + str(qubits[0]) + "]"
+    return "(" + ", ".join("qureg[" + str(qubit) + "]" for qubit in qubits) + ")"
 
-    for line in file_as_list:
-        sys.stdout.flush()
-        split_line = line.split()
-        whitespace = conversion.get_leading_spaces(line)
-        new_line = whitespace + line.strip()
-
-        # empty line
-        if not split_line:
-            print(file=output_file, end='')
-        else:
-            if args.verbose:
-                print()
-                print(current_line_no, end='')
-                print(": " + line.rstrip())
-
-            # function definition
-            if split_line[0] == "def":
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Function definition - copying verbatim")
-                current_function = line
-                defined_variables.clear()
-                print(new_line, file=output_file, end='')
-
-            # imports
-            elif split_line[0] == "from" or split_line[0] == "import":
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Import statement - ignoring")
-                print(file=output_file, end='')
-
-            # comments - copy as standard
-            elif split_line[0] == "#":
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Comment - ignoring")
-                print(new_line, file=output_file, end='')
-
-            # variable definitions - **
-            elif " = " in line:
-                defined_variables.append(split_line[0])
-                process_variable_definition(line)
-
-            # if statement
-            elif split_line[0] == "if":
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "If statement - copied verbatim")
-                print(new_line, file=output_file, end='')
-
-            # print statements
-            elif "print(" in line:
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Print statement - copied verbatim")
-                print(new_line, file=output_file, end='')
-
-            # pipe operator:
-            elif " | " in line:
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Gate detected - processing")
-                convert_gate(new_line)
-
-            # meta function
-            elif "with" in line:
-                if args.verbose:
-                    print(str(current_line_no) + ": Meta gate (", end='')
-                if "Dagger" in line:
-                    if args.verbose:
-                        print("DAGGER) detected")
-                    process_meta_tag(line, "Dagger")
-                elif "Control" in line:
-                    if args.verbose:
-                        print("CONTROL) detected")
-                    process_meta_tag(line, "Control")
-
-            # return line
-            elif "return " in line:
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Return statement - processing")
-                process_return(defined_variables, line)
-
-            # function call
-            elif check_for_function_call(line.strip()):
-                print(new_line, file=output_file, end='')
-
-            else:
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Unsure how to translate line. Copying verbatim and "
-                                                              "adding to error log")
-                conversion.untranslateable_line(current_line_no, line, args.mark, output_file)
-
-            if dagger_next_line is True:
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Adding dagger control")
-                dagger_next_line = False
-                print(".dag()", file=output_file)
-            else:
-                print(file=output_file)
 
-        current_line_no += 1
-
-
-def check_for_function_call(line):
+def get_gate_name(node):
     """
-    Use abstract syntax tree to identify if line is a function call
-    :param line: Line to check
-    :return: True if expression, False if not
+    Split a gate expression into its name and parameter, e.g. Rz(pi / 2) into "Rz" and "pi / 2"
+    :param node: Gate expression
+    :return: Tuple of name (None if not a simple gate) and parameter expression (None if no parameter)
     """
-    global line_is_expression
-
-    if args.verbose:
-        conversion.verbose_print(current_line_no, "Checking if line is function call")
-
-    tree = ast.parse(line)
-    visitor = Visitor()
-    visitor.visit(tree)
-    if line_is_expression:
-        # Will have been set True by NodeVisitor
-        if args.verbose:
-            conversion.verbose_print(current_line_no, "Line is function call - copying verbatim")
-        line_is_expression = False
-        return True
-    else:
-        return False
+    if isinstance(node, ast.Call):
+        return conversion.get_call_name(node), ast.unparse(node.args[0]) if node.args else None
+    return getattr(node, "id", None), None
 
 
-def process_return(variables, line):
+def get_gate(gate, angle, qubits):
     """
-    Handles return statements
-    :param variables: Parameters of function line is part of
-    :param line: Line to check
-    :return: None
+    Find the circuit gate for a ProjectQ gate
+    :param gate: Name of ProjectQ gate
+    :param angle: Gate parameter expression, or None
+    :param qubits: Circuit qubits the gate is applied to
+    :return: Tuple of opcode, controls, targets and parameter, or None if no equivalent
     """
-    if not variables:
-        if "True" in line or "False" in line:
-            print(line, file=output_file)
-        else:
-            print(conversion.get_leading_spaces(line) + "# Originally returned variables, no longer needed",
-                  file=output_file)
-    elif any(var in line for var in variables):
-        # returning variables defined in function
-        print(line, file=output_file)
-    else:
-        print(conversion.get_leading_spaces(line) + "# Originally returned variables, no longer needed",
-              file=output_file)
+    entry = read_gates.get((gate, len(qubits), angle is not None))
+    if entry is None:
+        return None
+    (op, controls), keep_angle = entry
+    return op, qubits[:controls], qubits[controls:], angle if keep_angle else None
 
 
-def process_meta_tag(line, tag):
+def is_gate_block(statements):
     """
-    Checks meta tags such as Control or Dagger
-    :param line: Line to translate
-    :param tag: Name of control function to handle
-    :return:
+    Check whether a block only applies gates, so it can be unrolled
+    :param statements: Body of block
+    :return: True if every statement is a gate, a pass or a meta block of only gates
     """
-    global dagger_next_line
-    global meta_whitespace
-    global current_meta
-
-    meta_whitespace = conversion.get_leading_spaces(line)
-    if tag == "Dagger":
-        if args.verbose:
-            conversion.verbose_print(current_line_no, "Dagger meta detected")
-        current_meta = "Dagger"
-        dagger_next_line = True
-    if tag == "Control":
-        if args.verbose:
-            conversion.verbose_print(current_line_no, "Control meta detected")
-        current_meta = "Control"
-
-
-def print_imports():
+    for statement in statements:
+        if isinstance(statement, ast.Pass):
+            continue
+        if isinstance(statement, ast.Expr) and isinstance(statement.value, ast.BinOp) \
+                and isinstance(statement.value.op, ast.BitOr):
+            continue
+        if isinstance(statement, ast.With) and is_gate_block(statement.body) \
+                and all(conversion.get_call_name(item.context_expr) in meta_tags for item in statement.items):
+            continue
+        return False
+    return True
+
+
+class Reader(conversion.ScriptReader):
     """
-    Prints required imports for QuTiP
-    Future work will extract this to separate conversion file
-    :return: None
+    Lowers a ProjectQ syntax tree into a circuit.
+    Gates applied with the pipe operator become circuit gates; engine and allocation statements are removed
     """
+    def __init__(self, source, verbose=False, debug=False, error_log=None):
+        super().__init__(source, verbose, debug, error_log)
+        self.symbols = conversion.SymbolTable()
+        # Qubits of the Control blocks being unrolled, added as controls of every gate in them
+        self.meta_controls = []
+        # Meta blocks being unrolled, outermost first
+        self.unrolling = 0
+        self.current_function = ""
+
+    def read_chunk(self, source, first_line=1, tree=None):
+        result = super().read_chunk(source, first_line, tree)
+        result.qubit_names = list(self.symbols.names)
+        return result
+
+    def get_state(self):
+        state = super().get_state()
+        state.update(self.symbols.get_state())
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.symbols.set_state(state)
+
+    def visit_Import(self, node):
+        if self.verbose:
+            conversion.verbose_print(node.lineno, "Import statement - ignoring")
+
+    visit_ImportFrom = visit_Import
+
+    def visit_FunctionDef(self, node):
+        if self.verbose:
+            conversion.verbose_print(node.lineno, "Function definition - copying verbatim")
+        self.current_function = node.name
+        arguments = node.args
+        parameters = arguments.posonlyargs + arguments.args + arguments.kwonlyargs
+        parameters += [argument for argument in (arguments.vararg, arguments.kwarg) if argument is not None]
+        self.symbols.push_scope(parameter.arg for parameter in parameters)
+        self.lower_block(node)
+        self.symbols.pop_scope()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Assign(self, node):
+        call_name = conversion.get_call_name(node.value)
+        size = 1 if call_name == "allocate_qubit" else None
+        if call_name == "allocate_qureg" and len(node.value.args) == 1:
+            size = conversion.get_int(node.value.args[0])
+            if size is not False and size < 1:
+                # Not a register ProjectQ can allocate - kept, and reported rather than read as one
+                self.add_statement(node)
+                self.error_log.add(node.lineno, self.get_segment(node), diagnostics.UNRESOLVED_SIZE,
+                                   node.value.args[0].col_offset + 1)
+                return
+        if size and all(isinstance(target, ast.Name) for target in node.targets):
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Qubit allocation - adding to circuit")
+            for target in node.targets:
+                self.symbols.allocate(target.id, size)
+            self.circuit.num_qubits = max(self.circuit.num_qubits, len(self.symbols.names))
+        elif call_name == "MainEngine":
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Engine definition - ignoring")
+        elif all(self.is_qubit(target) for target in node.targets):
+            # Qubits returned from a function call - no longer needed
+            pass
+        else:
+            self.add_statement(node)
 
-    if args.verbose:
-        conversion.verbose_print(current_line_no, "Printing import statements and basic lines")
-
-    print(file=output_file)
-    print("from numpy import pi", file=output_file)
-    print("from qutip import *", file=output_file)
-    print(file=output_file)
-    print("quantum_circuit = QubitCircuit(" +
-          str(check_for_qubits()) + ")", file=output_file)
-    print(file=output_file)
+    def visit_Delete(self, node):
+        if not all(self.is_qubit(target) for target in node.targets):
+            self.add_statement(node)
 
+    def visit_Return(self, node):
+        if node.value is not None and self.is_qubit(node.value):
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Return of qubits - removing")
+            self.add_comment(node, "# Originally returned variables, no longer needed")
+        else:
+            self.add_statement(node)
+
+    def visit_With(self, node):
+        tags = [conversion.get_call_name(item.context_expr) for item in node.items]
+        if not any(tag in meta_tags for tag in tags):
+            self.lower_block(node)
+        elif all(tag in meta_tags for tag in tags) and is_gate_block(node.body) and self.unroll_meta_block(node):
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Meta gate detected - unrolled into gates")
+        elif self.unrolling:
+            # The block being unrolled around it cannot be unrolled either, so is lowered again without it
+            self.add_untranslated(node)
+        else:
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Meta gate detected - unable to translate block header")
+            self.lower_block(node, untranslated=True)
+
+    def unroll_meta_block(self, node):
+        """
+        Lower the body of Dagger and Control blocks straight into gates, in a single pass over the body.
+        Control adds its qubits as controls of every gate in the body; Dagger reverses the order of the gates
+        in the body and inverts each one. Nested blocks are unrolled as they are lowered
+        :param node: With statement of only meta functions, whose body is only gates and other meta blocks
+        :return: True if unrolled, False (with nothing added) if a gate in the body could not be unrolled
+        """
+        start = len(self.circuit)
+        next_line = self.next_line
+        controls = len(self.meta_controls)
+        # Diagnostics are only kept if the block is unrolled
+        error_log = self.error_log
+        self.error_log = diagnostics.ErrorLog(error_log.file)
+
+        dagger = False
+        for item in node.items:
+            call = item.context_expr
+            if conversion.get_call_name(call) == "Dagger":
+                dagger = True
+            elif len(call.args) == 2:
+                self.meta_controls.extend(self.get_qubits(call.args[1]))
+            else:
+                del self.meta_controls[controls:]
+                self.error_log = error_log
+                return False
+
+        # The block header is kept as a comment, above the gates it became
+        self.add_comment(node, "# " + self.get_segment(node).split("\n")[0] + " - unrolled")
+        self.next_line = max(self.next_line, node.lineno + 1)
+        self.unrolling += 1
+        self.lower_body([statement for statement in node.body if not isinstance(statement, ast.Pass)])
+        self.unrolling -= 1
+        del self.meta_controls[controls:]
+
+        ops = self.circuit.ops
+        unrolled = all(op >= circuit.FIRST_GATE or op == circuit.BLANK or op == circuit.COMMENT
+                       for op in ops[start + 1:])
+        if unrolled and dagger:
+            unrolled = self.invert_gates(start + 1)
+        block_log, self.error_log = self.error_log, error_log
+        if unrolled:
+            self.error_log.extend(block_log.records)
+        else:
+            self.error_log.extend(record for record in block_log.records
+                                  if record.category == diagnostics.OVERLAPPING_QUBITS)
+            self.circuit.truncate(start)
+            self.next_line = next_line
+        return unrolled
+
+    def invert_gates(self, start):
+        """
+        Replace the gates from a position on with their inverses, in reverse order.
+        Comments and blank lines stay above the gates which followed them, so each group of gates
+        is reversed along with the comments describing it
+        :param start: Position of first entry
+        :return: True if inverted, False (with nothing changed) if a gate has no inverse
+        """
+        circuit_in = self.circuit
+        # Lists of comments and blank lines, each followed by the gates after them
+        groups = []
+        for i in range(start, len(circuit_in)):
+            op = circuit_in.ops[i]
+            if op < circuit.FIRST_GATE:
+                if not groups or groups[-1][1]:
+                    groups.append(([], []))
+                groups[-1][0].append((op, circuit_in.text(i), circuit_in.depths[i], circuit_in.lines[i]))
+                continue
+            inverse = conversion.invert_gate(op, circuit_in.param(i))
+            if inverse is None:
+                return False
+            if not groups:
+                groups.append(([], []))
+            controls, targets = circuit_in.qubits(i)
+            groups[-1][1].append((inverse, controls, targets, circuit_in.depths[i], circuit_in.lines[i]))
+
+        circuit_in.truncate(start)
+        for entries, gates in reversed(groups):
+            for op, text, depth, line in entries:
+                circuit_in.add_text(op, text, depth, line)
+            for (op, param), controls, targets, depth, line in reversed(gates):
+                circuit_in.add_gate(op, targets, controls, param, depth, line)
+        return True
 
-class Visitor(ast.NodeVisitor):
-    """
-    Overwrites the NodeVisitor class to perform particular functions based on their type
-    """
     def visit_Expr(self, node):
-        global line_is_expression
-        line_is_expression = True
-        self.generic_visit(node)
+        value = node.value
+        # pipe operator
+        if isinstance(value, ast.BinOp) and isinstance(value.op, ast.BitOr):
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Gate detected - processing")
+            self.convert_gate(node)
+        elif conversion.get_call_name(value) == "flush":
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Engine flush - ignoring")
+        else:
+            # Function calls and print statements copied verbatim
+            self.add_statement(node)
+
+    def convert_gate(self, node):
+        """
+        Convert quantum gates into circuit gates
+        :param node: Expression statement applying a gate with the pipe operator
+        :return: None
+        """
+        operator = node.value.left
+        qubits = self.get_qubits(node.value.right)
+        gate, angle = get_gate_name(operator)
+        if self.debug:
+            conversion.debug_print(node.lineno, "Gate - %s", gate)
+
+        if gate == "All" and isinstance(operator, ast.Call) and len(operator.args) == 1:
+            # Gate applied to each qubit in turn
+            gate, angle = get_gate_name(operator.args[0])
+            gates = [get_gate(gate, angle, [qubit]) for qubit in qubits]
+        else:
+            gates = [get_gate(gate, angle, qubits)]
+
+        if not gates or None in gates:
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Unsure how to translate gate. Copying verbatim and adding "
+                                                      "to error log")
+            self.add_untranslated(node)
+            return
+        for op, controls, targets, param in gates:
+            self.add_gate(node, op, targets, controls, param)
+
+    def add_gate(self, node, op, targets, controls=(), param=None):
+        if self.meta_controls:
+            controls = self.meta_controls + list(controls)
+            qubits = controls + list(targets)
+            if len(set(qubits)) < len(qubits):
+                # Kept by unroll_meta_block, unlike the other diagnostics of a block it could not unroll
+                self.error_log.add(node.lineno, self.get_segment(node), diagnostics.OVERLAPPING_QUBITS,
+                                   node.col_offset + 1)
+            if op in circuit.NON_UNITARY or len(set(qubits)) < len(qubits):
+                # No controlled version - leaves the block to be kept as it is
+                self.add_untranslated(node)
+                return
+        super().add_gate(node, op, targets, controls, param)
+
+    def get_qubits(self, operand):
+        """
+        ProjectQ qubits are named objects, whilst the circuit uses positions in a register.
+        Find the positions of every qubit a gate is applied to, using the symbol table.
+        Qubits which are neither allocated nor function parameters are logged as warnings
+        :param operand: Right hand side of the pipe operator - a qubit expression or tuple of them
+        :return: List of circuit qubits - positions, or expressions where not allocated (e.g. function parameter)
+        """
+        qubits = []
+        for element in operand.elts if isinstance(operand, (ast.Tuple, ast.List)) else [operand]:
+            resolution = self.symbols.resolve(element)
+            if not resolution.resolved:
+                if self.verbose:
+                    conversion.verbose_print(element.lineno, "Qubit not allocated or a parameter: %s",
+                                             resolution.expression)
+                self.error_log.add(element.lineno, resolution.expression, diagnostics.UNRESOLVED_QUBIT,
+                                   element.col_offset + 1, diagnostics.WARNING)
+            qubits.extend(resolution.qubits)
+        return qubits
+
+    def is_qubit(self, node):
+        """
+        Check whether an expression only refers to allocated qubits
+        :param node: Expression to check
+        :return: True if all names in expression are qubits
+        """
+        if isinstance(node, ast.Tuple):
+            return bool(node.elts) and all(self.is_qubit(element) for element in node.elts)
+        return isinstance(node, ast.Name) and self.symbols.lookup(node.id) is not None
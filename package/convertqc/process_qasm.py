@@ -0,0 +1,619 @@
+#    Functions for converting to and from OpenQASM for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import re
+
+from . import circuit
+from . import conversion
+from . import diagnostics
+
+# OpenQASM 2.0 and 3.0 are both read here, and 2.0 written - process_qasm3 writes 3.0.
+# QASM has one statement per gate, so scripts are split into statements with a tokenizer rather than parsed
+
+COMMENT = "//"
+
+# Code which decides where a statement ends - comments, strings, brackets and semicolons - and runs of anything else
+SYNTAX = re.compile(r'//|/\*|\*/|"[^"\n]*"|[{};]|[^\s/*"{};]+|[/*]')
+COMMENTS = re.compile(r"//[^\n]*|/\*.*?\*/", re.S)
+
+# Statements read, matched against the statement with comments removed
+HEADER = re.compile(r'(?:OPENQASM\s+[\d.]+|include\s+"[^"]*")\s*;')
+QREG = re.compile(r"qreg\s+([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\]\s*;")
+QUBIT = re.compile(r"qubit\s*(?:\[\s*(\d+)\s*\])?\s+([A-Za-z_]\w*)\s*;")
+CREG = re.compile(r"(?:creg\s+[A-Za-z_]\w*\s*\[\s*\d+\s*\]|bit\s*(?:\[\s*\d+\s*\])?\s+[A-Za-z_]\w*)\s*;")
+MEASURE = re.compile(r"(?:[^=;]+=\s*)?measure\s+([^;]+?)(?:\s*->\s*[^;]+?)?\s*;")
+BARRIER = re.compile(r"barrier\s+([^;]+?)\s*;")
+GATE = re.compile(r"([A-Za-z_]\w*)\s*(?:\((.*)\))?\s*([^;]*?)\s*;", re.S)
+ARGUMENT = re.compile(r"([A-Za-z_]\w*)\s*(?:\[\s*(\d+)\s*\])?")
+
+# QASM gates read into the circuit, as ((name, qubits), (opcode, controls), angle handling).
+# Names are those of qelib1.inc (2.0) and stdgates.inc (3.0)
+read_gate_table = [
+    (("h", 1), (circuit.H, 0), circuit.NO_ANGLE),
+    (("x", 1), (circuit.X, 0), circuit.NO_ANGLE),
+    (("y", 1), (circuit.Y, 0), circuit.NO_ANGLE),
+    (("z", 1), (circuit.Z, 0), circuit.NO_ANGLE),
+    (("s", 1), (circuit.S, 0), circuit.NO_ANGLE),
+    (("sdg", 1), (circuit.SDAG, 0), circuit.NO_ANGLE),
+    (("t", 1), (circuit.T, 0), circuit.NO_ANGLE),
+    (("tdg", 1), (circuit.TDAG, 0), circuit.NO_ANGLE),
+    (("sx", 1), (circuit.SQRTX, 0), circuit.NO_ANGLE),
+    (("rx", 1), (circuit.RX, 0), circuit.ANGLE),
+    (("ry", 1), (circuit.RY, 0), circuit.ANGLE),
+    (("rz", 1), (circuit.RZ, 0), circuit.ANGLE),
+    (("p", 1), (circuit.PHASE, 0), circuit.ANGLE),
+    (("u1", 1), (circuit.PHASE, 0), circuit.ANGLE),
+    (("phase", 1), (circuit.PHASE, 0), circuit.ANGLE),
+    (("swap", 2), (circuit.SWAP, 0), circuit.NO_ANGLE),
+    (("CX", 2), (circuit.X, 1), circuit.NO_ANGLE),
+    (("cx", 2), (circuit.X, 1), circuit.NO_ANGLE),
+    (("cy", 2), (circuit.Y, 1), circuit.NO_ANGLE),
+    (("cz", 2), (circuit.Z, 1), circuit.NO_ANGLE),
+    (("ch", 2), (circuit.H, 1), circuit.NO_ANGLE),
+    (("crx", 2), (circuit.RX, 1), circuit.ANGLE),
+    (("cry", 2), (circuit.RY, 1), circuit.ANGLE),
+    (("crz", 2), (circuit.RZ, 1), circuit.ANGLE),
+    (("cp", 2), (circuit.PHASE, 1), circuit.ANGLE),
+    (("cu1", 2), (circuit.PHASE, 1), circuit.ANGLE),
+    (("cphase", 2), (circuit.PHASE, 1), circuit.ANGLE),
+    (("ccx", 3), (circuit.X, 2), circuit.NO_ANGLE),
+    (("cswap", 3), (circuit.SWAP, 1), circuit.NO_ANGLE)
+]
+read_gates = circuit.compile_gate_table(read_gate_table)
+
+# Circuit gates written as OpenQASM 2.0, by (opcode, controls) - {0} stands for the gate parameter
+write_gate_names = {
+    (circuit.H, 0): "h",
+    (circuit.X, 0): "x",
+    (circuit.Y, 0): "y",
+    (circuit.Z, 0): "z",
+    (circuit.S, 0): "s",
+    (circuit.SDAG, 0): "sdg",
+    (circuit.T, 0): "t",
+    (circuit.TDAG, 0): "tdg",
+    (circuit.SQRTX, 0): "sx",
+    (circuit.RX, 0): "rx({0})",
+    (circuit.RY, 0): "ry({0})",
+    (circuit.RZ, 0): "rz({0})",
+    (circuit.PHASE, 0): "u1({0})",
+    (circuit.SWAP, 0): "swap",
+    (circuit.X, 1): "cx",
+    (circuit.Y, 1): "cy",
+    (circuit.Z, 1): "cz",
+    (circuit.H, 1): "ch",
+    (circuit.RX, 1): "crx({0})",
+    (circuit.RY, 1): "cry({0})",
+    (circuit.RZ, 1): "crz({0})",
+    (circuit.PHASE, 1): "cu1({0})",
+    (circuit.X, 2): "ccx",
+    (circuit.SWAP, 1): "cswap"
+}
+# Measurements are made into the classical bit of the same position - {2} stands for the qubit position
+MEASURE_TEMPLATE = "measure {1} -> c[{2}];"
+
+# Gates acting on two target qubits - every other gate but a barrier acts on one
+TWO_TARGETS = {circuit.SWAP, circuit.SQRTSWAP, circuit.ISWAP}
+PI_NAMES = re.compile(r"\b(?:numpy|np|math)\.pi\b")
+
+
+def compile_write_templates(gate_names, measure_template):
+    """
+    Build the format templates of every gate written, with {0} the gate parameter, {1} the qubits
+    and {2} the position of the first qubit
+    :param gate_names: Gate names by (opcode, controls)
+    :param measure_template: Template of measurements
+    :return: Dictionary of templates by (opcode, controls)
+    """
+    templates = dict((key, name + " {1};") for key, name in gate_names.items())
+    templates[circuit.MEASURE, 0] = measure_template
+    templates[circuit.BARRIER, 0] = "barrier {1};"
+    return templates
+
+
+write_templates = compile_write_templates(write_gate_names, MEASURE_TEMPLATE)
+
+
+def read_script(source, verbose=False, debug=False, error_log=None):
+    """
+    Lower a whole OpenQASM 2.0 or 3.0 script into a circuit, without parsing it as Python
+    :param source: QASM script as a string
+    :param verbose: Run in verbose mode
+    :param debug: Run in debug mode
+    :param error_log: ErrorLog to add untranslated lines to
+    :return: Circuit of the script
+    """
+    if debug:
+        print("Processing OpenQASM input file...")
+    return Reader(source, verbose, debug, error_log).read()
+
+
+def write_script(circuit_in, output_file, mark=True, error_log=None):
+    """
+    Write a circuit out as an OpenQASM 2.0 script
+    :param circuit_in: Circuit to write
+    :param output_file: Output file to write to
+    :param mark: Add comments identifying untranslated lines
+    :param error_log: ErrorLog to add entries with no equivalent to
+    :return: None
+    """
+    lines = header_lines(circuit_in.num_qubits)
+    lines.extend(script_lines(circuit_in, mark, error_log))
+    lines.extend(footer_lines())
+    conversion.write_lines(output_file, lines)
+
+
+def header_lines(num_qubits):
+    """
+    Version, gate library and registers written before the converted script
+    :param num_qubits: Size of register
+    :return: List of lines
+    """
+    return [
+        "",
+        "OPENQASM 2.0;",
+        "include \"qelib1.inc\";",
+        "",
+        "qreg q[" + str(num_qubits) + "];",
+        "creg c[" + str(num_qubits) + "];",
+        ""
+    ]
+
+
+def footer_lines():
+    """
+    Lines written after the converted script - none needed for QASM
+    :return: List of lines
+    """
+    return []
+
+
+def script_lines(circuit_in, mark=True, error_log=None):
+    return translate_lines(circuit_in, write_gate, mark, error_log)
+
+
+def write_gate(circuit_in, index):
+    """
+    Translate a single gate into an OpenQASM 2.0 statement
+    :param circuit_in: Circuit containing gate
+    :param index: Position of gate
+    :return: Translated line, or None if no QASM equivalent
+    """
+    return format_gate(write_templates, circuit_in, index)
+
+
+def format_gate(templates, circuit_in, index):
+    """
+    Translate a single gate into a QASM statement. QASM has no symbolic qubits, so gates on them are not translated
+    :param templates: Templates of the QASM version written, from compile_write_templates
+    :param circuit_in: Circuit containing gate
+    :param index: Position of gate
+    :return: Translated line, or None if no QASM equivalent
+    """
+    op = circuit_in.ops[index]
+    controls, targets = circuit_in.qubits(index)
+    template = templates.get((op, len(controls)))
+    if template is None or (op != circuit.BARRIER and len(targets) != (2 if op in TWO_TARGETS else 1)):
+        return None
+    qubits = controls + targets
+    if not all(isinstance(qubit, int) for qubit in qubits):
+        return None
+    param = circuit_in.param(index)
+    if param is not None:
+        param = PI_NAMES.sub("pi", param)
+    return template.format(param, ", ".join("q[" + str(qubit) + "]" for qubit in qubits), qubits[0])
+
+
+def translate_lines(circuit_in, write_gate_function, mark=True, error_log=None):
+    """
+    Translate every entry of a circuit into lines of a QASM script.
+    QASM has no Python statements or blocks, so these - and any gates inside blocks - are kept as comments
+    and added to the error log, as are gates with no QASM equivalent
+    :param circuit_in: Circuit to write
+    :param write_gate_function: Function taking the circuit and a gate position, returning the translated line,
+                                or None if it has none
+    :param mark: Add comments identifying untranslated lines
+    :param error_log: ErrorLog to add untranslated entries to
+    :return: List of lines, without line breaks
+    """
+    if error_log is None:
+        error_log = conversion.ErrorLog()
+    lines = []
+    ops = circuit_in.ops
+    depths = circuit_in.depths
+
+    for i in range(len(ops)):
+        op = ops[i]
+        depth = depths[i]
+        if op == circuit.BLANK:
+            lines.append("")
+            continue
+        if op == circuit.COMMENT:
+            lines.append(to_comment(circuit_in.text(i), "    " * depth))
+            continue
+
+        if op >= circuit.FIRST_GATE:
+            text = write_gate_function(circuit_in, i)
+            if text is not None and depth == 0:
+                lines.append(text)
+                continue
+            category = diagnostics.NO_EQUIVALENT_GATE if text is None else diagnostics.NO_EQUIVALENT_STATEMENT
+            if text is None:
+                text = conversion.describe_gate(circuit_in, i)
+        else:
+            category = diagnostics.NO_EQUIVALENT_STATEMENT
+            text = circuit_in.text(i)
+        if op != circuit.UNTRANSLATED and op != circuit.UNTRANSLATED_BLOCK:
+            # Untranslated input lines were logged when read
+            error_log.add(circuit_in.lines[i], text, category)
+        if mark:
+            lines.append(COMMENT + conversion.MARK_COMMENT[1:])
+        indent = "    " * depth
+        lines.extend(COMMENT + " " + indent + line for line in text.split("\n"))
+    return lines
+
+
+def to_comment(text, indent=""):
+    """
+    :param text: Comment of the circuit, in Python form
+    :param indent: Indentation of the comment, kept after the comment marker
+    :return: QASM comment
+    """
+    lines = []
+    for line in text.split("\n"):
+        line = line[1:] if line.startswith("#") else " " + line
+        lines.append(COMMENT + (" " + indent + line.lstrip() if indent else line))
+    return "\n".join(lines)
+
+
+class StatementSplitter:
+    """
+    Finds where QASM statements end, a line at a time. A statement ends at a semicolon, or at the brace closing
+    its block (gate definitions, and if and for in 3.0), outside comments and strings
+    """
+    def __init__(self):
+        self.depth = 0
+        self.in_comment = False
+        # Code of a statement has been found since the last statement ended
+        self.open = False
+
+    def split_line(self, line):
+        """
+        Split a line where each statement in it ends
+        :param line: Line of source, without line break
+        :return: List of (text, ends statement) - the last part never ends a statement, and may be empty
+        """
+        parts = []
+        start = 0
+        for match in SYNTAX.finditer(line):
+            token = match.group()
+            if self.in_comment:
+                if token == "*/":
+                    self.in_comment = False
+                continue
+            if token == "//":
+                break
+            if token == "/*":
+                self.in_comment = True
+                continue
+            if token == "{":
+                self.depth += 1
+            elif token == "}":
+                self.depth = max(self.depth - 1, 0)
+            if self.depth == 0 and (token == ";" or token == "}"):
+                parts.append((line[start:match.end()], True))
+                start = match.end()
+                self.open = False
+            else:
+                self.open = True
+        parts.append((line[start:], False))
+        return parts
+
+
+def split_source(lines):
+    """
+    Split a QASM script into statements, comments and blank lines
+    :param lines: Lines of the script, with or without line breaks
+    :return: Generator of (kind, line number, text) - kind is circuit.STATEMENT, COMMENT or BLANK, and
+             comments are given in Python form. A statement left unfinished at the end is given as it is
+    """
+    splitter = StatementSplitter()
+    statement = []
+    start = None
+    for line_no, line in enumerate(lines, 1):
+        line = conversion.chomp(line)
+        if start is None and not splitter.in_comment:
+            stripped = line.strip()
+            if not stripped:
+                yield circuit.BLANK, line_no, None
+                continue
+            if stripped.startswith(COMMENT):
+                yield circuit.COMMENT, line_no, "#" + stripped[2:]
+                continue
+
+        for text, ends in splitter.split_line(line):
+            if start is None:
+                text = text.lstrip()
+                if not text:
+                    continue
+                start = line_no
+            statement.append(text)
+            if ends:
+                yield circuit.STATEMENT, start, "".join(statement)
+                statement = []
+                start = None
+        if start is not None and not splitter.open and not splitter.in_comment:
+            # Only a comment follows the last statement on the line
+            text = "".join(statement).strip()
+            if text.startswith(COMMENT):
+                text = text[2:].lstrip()
+            yield circuit.COMMENT, line_no, "# " + text.replace("\n", "\n# ")
+            statement = []
+            start = None
+        elif start is not None:
+            statement.append("\n")
+
+    if start is not None:
+        yield circuit.STATEMENT, start, "".join(statement).rstrip()
+
+
+class Reader:
+    """
+    Lowers a QASM script into a circuit, a statement at a time with no syntax tree.
+    Registers are laid out one after another in a single register, in the order they are declared.
+    Classical registers are not kept - measurements are written into the bit of the same position as the qubit.
+    Statements with no equivalent (gate definitions, resets, conditions...) are kept as comments
+    """
+    def __init__(self, source, verbose=False, debug=False, error_log=None):
+        """
+        :param source: Input script as a string
+        :param verbose: Run in verbose mode
+        :param debug: Run in debug mode
+        :param error_log: ErrorLog to add untranslated lines to
+        """
+        self.error_log = conversion.ErrorLog() if error_log is None else error_log
+        self.source = source
+        self.verbose = verbose
+        self.debug = debug
+        self.circuit = circuit.Circuit()
+        # Position of first qubit and size of each register, by name
+        self.registers = {}
+        self.qubit_names = []
+
+    def read(self):
+        """
+        Lower the input script
+        :return: Circuit of the input script
+        """
+        result = self.read_chunk(self.source)
+        self.finish()
+        return result
+
+    def read_chunk(self, source, first_line=1, tree=None):
+        """
+        Lower part of a script, made up of whole statements, into a circuit of its own.
+        Registers declared in earlier parts carry over
+        :param source: Part of the input script
+        :param first_line: Line number of its first line in the whole script
+        :param tree: Statements of source returned by parse, if already split
+        :return: Circuit of this part
+        """
+        if tree is None:
+            tree = self.parse(source)
+        self.circuit = circuit.Circuit(self.circuit.num_qubits)
+        for kind, line_no, text in tree:
+            line_no += first_line - 1
+            if kind == circuit.STATEMENT:
+                self.read_statement(line_no, text)
+            else:
+                self.circuit.add_text(kind, text, 0, line_no)
+        self.circuit.qubit_names = list(self.qubit_names)
+        return self.circuit
+
+    def parse(self, source):
+        """
+        Split part of a script into statements. Nothing is parsed further, so this never fails
+        :param source: Part of a script
+        :return: List of (kind, line number, text) from split_source
+        """
+        return list(split_source(source.splitlines()))
+
+    def split_statements(self, input_file):
+        """
+        Split a script into statements, reading it a line at a time.
+        Comments and blank lines go with the statement after them, and statements sharing a line are kept together
+        :param input_file: Open input file, or any iterable of lines
+        :return: Generator of (first line number, source, number of lines) for each part
+        """
+        splitter = StatementSplitter()
+        buffer = []
+        first_line = 1
+        for line in input_file:
+            buffer.append(line)
+            code = False
+            for text, ends in splitter.split_line(conversion.chomp(line)):
+                code = code or ends
+            if code and not splitter.open and not splitter.in_comment:
+                yield first_line, "".join(buffer), len(buffer)
+                first_line += len(buffer)
+                buffer = []
+        if buffer:
+            yield first_line, "".join(buffer), len(buffer)
+
+    def finish(self):
+        """
+        Called once the whole script has been read - nothing is required of a QASM script
+        :return: None
+        """
+
+    def get_state(self):
+        """
+        Everything found so far which changes how later statements are lowered,
+        so reading can be picked up part way through a script with set_state
+        :return: Dictionary of JSON compatible values
+        """
+        return {"num_qubits": self.circuit.num_qubits, "registers": self.registers}
+
+    def set_state(self, state):
+        """
+        Carry on reading from a state returned by get_state
+        :param state: Dictionary returned by get_state
+        :return: None
+        """
+        self.circuit.num_qubits = state["num_qubits"]
+        self.registers = dict((name, list(register)) for name, register in state["registers"].items())
+        self.qubit_names = []
+        for name, (offset, size) in sorted(self.registers.items(), key=lambda item: item[1][0]):
+            self.qubit_names.extend(name + "[" + str(i) + "]" for i in range(size))
+
+    def read_statement(self, line_no, text):
+        """
+        Lower a single statement into the circuit
+        :param line_no: Line number of statement
+        :param text: Source of statement, including any comments inside it
+        :return: None
+        """
+        code = COMMENTS.sub("", text).strip()
+        if HEADER.fullmatch(code) or CREG.fullmatch(code):
+            if self.verbose:
+                conversion.verbose_print(line_no, "Header or classical register - ignoring")
+            return
+
+        match = QREG.fullmatch(code)
+        if match:
+            self.add_register(line_no, match.group(1), int(match.group(2)))
+            return
+        match = QUBIT.fullmatch(code)
+        if match:
+            self.add_register(line_no, match.group(2), int(match.group(1) or 1))
+            return
+
+        match = MEASURE.fullmatch(code)
+        if match and self.add_gates(line_no, circuit.MEASURE, 0, match.group(1), None):
+            return
+        match = BARRIER.fullmatch(code)
+        if match and self.add_barrier(line_no, match.group(1)):
+            return
+        match = GATE.fullmatch(code)
+        if match and self.process_gate(line_no, match):
+            return
+
+        if self.verbose:
+            conversion.verbose_print(line_no, "Could not translate statement")
+        # Kept as a comment, so a Python script written from the circuit still runs
+        self.circuit.add_text(circuit.UNTRANSLATED, "\n".join("# " + line for line in text.split("\n")), 0,
+                              line_no)
+        self.error_log.add(line_no, text, diagnostics.UNTRANSLATED_STATEMENT)
+
+    def add_register(self, line_no, name, size):
+        if self.verbose:
+            conversion.verbose_print(line_no, "Found register %s of %d qubits", name, size)
+        offset = self.circuit.num_qubits
+        self.registers[name] = [offset, size]
+        self.qubit_names.extend(name + "[" + str(i) + "]" for i in range(size))
+        self.circuit.num_qubits = offset + size
+
+    def process_gate(self, line_no, match):
+        """
+        Lowers a gate statement into circuit gates
+        :param line_no: Line number of statement
+        :param match: Match of GATE
+        :return: True if gates added, False if unable to translate
+        """
+        name, params, arguments = match.groups()
+        angle = None
+        if params is not None:
+            params = split_params(params)
+            if len(params) != 1:
+                return False
+            # QASM 2.0 writes powers with ^, and 3.0 may write pi as π
+            angle = params[0].replace("π", "pi").replace("^", "**")
+        if self.debug:
+            conversion.debug_print(line_no, "Gate found: %s", name)
+        entry = read_gates.get((name, arguments.count(",") + 1, angle is not None))
+        if entry is None:
+            if self.verbose:
+                conversion.verbose_print(line_no, "Could not translate %s Gate", name)
+            return False
+        (op, num_controls), keep_angle = entry
+        return self.add_gates(line_no, op, num_controls, arguments, angle if keep_angle else None)
+
+    def add_gates(self, line_no, op, num_controls, arguments, angle):
+        """
+        Add a gate for each qubit of its arguments. A whole register given as an argument applies the gate to each
+        of its qubits in turn, along with the qubit of the same position in any other whole registers
+        :param line_no: Line number of statement
+        :param op: Gate opcode
+        :param num_controls: Number of arguments which are controls
+        :param arguments: Qubit arguments of statement
+        :param angle: Gate parameter expression
+        :return: True if gates added, False if an argument is not a declared qubit or register sizes differ
+        """
+        qubit_lists = self.get_qubits(arguments)
+        gates = None if qubit_lists is None else conversion.broadcast(qubit_lists)
+        if gates is None:
+            return False
+        for qubits in gates:
+            self.circuit.add_gate(op, qubits[num_controls:], qubits[:num_controls], angle, 0, line_no)
+        return True
+
+    def add_barrier(self, line_no, arguments):
+        qubit_lists = self.get_qubits(arguments)
+        if qubit_lists is None:
+            return False
+        self.circuit.add_gate(circuit.BARRIER, [qubit for qubits in qubit_lists for qubit in qubits], (), None, 0,
+                              line_no)
+        return True
+
+    def get_qubits(self, arguments):
+        """
+        Find the qubits of each argument of a statement
+        :param arguments: Arguments, separated by commas
+        :return: List of qubit positions for each argument, or None if any is not a declared qubit
+        """
+        qubit_lists = []
+        for argument in arguments.split(","):
+            match = ARGUMENT.fullmatch(argument.strip())
+            if match is None or match.group(1) not in self.registers:
+                return None
+            offset, size = self.registers[match.group(1)]
+            if match.group(2) is None:
+                qubit_lists.append(list(range(offset, offset + size)))
+            elif int(match.group(2)) < size:
+                qubit_lists.append([offset + int(match.group(2))])
+            else:
+                return None
+        return qubit_lists
+
+
+def split_params(params):
+    """
+    Split the parameters of a gate at commas outside brackets
+    :param params: Parameters, without the surrounding brackets
+    :return: List of parameter expressions
+    """
+    result = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(params):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            result.append(params[start:i].strip())
+            start = i + 1
+    result.append(params[start:].strip())
+    return result
@@ -0,0 +1,82 @@
+#    Functions for converting to OpenQASM 3.0 for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+from . import circuit
+from . import conversion
+from . import process_qasm
+
+# Scripts are read the same way as OpenQASM 2.0, which process_qasm reads either version of
+Reader = process_qasm.Reader
+read_script = process_qasm.read_script
+COMMENT = process_qasm.COMMENT
+
+# stdgates.inc names phase gates p and cp, where qelib1.inc has u1 and cu1
+write_gate_names = dict(process_qasm.write_gate_names)
+write_gate_names.update({
+    (circuit.PHASE, 0): "p({0})",
+    (circuit.PHASE, 1): "cp({0})"
+})
+MEASURE_TEMPLATE = "c[{2}] = measure {1};"
+write_templates = process_qasm.compile_write_templates(write_gate_names, MEASURE_TEMPLATE)
+
+
+def write_script(circuit_in, output_file, mark=True, error_log=None):
+    """
+    Write a circuit out as an OpenQASM 3.0 script
+    :param circuit_in: Circuit to write
+    :param output_file: Output file to write to
+    :param mark: Add comments identifying untranslated lines
+    :param error_log: ErrorLog to add entries with no equivalent to
+    :return: None
+    """
+    lines = header_lines(circuit_in.num_qubits)
+    lines.extend(script_lines(circuit_in, mark, error_log))
+    lines.extend(footer_lines())
+    conversion.write_lines(output_file, lines)
+
+
+def header_lines(num_qubits):
+    """
+    Version, gate library and registers written before the converted script
+    :param num_qubits: Size of register
+    :return: List of lines
+    """
+    return [
+        "",
+        "OPENQASM 3.0;",
+        "include \"stdgates.inc\";",
+        "",
+        "qubit[" + str(num_qubits) + "] q;",
+        "bit[" + str(num_qubits) + "] c;",
+        ""
+    ]
+
+
+footer_lines = process_qasm.footer_lines
+
+
+def script_lines(circuit_in, mark=True, error_log=None):
+    return process_qasm.translate_lines(circuit_in, write_gate, mark, error_log)
+
+
+def write_gate(circuit_in, index):
+    """
+    Translate a single gate into an OpenQASM 3.0 statement
+    :param circuit_in: Circuit containing gate
+    :param index: Position of gate
+    :return: Translated line, or None if no QASM equivalent
+    """
+    return process_qasm.format_gate(write_templates, circuit_in, index)
@@ -1,37 +1,399 @@
-from . import conversion, error_cqc
+#    Functions for converting to and from Qiskit for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
 
-args = None
-filename = ""
-output_file = None
-file_as_list = []
+import ast
 
+from . import circuit, conversion, diagnostics
 
-def process_qiskit(input_args, output_filename):
+# Qiskit gate methods read into the circuit, as ((method, arguments), (opcode, control qubits), angle handling).
+# Rotations take their angle as the first argument, before the qubits. Control qubits come before targets
+read_gate_table = [
+    (("h", 1), (circuit.H, 0), circuit.NO_ANGLE),
+    (("x", 1), (circuit.X, 0), circuit.NO_ANGLE),
+    (("y", 1), (circuit.Y, 0), circuit.NO_ANGLE),
+    (("z", 1), (circuit.Z, 0), circuit.NO_ANGLE),
+    (("s", 1), (circuit.S, 0), circuit.NO_ANGLE),
+    (("sdg", 1), (circuit.SDAG, 0), circuit.NO_ANGLE),
+    (("t", 1), (circuit.T, 0), circuit.NO_ANGLE),
+    (("tdg", 1), (circuit.TDAG, 0), circuit.NO_ANGLE),
+    (("sx", 1), (circuit.SQRTX, 0), circuit.NO_ANGLE),
+    (("rx", 2), (circuit.RX, 0), circuit.ANGLE),
+    (("ry", 2), (circuit.RY, 0), circuit.ANGLE),
+    (("rz", 2), (circuit.RZ, 0), circuit.ANGLE),
+    (("p", 2), (circuit.PHASE, 0), circuit.ANGLE),
+    (("u1", 2), (circuit.PHASE, 0), circuit.ANGLE),
+    (("swap", 2), (circuit.SWAP, 0), circuit.NO_ANGLE),
+    (("iswap", 2), (circuit.ISWAP, 0), circuit.NO_ANGLE),
+    (("cx", 2), (circuit.X, 1), circuit.NO_ANGLE),
+    (("cnot", 2), (circuit.X, 1), circuit.NO_ANGLE),
+    (("cy", 2), (circuit.Y, 1), circuit.NO_ANGLE),
+    (("cz", 2), (circuit.Z, 1), circuit.NO_ANGLE),
+    (("ch", 2), (circuit.H, 1), circuit.NO_ANGLE),
+    (("csx", 2), (circuit.SQRTX, 1), circuit.NO_ANGLE),
+    (("crx", 3), (circuit.RX, 1), circuit.ANGLE),
+    (("cry", 3), (circuit.RY, 1), circuit.ANGLE),
+    (("crz", 3), (circuit.RZ, 1), circuit.ANGLE),
+    (("cp", 3), (circuit.PHASE, 1), circuit.ANGLE),
+    (("cu1", 3), (circuit.PHASE, 1), circuit.ANGLE),
+    (("ccx", 3), (circuit.X, 2), circuit.NO_ANGLE),
+    (("toffoli", 3), (circuit.X, 2), circuit.NO_ANGLE),
+    (("cswap", 3), (circuit.SWAP, 1), circuit.NO_ANGLE),
+    (("fredkin", 3), (circuit.SWAP, 1), circuit.NO_ANGLE)
+]
+read_gates = circuit.compile_gate_table(read_gate_table)
+
+# Circuit gates written as Qiskit, by (opcode, controls), as (method, takes the gate parameter)
+write_gate_table = {
+    (circuit.H, 0): ("h", False),
+    (circuit.X, 0): ("x", False),
+    (circuit.Y, 0): ("y", False),
+    (circuit.Z, 0): ("z", False),
+    (circuit.S, 0): ("s", False),
+    (circuit.SDAG, 0): ("sdg", False),
+    (circuit.T, 0): ("t", False),
+    (circuit.TDAG, 0): ("tdg", False),
+    (circuit.SQRTX, 0): ("sx", False),
+    (circuit.RX, 0): ("rx", True),
+    (circuit.RY, 0): ("ry", True),
+    (circuit.RZ, 0): ("rz", True),
+    (circuit.PHASE, 0): ("p", True),
+    (circuit.SWAP, 0): ("swap", False),
+    (circuit.ISWAP, 0): ("iswap", False),
+    (circuit.BARRIER, 0): ("barrier", False),
+    (circuit.X, 1): ("cx", False),
+    (circuit.Y, 1): ("cy", False),
+    (circuit.Z, 1): ("cz", False),
+    (circuit.H, 1): ("ch", False),
+    (circuit.SQRTX, 1): ("csx", False),
+    (circuit.RX, 1): ("crx", True),
+    (circuit.RY, 1): ("cry", True),
+    (circuit.RZ, 1): ("crz", True),
+    (circuit.PHASE, 1): ("cp", True),
+    (circuit.X, 2): ("ccx", False),
+    (circuit.SWAP, 1): ("cswap", False)
+}
+
+# Gates acting on two target qubits - every other gate but a barrier acts on one
+TWO_TARGETS = {circuit.SWAP, circuit.SQRTSWAP, circuit.ISWAP}
+
+
+def compile_write_templates():
+    """
+    Build the format templates of every gate written, with {0} the gate parameter, {1} the qubits
+    and {2} the position of the first qubit
+    :return: Dictionary of templates by (opcode, controls)
+    """
+    templates = {}
+    for key, (method, takes_param) in write_gate_table.items():
+        templates[key] = "quantum_circuit." + method + "(" + ("{0}, " if takes_param else "") + "{1})"
+    # Measurements are made into the classical bit of the same position
+    templates[circuit.MEASURE, 0] = "quantum_circuit.measure({1}, creg[{2}])"
+    return templates
+
+
+write_templates = compile_write_templates()
+
+
+def read_script(source, verbose=False, debug=False, error_log=None):
+    """
+    Lower a whole Qiskit script into a circuit with a single parse and a single tree pass
+    :param source: Qiskit script as a string
+    :param verbose: Run in verbose mode
+    :param debug: Run in debug mode
+    :param error_log: ErrorLog to add untranslated lines to
+    :return: Circuit of the script
     """
-    Entry point for converting from Qiskit
-    :param input_args: Input arguments from command line call
-    :param output_filename: Desired name of output file
+    if debug:
+        print("Processing Qiskit input file...")
+    return Reader(source, verbose, debug, error_log).read()
+
+
+def write_script(circuit_in, output_file, mark=True, error_log=None):
+    """
+    Write a circuit out as a Qiskit script
+    :param circuit_in: Circuit to write
+    :param output_file: Output file to write to
+    :param mark: Add comments identifying untranslated lines
+    :param error_log: ErrorLog to add gates with no equivalent to
     :return: None
     """
-    global args
-    global filename
-    global output_file
-    global file_as_list
-    args = input_args
-    filename = output_filename
+    lines = header_lines(circuit_in.num_qubits)
+    lines.extend(script_lines(circuit_in, mark, error_log))
+    lines.extend(footer_lines())
+    conversion.write_lines(output_file, lines)
+
+
+def header_lines(num_qubits):
+    """
+    Imports, registers and circuit definition written before the converted script
+    :param num_qubits: Size of register
+    :return: List of lines
+    """
+    return [
+        "",
+        "from numpy import pi",
+        "from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister",
+        "",
+        "qreg = QuantumRegister(" + str(num_qubits) + ", 'q')",
+        "creg = ClassicalRegister(" + str(num_qubits) + ", 'c')",
+        "quantum_circuit = QuantumCircuit(qreg, creg)",
+        ""
+    ]
+
+
+def footer_lines():
+    """
+    Lines written after the converted script - none needed for Qiskit
+    :return: List of lines
+    """
+    return []
+
+
+def script_lines(circuit_in, mark=True, error_log=None):
+    return conversion.script_lines(circuit_in, write_gate, mark, error_log)
+
+
+def write_gate(circuit_in, index):
+    """
+    Translate a single gate into a Qiskit gate method call
+    :param circuit_in: Circuit containing gate
+    :param index: Position of gate
+    :return: Translated line, or None if no Qiskit equivalent
+    """
+    op = circuit_in.ops[index]
+    controls, targets = circuit_in.qubits(index)
+    template = write_templates.get((op, len(controls)))
+    if template is None or (op != circuit.BARRIER and len(targets) != (2 if op in TWO_TARGETS else 1)):
+        return None
+    qubits = controls + targets
+    return template.format(circuit_in.param(index), ", ".join("qreg[" + str(qubit) + "]" for qubit in qubits),
+                           qubits[0])
+
+
+class Reader(conversion.ScriptReader):
+    """
+    Lowers a Qiskit syntax tree into a circuit.
+    Gate method calls on a circuit become circuit gates; register and circuit definitions are removed.
+    Every quantum register goes into the one circuit register, in the order they are defined, and classical
+    registers are not kept - measurements are written into the bit of the same position as the qubit
+    """
+    def __init__(self, source, verbose=False, debug=False, error_log=None):
+        super().__init__(source, verbose, debug, error_log)
+        self.symbols = conversion.SymbolTable()
+        # Qubits of each QuantumCircuit, in order, by name - integer qubit arguments are positions in these
+        self.circuits = {}
+        self.classical_registers = set()
+        self.current_function = ""
+
+    def read_chunk(self, source, first_line=1, tree=None):
+        result = super().read_chunk(source, first_line, tree)
+        result.qubit_names = list(self.symbols.names)
+        return result
+
+    def get_state(self):
+        state = super().get_state()
+        state.update(self.symbols.get_state())
+        state["circuits"] = self.circuits
+        state["classical_registers"] = sorted(self.classical_registers)
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.symbols.set_state(state)
+        self.circuits = dict((name, list(qubits)) for name, qubits in state["circuits"].items())
+        self.classical_registers = set(state["classical_registers"])
+
+    def visit_Import(self, node):
+        if self.verbose:
+            conversion.verbose_print(node.lineno, "Import statement - ignoring")
+
+    visit_ImportFrom = visit_Import
+
+    def visit_FunctionDef(self, node):
+        if self.verbose:
+            conversion.verbose_print(node.lineno, "Function definition - copying verbatim")
+        self.current_function = node.name
+        arguments = node.args
+        parameters = arguments.posonlyargs + arguments.args + arguments.kwonlyargs
+        parameters += [argument for argument in (arguments.vararg, arguments.kwarg) if argument is not None]
+        self.symbols.push_scope(parameter.arg for parameter in parameters)
+        self.lower_block(node)
+        self.symbols.pop_scope()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Assign(self, node):
+        call_name = conversion.get_call_name(node.value)
+        targets = node.targets
+        if call_name in ("QuantumRegister", "ClassicalRegister", "QuantumCircuit") and len(targets) == 1 \
+                and isinstance(targets[0], ast.Name) and self.define(targets[0].id, call_name, node.value):
+            return
+        self.add_statement(node)
+
+    def define(self, name, kind, call):
+        """
+        Read a register or circuit definition
+        :param name: Name assigned to
+        :param kind: Class called - QuantumRegister, ClassicalRegister or QuantumCircuit
+        :param call: Call of class
+        :return: True if read, False if its size is not known
+        """
+        if kind == "ClassicalRegister":
+            self.classical_registers.add(name)
+            return True
+        if kind == "QuantumRegister":
+            size = conversion.get_int(call.args[0]) if call.args else None
+            if size is None or size is False or size < 1:
+                return False
+            self.allocate(call.lineno, name, size)
+            return True
+
+        # QuantumCircuit - of registers, or of a number of qubits (followed by a number of bits)
+        qubits = []
+        for position, argument in enumerate(call.args):
+            register = self.symbols.lookup(argument.id) if isinstance(argument, ast.Name) else None
+            size = conversion.get_int(argument)
+            if register is not None:
+                qubits.extend(range(register[0], register[0] + register[1]))
+            elif position == 0 and size is not False and size > 0:
+                qubits.extend(range(len(self.symbols.names), len(self.symbols.names) + size))
+                self.allocate(call.lineno, name, size)
+            elif isinstance(argument, ast.Name) and argument.id in self.classical_registers:
+                # Classical bits are not kept
+                continue
+            elif position != 1 or size is False:
+                return False
+        if self.verbose:
+            conversion.verbose_print(call.lineno, "Found circuit definition. Name: %s", name)
+        self.circuits[name] = qubits
+        return True
+
+    def allocate(self, line_no, name, size):
+        if self.verbose:
+            conversion.verbose_print(line_no, "Qubits counted: %d", size)
+        self.symbols.allocate(name, size)
+        self.circuit.num_qubits = max(self.circuit.num_qubits, len(self.symbols.names))
+
+    def visit_Expr(self, node):
+        value = node.value
+        if isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute) \
+                and isinstance(value.func.value, ast.Name) and self.is_circuit(value.func.value.id):
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Circuit method detected - processing")
+            if not self.process_gate(node):
+                if self.verbose:
+                    conversion.verbose_print(node.lineno, "Unsure how to translate method. Copying verbatim and "
+                                                          "adding to error log")
+                self.add_untranslated(node)
+        else:
+            # Function calls and print statements copied verbatim
+            self.add_statement(node)
+
+    def is_circuit(self, name):
+        """
+        :param name: Name a method is called on
+        :return: True if name is a circuit, or a function parameter which may be one
+        """
+        return name in self.circuits or self.symbols.is_parameter(name)
 
-    output_file = conversion.open_output_file(filename)
-    file_as_list = conversion.read_input_file(args.input_filename)
-    conversion.write_output_copyright(output_file, "ProjectQ", "QuTiP")
-    print_imports()
-    convert_script()
-    conversion.close_output_file(output_file)
+    def process_gate(self, node):
+        """
+        Lowers a circuit method call into circuit gates
+        :param node: Expression statement calling a method of a circuit
+        :return: True if gates added, False if unable to translate
+        """
+        call = node.value
+        method = call.func.attr
+        name = call.func.value.id
+        circuit_qubits = None if self.symbols.is_parameter(name) else self.circuits[name]
+        if call.keywords or any(isinstance(argument, ast.Starred) for argument in call.args):
+            return False
+        if self.debug:
+            conversion.debug_print(node.lineno, "Gate found: %s", method)
 
+        if method == "measure_all" and not call.args and circuit_qubits is not None:
+            self.add_gate(node, circuit.BARRIER, circuit_qubits)
+            for qubit in circuit_qubits:
+                self.add_gate(node, circuit.MEASURE, [qubit])
+            return True
+        if method == "barrier":
+            qubit_lists = [self.get_qubits(argument, name, circuit_qubits) for argument in call.args]
+            if None in qubit_lists or (not call.args and circuit_qubits is None):
+                return False
+            qubits = [qubit for qubits in qubit_lists for qubit in qubits] if call.args else circuit_qubits
+            self.add_gate(node, circuit.BARRIER, qubits)
+            return True
 
-def print_imports():
-    print("In progress!")
+        angle = None
+        if method == "measure" and len(call.args) == 2:
+            # The classical bit measured into is not kept
+            op, num_controls, arguments = circuit.MEASURE, 0, call.args[:1]
+        else:
+            entry = read_gates.get((method, len(call.args), True))
+            if entry is not None:
+                angle = ast.unparse(call.args[0])
+                arguments = call.args[1:]
+            else:
+                entry = read_gates.get((method, len(call.args), False))
+                arguments = call.args
+            if entry is None:
+                return False
+            (op, num_controls), keep_angle = entry
+            angle = angle if keep_angle else None
 
+        qubit_lists = [self.get_qubits(argument, name, circuit_qubits) for argument in arguments]
+        gates = None if None in qubit_lists else conversion.broadcast(qubit_lists)
+        if gates is None:
+            return False
+        for qubits in gates:
+            self.add_gate(node, op, qubits[num_controls:], qubits[:num_controls], angle)
+        return True
 
-def convert_script():
-    print("This module was added to test integration of a new conversion language.")
-    print("Functionality to convert to/from Qiskit is a work in progress")
+    def get_qubits(self, node, circuit_name, circuit_qubits):
+        """
+        Qiskit qubits are given as registers, register indexes or slices, lists of these, or positions in the circuit.
+        Find the circuit qubits of one argument of a gate method
+        :param node: Argument
+        :param circuit_name: Name of the circuit the method is called on
+        :param circuit_qubits: Qubits of the circuit the method is called on, or None if it is a function parameter
+        :return: List of circuit qubits - positions, or expressions where not known (e.g. function parameter),
+                 or None if a position is outside the circuit. Qubits which are not known are logged as warnings
+        """
+        if isinstance(node, (ast.List, ast.Tuple)):
+            qubits = []
+            for element in node.elts:
+                element_qubits = self.get_qubits(element, circuit_name, circuit_qubits)
+                if element_qubits is None:
+                    return None
+                qubits.extend(element_qubits)
+            return qubits
+        position = conversion.get_int(node)
+        if position is None or position is False:
+            resolution = self.symbols.resolve(node)
+        elif circuit_qubits is not None:
+            if not 0 <= position < len(circuit_qubits):
+                return None
+            return [circuit_qubits[position]]
+        else:
+            # A position in a circuit passed in could be any qubit of the register - kept relative to the parameter
+            expression = circuit_name + ".qubits[" + str(position) + "]"
+            resolution = conversion.Resolution(conversion.Resolution.UNRESOLVED, [expression], expression)
+        if not resolution.resolved:
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Qubit not defined or a parameter: %s", resolution.expression)
+            self.error_log.add(node.lineno, resolution.expression, diagnostics.UNRESOLVED_QUBIT, node.col_offset + 1,
+                               diagnostics.WARNING)
+        return resolution.qubits
@@ -1,4 +1,4 @@
-#    Functions for translating from QuTiP to ProjectQ
+#    Functions for reading and writing QuTiP scripts
 #    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
 #
 #    This program is free software: you can redistribute it and/or modify
@@ -15,329 +15,510 @@
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>
 
 import ast
+import keyword
 import re
 
+from . import circuit
 from . import conversion
+from . import diagnostics
 from . import error_cqc
-
-file_as_list = []
-qubit_list = []
-args = None
-output_file = None
-current_function = ""
-qubit_count = 0
-circuit_name = ""
-current_line_no = 0
-
-
-def process_qutip(input_args, output_filename):
+from . import instrument
+
+# Positional parameters of QubitCircuit.add_gate, in order
+add_gate_params = ["gate", "targets", "controls", "arg_value", "arg_label"]
+
+# QuTiP gates read into the circuit, as ((name, controls, targets), opcode, arg_value handling).
+# Controls are None where the gate takes any number. Rotations given no arg_value are read as Pauli gates
+read_gate_table = [
+    (("RX", None, 1), circuit.RX, circuit.ANGLE),
+    (("RY", None, 1), circuit.RY, circuit.ANGLE),
+    (("RZ", None, 1), circuit.RZ, circuit.ANGLE),
+    (("RX", None, 1), circuit.X, circuit.NO_ANGLE),
+    (("RY", None, 1), circuit.Y, circuit.NO_ANGLE),
+    (("RZ", None, 1), circuit.Z, circuit.NO_ANGLE),
+    (("CRX", 1, 1), circuit.RX, circuit.ANGLE),
+    (("CRY", 1, 1), circuit.RY, circuit.ANGLE),
+    (("CRZ", 1, 1), circuit.RZ, circuit.ANGLE),
+    (("SNOT", None, 1), circuit.H, circuit.ANY_ANGLE),
+    (("SQRTNOT", None, 1), circuit.SQRTX, circuit.ANY_ANGLE),
+    (("PHASEGATE", None, 1), circuit.PHASE, circuit.ANGLE),
+    (("CPHASE", 0, 1), circuit.PHASE, circuit.ANGLE),
+    (("CPHASE", 1, 1), circuit.PHASE, circuit.ANGLE),
+    (("CNOT", 1, 1), circuit.X, circuit.ANY_ANGLE),
+    (("CSIGN", 1, 1), circuit.Z, circuit.ANY_ANGLE),
+    (("TOFFOLI", 2, 1), circuit.X, circuit.ANY_ANGLE),
+    (("FREDKIN", 1, 2), circuit.SWAP, circuit.ANY_ANGLE),
+    (("SWAP", None, 2), circuit.SWAP, circuit.ANY_ANGLE),
+    (("SQRTSWAP", None, 2), circuit.SQRTSWAP, circuit.ANY_ANGLE),
+    (("ISWAP", None, 2), circuit.ISWAP, circuit.ANY_ANGLE)
+]
+read_gates = circuit.compile_gate_table(read_gate_table)
+
+# Memory mapped scripts are read a line at a time. Top level add_gate calls with literal arguments, e.g.
+#     circuit.add_gate("CNOT", controls=0, targets=1)
+# are read straight from the bytes of their line. Runs of any other lines are parsed and lowered as usual
+mapped_gate_call = re.compile(rb"([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)\.add_gate\(")
+# One argument - a string, a list of positions, or an expression without brackets or strings - and the
+# comma or bracket after it
+mapped_argument = re.compile(
+    rb"\s*(?:([A-Za-z_]\w*)\s*=(?!=)\s*)?"
+    rb"(\"\w*\"|'\w*'|\[\s*(?:(?:0|[1-9]\d*)\s*,\s*)*(?:(?:0|[1-9]\d*)\s*)?\]|[^,()\[\]{}#\"'\\\n]+?)"
+    rb"\s*([,)])")
+mapped_close = re.compile(rb"\s*\)")
+mapped_line_end = re.compile(rb"[ \t]*(?:#.*)?\r?$")
+mapped_blank = re.compile(rb"[ \t\r]*$")
+mapped_comment = re.compile(rb"[ \t]*#")
+# Characters which end a line for ast or str.splitlines, other than "\n" and "\r\n", and null bytes.
+# Scripts containing any are read as text
+mapped_fallback = re.compile(rb"\r(?!\n)|[\x00\x0b\x0c\x1c-\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+mapped_keywords = dict((param.encode(), param) for param in add_gate_params)
+
+# Circuit gates written as QuTiP, by (opcode, controls), as (name, arg_value) - arg_value is an expression
+# with {0} standing for the gate parameter, or None. Gates with no name are not needed in a QuTiP circuit
+write_gate_table = {
+    # Pauli gates - as rotations by pi
+    (circuit.X, 0): ("RX", "pi"),
+    (circuit.Y, 0): ("RY", "pi"),
+    (circuit.Z, 0): ("RZ", "pi"),
+    (circuit.H, 0): ("SNOT", None),
+    (circuit.S, 0): ("PHASEGATE", "pi / 2"),
+    (circuit.SDAG, 0): ("PHASEGATE", "-pi / 2"),
+    (circuit.T, 0): ("PHASEGATE", "pi / 4"),
+    (circuit.TDAG, 0): ("PHASEGATE", "-pi / 4"),
+    (circuit.SQRTX, 0): ("SQRTNOT", None),
+    (circuit.RX, 0): ("RX", "{0}"),
+    (circuit.RY, 0): ("RY", "{0}"),
+    (circuit.RZ, 0): ("RZ", "{0}"),
+    (circuit.PHASE, 0): ("PHASEGATE", "{0}"),
+    (circuit.SWAP, 0): ("SWAP", None),
+    (circuit.SQRTSWAP, 0): ("SQRTSWAP", None),
+    (circuit.ISWAP, 0): ("ISWAP", None),
+    # No measurements or barriers in a QuTiP circuit
+    (circuit.MEASURE, 0): (None, None),
+    (circuit.BARRIER, 0): (None, None),
+    (circuit.X, 1): ("CNOT", None),
+    (circuit.Z, 1): ("CSIGN", None),
+    (circuit.RX, 1): ("CRX", "{0}"),
+    (circuit.RY, 1): ("CRY", "{0}"),
+    (circuit.RZ, 1): ("CRZ", "{0}"),
+    (circuit.PHASE, 1): ("CPHASE", "{0}"),
+    (circuit.SWAP, 1): ("FREDKIN", None),
+    (circuit.X, 2): ("TOFFOLI", None)
+}
+
+
+def compile_write_templates():
     """
-
-    :param input_args: Arguments from program call on command line
-    :param output_filename: Name of converted output file
-    :return: None
+    Build the format templates of every gate written, with {0} the gate parameter, {1} the targets
+    and {2} the controls
+    :return: Dictionary of templates by (opcode, controls)
     """
-    global args
-    global filename
-    global output_file
-    global file_as_list
-
-    args = input_args
-    filename = output_filename
+    templates = {}
+    for (op, controls), (name, arg_value) in write_gate_table.items():
+        if name is None:
+            templates[op, controls] = ""
+            continue
+        template = "quantum_circuit.add_gate(\"" + name + "\""
+        if controls:
+            template += ", controls={2}"
+        template += ", targets={1}"
+        if arg_value is not None:
+            template += ", arg_value=" + arg_value
+        templates[op, controls] = template + ")"
+    return templates
 
-    if args.debug:
-        print("Processing QuTiP input file...")
 
-    output_file = conversion.open_output_file(filename)
-    file_as_list = conversion.read_input_file(args.input_filename)
-    conversion.write_output_copyright(output_file, "QuTiP", "ProjectQ")
-    print_imports()
-    convert_script()
-    print_final_script()
-    conversion.close_output_file(output_file)
+write_templates = compile_write_templates()
 
 
-def convert_script():
+def read_script(source, verbose=False, debug=False, error_log=None):
     """
-    Handles each line of conversion for QuTiP input
-    :return: None
+    Lower a whole QuTiP script into a circuit with a single parse and a single tree pass
+    :param source: QuTiP script as a string
+    :param verbose: Run in verbose mode
+    :param debug: Run in debug mode
+    :param error_log: ErrorLog to add untranslated lines to
+    :return: Circuit of the script
     """
-    if not check_for_circuit():
-        error_cqc.process_error(error_cqc.QUTIP_NO_QUBIT_DEFINITIONS, True)
-    global current_function
-    global current_line_no
-
-    add_gate = circuit_name + ".add_gate("
-
-    current_line_no = 1
-
-    for line in file_as_list:
-
-        split_line = line.split()
-        whitespace = conversion.get_leading_spaces(line)
-        new_line = whitespace + line.strip()
-
-        # empty line
-        if not split_line:
-            print(file=output_file)
-        else:
-            if args.verbose:
-                print()
-                print(current_line_no, end='')
-                print(": " + line.rstrip())
-
-            # function definition
-            if split_line[0] == "def":
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Function defenition - copying verbatim")
-                current_function = line
-                print(new_line, file=output_file)
-
-            # imports
-            elif split_line[0] == "from" or split_line[0] == "import":
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Import statement - ignoring")
-                print(file=output_file)
-
-            # comments - copy as standard
-            elif split_line[0] == "#":
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Comment - copying verbatim")
-                print(new_line, file=output_file)
-
-            # new gate added to circuit
-            elif add_gate in line:
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Gate detected")
-                if not process_gate(line):
-                    conversion.untranslateable_line(line, current_line_no, args.mark, output_file)
-
-            # Circuit definition - no equivalent in projectq
-            elif " = QubitCircuit(" in line:
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "QubitCircuit declaration - ignoring")
-                print(file=output_file)
-
-            else:
-                if args.verbose:
-                    conversion.verbose_print(current_line_no, "Unsure how to translate line. Copying verbatim and "
-                                                              "adding to error log")
-                conversion.untranslateable_line(line, current_line_no, args.mark, output_file)
-
-        current_line_no += 1
+    if debug:
+        print("Processing QuTiP input file...")
+    return Reader(source, verbose, debug, error_log).read()
 
 
-def process_gate(line):
+def write_script(circuit_in, output_file, mark=True, error_log=None):
     """
-    Translates gates into ProjectQ format
-    TODO
-    :param line: Line to translate
+    Write a circuit out as a QuTiP script
+    :param circuit_in: Circuit to write
+    :param output_file: Output file to write to
+    :param mark: Add comments identifying untranslated lines
+    :param error_log: ErrorLog to add gates with no equivalent to
     :return: None
     """
+    lines = header_lines(circuit_in.num_qubits)
+    lines.extend(script_lines(circuit_in, mark, error_log))
+    lines.extend(footer_lines())
+    conversion.write_lines(output_file, lines)
 
-    # Extract gate from parameters
-    gate = line[line.find("(\"")+2:line.find("\",")]
-    if args.debug:
-        conversion.debug_print(current_line_no, "Gate found: " + gate)
-
-    # CNOT Gate
-    if gate == "CNOT":
-        return convert_cnot_gate(line)
-    # Rotation Gate
-    elif gate[0] == "R" and (gate[1] == "X" or "Y" or "Z"):
-        return convert_rotation_gate(line, gate[1])
-    # Hadamard Gate
-    elif gate == "SNOT":
-        if args.verbose:
-            conversion.verbose_print(current_line_no, "Converting to Hadamard gate")
-        qubit = line[line.find(",")+1:line.find(")")].strip()
-        print(conversion.get_leading_spaces(line) +  "H | " + get_named_qubit_from_position(qubit), file=output_file)
-        return True
-    # SWAP Gate
-    elif gate == "SWAP":
-        return convert_swap_gate(line)
-    elif gate == "SQRTSWAP":
-        return convert_swap_gate(line, sqrt=True)
-    # ISWAP Gate
-    elif gate == "ISWAP":
-        if args.verbose:
-            conversion.verbose_print(current_line_no, "Could not translate ISWAP Gate - No Known ProjectQ Version")
-        if args.mark:
-            print("# Could not translate ISWAP Gate - No Known ProjectQ Version", file=output_file)
-            return True
-        else:
-            return False
-    elif gate == "CPHASE":
-        return convert_cphase_gate(line)
-    else:
-        if args.verbose:
-            conversion.verbose_print(current_line_no, "Unsure how to translate line. Copying verbatim")
-        return False
-
-
-def convert_rotation_gate(line, direction):
-    if args.verbose:
-        conversion.verbose_print(current_line_no, "Converting to Rotation (" + direction.upper() + ") Gate")
-
-    one_param = line[line.find("(") + 1:line.find(")")]
-    # parameters between commas
-    remaining_params = re.findall(","+"(.*?)"+",", line)
-    named_qubit = ""
-    rotation = ""
-
-    if "," not in one_param:
-        if args.debug:
-            print("Only one parameter!")
-    elif not remaining_params:
-        if args.debug:
-            print("Two parameters!")
-        # find string between comma and closing parentheses
-        named_qubit = get_named_qubit_from_position(line[line.find(",")+1:line.find(")")].strip())
-        rotation = "pi"
-    else:
-        if args.debug:
-            print("3+ Params")
-        if len(remaining_params) == 2:
-            named_qubit = get_named_qubit_from_position(remaining_params[0].strip().replace(" ", ""))
-            rotation = remaining_params[1].strip().replace(" ", "")
-        else:
-            return False
-
-    if rotation == "pi":
-        print(conversion.get_leading_spaces(line) + direction.upper() + " | " + named_qubit, file=output_file)
-    else:
-        print(conversion.get_leading_spaces(line) + "R" + direction.lower() + "(" + rotation + ") | " + named_qubit,
-              file=output_file)
-
-    return True
-
-
-def convert_cnot_gate(line):
-    if args.verbose:
-        conversion.verbose_print(current_line_no, "Converting to CNOT Gate")
-    first_qubit = re.search(',(.*),', line)
-    second_qubit = re.search(',(.*)\\)', line)
-    new_regex = second_qubit.group(0)[2:]
-    new_second_qubit = re.search(',(.*)\\)', new_regex)
-
-    if args.debug:
-        conversion.debug_print(current_line_no, "Regex Check")
-        conversion.debug_print(current_line_no, line)
-        conversion.debug_print(current_line_no, first_qubit.group(0))
-        conversion.debug_print(current_line_no, first_qubit.group(1))
-        conversion.debug_print(current_line_no, new_second_qubit.group(0).strip())
-        conversion.debug_print(current_line_no, new_second_qubit.group(1).strip())
-
-    print(conversion.get_leading_spaces(line) + "CNOT | (" + get_named_qubit_from_position(first_qubit.group(1).strip())
-          + ", " + get_named_qubit_from_position(new_second_qubit.group(1).strip()) + ")", file=output_file)
-    return True
-
-
-def convert_swap_gate(line, sqrt=False):
-    if args.verbose:
-        print(str(current_line_no) + ": Converting to ", end='')
-        if sqrt:
-            print("SQRT", end='')
-        print("SWAP Gate")
-    square_brackets = line[line.find("["):line.find("]")+1]
-    square_brackets.replace("[", "").replace("]", "")
-    qubits = square_brackets.split(",")
-
-    if args.debug:
-        conversion.debug_print(current_line_no, "Qubits: " + str(qubits))
-
-    print(conversion.get_leading_spaces(line), end='', file=output_file)
-    if sqrt:
-        print("SQRT", end='', file=output_file)
-
-    print("SWAP | (", end='', file=output_file)
-    for i, each in enumerate(qubits):
-        if i != len(qubits) - 1:
-            if "[" in each:
-                each = each.replace("[", "")
-            print(each + ", ", file=output_file, end='')
-        else:
-            if "]" in each:
-                each = each.replace("]", "")
-            print(each + ")", file=output_file)
-
-    return True
 
+def header_lines(num_qubits):
+    """
+    Imports and circuit definition written before the converted script
+    :param num_qubits: Number of qubits in circuit
+    :return: List of lines
+    """
+    return [
+        "",
+        "from numpy import pi",
+        "from qutip import *",
+        "",
+        "quantum_circuit = QubitCircuit(" + str(num_qubits) + ")",
+        ""
+    ]
 
-def convert_cphase_gate(line):
-    if args.verbose:
-        conversion.verbose_print(current_line_no, "Converting to CPHASE (R()) Gate")
-    params = line[line.find("(")+1:line.find(")")].strip().replace(" ", "")
-    split_params = params.split(",")
-    qubit = split_params[1]
 
-    if args.debug:
-        conversion.debug_print(current_line_no, "Qubit: " + qubit)
-        conversion.debug_print(current_line_no, "Params: " + str(split_params))
+def footer_lines():
+    """
+    Lines written after the converted script - none needed for QuTiP
+    :return: List of lines
+    """
+    return []
 
-    if split_params[2] != "None":
-        rotation = split_params[2]
-    else:
-        rotation = split_params[3]
 
-    if args.mark:
-        print("# Unknown formatting of below line: Please manually check", file=output_file)
-    print(conversion.get_leading_spaces(line) + "R(" + rotation + ") | " + get_named_qubit_from_position(qubit),
-          file=output_file)
+def script_lines(circuit_in, mark=True, error_log=None):
+    return conversion.script_lines(circuit_in, write_gate, mark, error_log)
 
-    return True
 
+def write_gate(circuit_in, index):
+    """
+    Translate a single gate into a QuTiP add_gate call
+    :param circuit_in: Circuit containing gate
+    :param index: Position of gate
+    :return: Translated line, empty if not needed in QuTiP, or None if no QuTiP equivalent
+    """
+    controls, targets = circuit_in.qubits(index)
+    template = write_templates.get((circuit_in.ops[index], len(controls)))
+    if template is None:
+        return None
+    return template.format(circuit_in.param(index), get_position_list(targets), get_position_list(controls))
 
-def get_named_qubit_from_position(qubit):
-    if args.debug:
-        conversion.debug_print(current_line_no, "Qubit input: " + str(qubit))
-        conversion.debug_print(current_line_no, "Returning: qubit_" + str(qubit))
-    return "qubit_" + qubit
 
+def get_position_list(qubits):
+    """
+    Format a targets/controls parameter
+    :param qubits: Circuit qubits - positions or symbolic index expressions
+    :return: Single position, or list of positions
+    """
+    if len(qubits) == 1:
+        return str(qubits[0])
+    return "[" + ", ".join(str(qubit) for qubit in qubits) + "]"
 
-def check_for_circuit():
-    global qubit_list
-    global circuit_name
 
-    if args.verbose:
-        conversion.verbose_print(current_line_no, "Checking for circuit definition")
+def get_position(node):
+    """
+    QuTiP qubits are positions in the circuit
+    :param node: Qubit position expression
+    :return: Position as int, or its expression if not a literal
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, int):
+        return node.value
+    return ast.unparse(node)
 
-    for line in file_as_list:
-        if " = QubitCircuit(" in line:
-            new_line = line.split()
-            circuit_name = new_line[0]
-            if args.verbose:
-                conversion.verbose_print(current_line_no, "Found circuit definition. Name: " + str(new_line[0]))
 
-            visit = Visitor()
-            tree = ast.parse(line)
-            visit.visit(tree)
-            return True
-    return False
+def get_positions(node):
+    """
+    Read a targets/controls parameter, which may be a single position or a list
+    :param node: Parameter expression
+    :return: List of qubit positions
+    """
+    if node is None or (isinstance(node, ast.Constant) and node.value is None):
+        return []
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [get_position(element) for element in node.elts]
+    return [get_position(node)]
 
 
-def print_imports():
-    print(file=output_file)
-    print("from projectq import *", file=output_file)
-    print(file=output_file)
+def get_mapped_positions(text):
+    """
+    Read a literal targets/controls parameter of a memory mapped script
+    :param text: Parameter as bytes, or None if not given
+    :return: List of qubit positions, or None if they are not literal positions
+    """
+    if text is None or text == b"None":
+        return []
+    if text[:1] == b"[":
+        return [int(position) for position in text[1:-1].split(b",") if position.strip()]
+    if text.isdigit() and (text == b"0" or text[:1] != b"0"):
+        return [int(text)]
+    return None
 
 
-def print_final_script():
-    print(file=output_file)
-    print("eng.flush()", file=output_file)
-    print(file=output_file)
-    print("# TODO - Add desired measurements", file=output_file)
-    print(file=output_file)
+def look_up_gate(gate, controls, targets, angle):
+    """
+    :param gate: Name of QuTiP gate
+    :param controls: Control qubits
+    :param targets: Target qubits
+    :param angle: arg_value expression, or None
+    :return: Tuple of opcode, and whether the angle is kept, or None if the gate cannot be read
+    """
+    entry = read_gates.get((gate, len(controls), len(targets), angle is not None))
+    if entry is None:
+        entry = read_gates.get((gate, None, len(targets), angle is not None))
+    return entry
 
 
-def set_qubit_count(count):
-    global qubit_count
-    if args.verbose:
-        conversion.verbose_print(current_line_no, "Qubits counted: " + str(ast.literal_eval(count)))
-    qubit_count = ast.literal_eval(count)
+class Reader(conversion.ScriptReader):
+    """
+    Lowers a QuTiP syntax tree into a circuit.
+    add_gate calls become circuit gates; the circuit definition sets the qubit count
+    """
+    def __init__(self, source, verbose=False, debug=False, error_log=None):
+        super().__init__(source, verbose, debug, error_log)
+        self.circuit_name = ""
+        self.current_function = ""
+        self.mapped_names = {}
+        self.mapped_expressions = {}
+
+    def finish(self):
+        if not self.circuit_name:
+            raise error_cqc.NoQubitsError()
+
+    def get_state(self):
+        state = super().get_state()
+        state["circuit_name"] = self.circuit_name
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.circuit_name = state["circuit_name"]
+
+    def visit_Import(self, node):
+        if self.verbose:
+            conversion.verbose_print(node.lineno, "Import statement - ignoring")
+
+    visit_ImportFrom = visit_Import
+
+    def visit_FunctionDef(self, node):
+        if self.verbose:
+            conversion.verbose_print(node.lineno, "Function definition - copying verbatim")
+        self.current_function = node.name
+        self.lower_block(node)
+
+    def visit_Assign(self, node):
+        value = node.value
+        if isinstance(value, ast.Call) and getattr(value.func, "id", None) == "QubitCircuit":
+            # Circuit definition - no equivalent in projectq
+            target = node.targets[0]
+            self.circuit_name = getattr(target, "id", ast.unparse(target))
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Found circuit definition. Name: %s", self.circuit_name)
+            count = conversion.get_int(value.args[0]) if value.args else None
+            if count is None:
+                return
+            if count is False or count < 0:
+                # Size not known, so the definition is kept for the output to make sense of
+                self.add_statement(node)
+                self.error_log.add(node.lineno, self.get_segment(node), diagnostics.UNRESOLVED_SIZE,
+                                   value.args[0].col_offset + 1, diagnostics.WARNING)
+                return
+            self.set_qubit_count(node.lineno, count)
+        else:
+            self.add_statement(node)
+
+    def visit_Expr(self, node):
+        value = node.value
+        if isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute) and value.func.attr == "add_gate":
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Gate detected")
+            if not self.process_gate(node):
+                self.add_untranslated(node)
+        else:
+            # Function calls copied verbatim
+            self.add_statement(node)
+
+    def process_gate(self, node):
+        """
+        Lowers an add_gate call into a circuit gate
+        :param node: Expression statement calling add_gate
+        :return: True if gate added, False if unable to translate
+        """
+        call = node.value
+        params = dict(zip(add_gate_params, call.args))
+        params.update((keyword.arg, keyword.value) for keyword in call.keywords)
+
+        gate_node = params.get("gate")
+        if not isinstance(gate_node, ast.Constant) or not isinstance(gate_node.value, str):
+            return False
+        gate = gate_node.value
+        targets = get_positions(params.get("targets"))
+        controls = get_positions(params.get("controls"))
+        angle = params.get("arg_value")
+        if angle is not None and not (isinstance(angle, ast.Constant) and angle.value is None):
+            angle = ast.unparse(angle)
+        else:
+            angle = None
+        if self.debug:
+            conversion.debug_print(node.lineno, "Gate found: %s", gate)
+
+        entry = look_up_gate(gate, controls, targets, angle)
+        if entry is None:
+            if self.verbose:
+                conversion.verbose_print(node.lineno, "Could not translate %s Gate", gate)
+            return False
+        op, keep_angle = entry
+        self.add_gate(node, op, targets, controls, angle if keep_angle else None)
+        return True
 
-class Visitor(ast.NodeVisitor):
-    def visit_Call(self, node):
-        first_arg = node.args[0]
-        if isinstance(first_arg, ast.Num):
-            set_qubit_count(first_arg)
+    def read_mapped(self, buffer, stats=None):
+        """
+        Lower a whole script held as bytes, e.g. a memory mapped file, into a circuit.
+        Top level add_gate calls with literal arguments are read from their line without parsing or decoding it.
+        Runs of other lines are decoded and lowered as usual, a run at a time. Diagnostics are added to the
+        error log as they are found, so any found before a syntax error has already been reported
+        :param buffer: Input script as a bytes-like buffer
+        :param stats: instrument.Stats to count parses in
+        :return: Circuit of the script, or None if it must be read as text instead - in verbose or debug mode,
+                 which report every line, or if it has line breaks other than "\n" and "\r\n"
+        :raises SyntaxError: If the script does not parse
+        """
+        if self.verbose or self.debug or mapped_fallback.search(buffer):
+            return None
+        size = len(buffer)
+        position = 0
+        line_no = 0
+        # Start and line number of the run of lines waiting to be parsed, if any
+        run_start = None
+        run_line = 0
+        # Size of the run when it last failed to parse - it is only tried again once it has doubled
+        failed_size = 0
+        while position < size:
+            end = buffer.find(b"\n", position)
+            if end < 0:
+                end = size
+            line_no += 1
+            gate = self.scan_mapped_gate(buffer, position, end)
+            if gate is not None and run_start is not None and position - run_start >= 2 * failed_size:
+                try:
+                    self.lower_mapped_run(buffer[run_start:position], run_line, stats)
+                    run_start = None
+                    failed_size = 0
+                except SyntaxError:
+                    # The run ends part way through a statement, e.g. in a string holding gate-like lines.
+                    # Lines are added to it until it parses
+                    failed_size = position - run_start
+            if run_start is None:
+                if gate is not None:
+                    op, targets, controls, param = gate
+                    self.circuit.add_gate(op, targets, controls, param, 0, line_no)
+                elif mapped_blank.match(buffer, position, end):
+                    # Blank lines and comments between gates are kept as lowering them would
+                    self.circuit.add_text(circuit.BLANK, None, 0, line_no)
+                elif mapped_comment.match(buffer, position, end):
+                    self.circuit.add_text(circuit.COMMENT, buffer[position:end].decode().strip(), 0, line_no)
+                else:
+                    run_start = position
+                    run_line = line_no
+            position = end + 1
+        if run_start is not None:
+            self.lower_mapped_run(buffer[run_start:], run_line, stats)
+        return self.circuit
+
+    def lower_mapped_run(self, text, first_line, stats):
+        """
+        Parse and lower a run of whole top level statements
+        :param text: Run of lines as bytes
+        :param first_line: Line number of its first line in the whole script
+        :param stats: instrument.Stats to count parses in, or None
+        :return: None
+        :raises SyntaxError: If the run does not parse on its own
+        """
+        source = conversion.decode_source(text)
+        tree = self.parse(source)
+        if stats is not None:
+            stats.count(instrument.PARSES)
+        self.lower_chunk(source, first_line, tree)
+
+    def scan_mapped_gate(self, buffer, start, end):
+        """
+        Read a line calling add_gate with literal arguments, as process_gate would lower it
+        :param buffer: Input script as a bytes-like buffer
+        :param start: Position of start of line
+        :param end: Position of end of line
+        :return: Tuple of opcode, targets, controls and gate parameter, or None if the line must be parsed
+        """
+        call = mapped_gate_call.match(buffer, start, end)
+        if call is None or not self.is_mapped_name(call.group(1)):
+            return None
+        params = {}
+        keywords = False
+        position = call.end()
+        closed = False
+        while not closed:
+            argument = mapped_argument.match(buffer, position, end)
+            if argument is None:
+                return None
+            name, value, closing = argument.groups()
+            if name is not None:
+                keywords = True
+                name = mapped_keywords.get(name)
+            elif not keywords and len(params) < len(add_gate_params):
+                name = add_gate_params[len(params)]
+            if name is None or name in params:
+                return None
+            params[name] = value
+            position = argument.end()
+            closed = closing == b")"
+            if not closed:
+                # Trailing comma
+                close = mapped_close.match(buffer, position, end)
+                if close is not None:
+                    position = close.end()
+                    closed = True
+        if mapped_line_end.match(buffer, position, end) is None:
+            return None
+
+        gate = params.get("gate")
+        targets = get_mapped_positions(params.get("targets"))
+        controls = get_mapped_positions(params.get("controls"))
+        angle = self.get_mapped_expression(params.get("arg_value", b"None"))
+        if gate is None or gate[:1] not in (b"'", b'"') or targets is None or controls is None or angle is False or \
+                self.get_mapped_expression(params.get("arg_label", b"None")) is False:
+            return None
+        entry = look_up_gate(gate[1:-1].decode(), controls, targets, angle)
+        if entry is None:
+            return None
+        op, keep_angle = entry
+        return op, targets, controls, angle if keep_angle else None
+
+    def is_mapped_name(self, name):
+        """
+        :param name: Object add_gate is called on, as bytes, e.g. b"circuit"
+        :return: True if it is a valid expression, i.e. has no keywords in it
+        """
+        valid = self.mapped_names.get(name)
+        if valid is None:
+            parts = name.decode().split(".")
+            valid = parts[0] in ("None", "True", "False") or not keyword.iskeyword(parts[0])
+            valid = valid and not any(keyword.iskeyword(part) for part in parts[1:])
+            self.mapped_names[name] = valid
+        return valid
+
+    def get_mapped_expression(self, text):
+        """
+        Expressions are parsed once, however many gates use them
+        :param text: Expression as bytes, e.g. b"pi / 2"
+        :return: Expression as process_gate gives it, None for None, or False if it does not parse
+        """
+        if text not in self.mapped_expressions:
+            try:
+                node = ast.parse(text.decode(), mode="eval").body
+            except (SyntaxError, UnicodeDecodeError):
+                expression = False
+            else:
+                expression = None if isinstance(node, ast.Constant) and node.value is None else ast.unparse(node)
+            self.mapped_expressions[text] = expression
+        return self.mapped_expressions[text]
+
+    def set_qubit_count(self, line_no, count):
+        if self.verbose:
+            conversion.verbose_print(line_no, "Qubits counted: %d", count)
+        self.circuit.num_qubits = max(self.circuit.num_qubits, count)
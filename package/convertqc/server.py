@@ -0,0 +1,342 @@
+#    Long-running conversion server for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+# Converts scripts sent by editors and notebooks, without starting a process for each.
+# Requests are JSON objects:
+#     {"id": 1, "source": "H | qureg[0]", "from": "projectq", "to": "qutip"}
+# with optional "filename", "mark", "pep8", "optimize" and "severity", as on the command line.
+# Responses are JSON objects with the request's id, and either the converted "code", its "diagnostics", their
+# "counts" and "stats", or an "error" with a "code" and "message".
+# Over a Unix socket each line is one request, and each response one line, sent as soon as it is ready - so
+# a client can send several requests at once, matching responses by id. Over HTTP, each request is POSTed to
+# /convert, and GET /formats lists the formats.
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import converter, diagnostics, error_cqc, plugins
+
+# Largest request accepted, in bytes
+MAX_REQUEST = 64 * 1024 * 1024
+
+
+class ConversionService:
+    """
+    Converts requests on a pool of worker threads, with converters kept warm between requests.
+    Converters hold only options, so one of each set of options is made and shared by every worker
+    """
+    def __init__(self, workers=None, use_cache=True):
+        """
+        :param workers: Number of conversions run at once (default: one per CPU)
+        :param use_cache: Reuse and store results in the on-disk cache shared with the command line
+        """
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.result_cache = None
+        if use_cache:
+            from . import cache
+            self.result_cache = cache.ResultCache()
+        self.converters = {}
+        self.lock = threading.Lock()
+
+    def get_converter(self, mark, pep8, optimize, severity):
+        key = (mark, pep8, optimize, severity)
+        with self.lock:
+            if key not in self.converters:
+                passes = None
+                if optimize:
+                    from . import optimize as optimize_module
+                    passes = optimize_module.PASSES
+                self.converters[key] = converter.Converter(mark, pep8, result_cache=self.result_cache, passes=passes,
+                                                           severity=severity)
+            return self.converters[key]
+
+    def submit(self, request):
+        """
+        :param request: Request, as a dictionary, or None if it could not be read
+        :return: Future of the response dictionary
+        """
+        return self.executor.submit(self.handle, request)
+
+    def handle(self, request):
+        """
+        Convert one request. Runs on a worker thread, and never raises
+        :param request: Request, as a dictionary, or None if it could not be read
+        :return: Response dictionary
+        """
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            return dict(self.convert(request), id=request_id)
+        except error_cqc.ConversionError as e:
+            return error_response(request_id, e.code, str(e))
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else error_cqc.UNEXPECTED_CONVERSION_ERROR
+            return error_response(request_id, code, error_cqc.error_messages.get(code, str(e.code)))
+        except Exception as e:
+            return error_response(request_id, error_cqc.UNEXPECTED_CONVERSION_ERROR, type(e).__name__ + ": " + str(e))
+
+    def convert(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get("source"), str) or \
+                not isinstance(request.get("from"), str) or not isinstance(request.get("to"), str):
+            raise error_cqc.InvalidRequestError()
+        severity = request.get("severity", diagnostics.INFO)
+        if severity not in diagnostics.SEVERITIES:
+            raise error_cqc.InvalidRequestError()
+        script_converter = self.get_converter(bool(request.get("mark", True)), bool(request.get("pep8", False)),
+                                              bool(request.get("optimize", False)), severity)
+        result = script_converter.convert(request["source"], request["from"], request["to"],
+                                          str(request.get("filename", "")))
+        return {
+            "code": result.code,
+            "diagnostics": [diagnostic.to_dict() for diagnostic in result.diagnostics],
+            "counts": dict(result.counts),
+            "cached": result.cached,
+            "stats": result.stats.to_dict()
+        }
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def error_response(request_id, code, message):
+    return {"id": request_id, "error": {"code": code, "message": message}}
+
+
+def parse_request(data):
+    """
+    :param data: Request as JSON text or bytes
+    :return: Request dictionary, or None if it is not valid JSON
+    """
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def list_formats():
+    """
+    :return: Every format and what it can do, as a response dictionary
+    """
+    formats = {}
+    for name in plugins.names():
+        try:
+            format_in = plugins.get_format(name)
+        except (ImportError, KeyError):
+            continue
+        formats[name] = {"name": format_in.display_name, "reads": format_in.reads, "writes": format_in.writes,
+                         "streams": format_in.streams}
+    return {"formats": formats}
+
+
+class SocketHandler(socketserver.StreamRequestHandler):
+    """
+    Reads requests from one connection a line at a time, sending each response as it is ready
+    """
+    def handle(self):
+        # Responses are written as each finishes, so the connection is only closed once all are sent
+        done = threading.Condition()
+        outstanding = [0]
+
+        def send(future):
+            line = (json.dumps(future.result()) + "\n").encode()
+            with done:
+                try:
+                    self.wfile.write(line)
+                    self.wfile.flush()
+                except OSError:
+                    # Client has gone - the rest of its responses are dropped
+                    pass
+                outstanding[0] -= 1
+                done.notify()
+
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            with done:
+                outstanding[0] += 1
+            self.server.service.submit(parse_request(line)).add_done_callback(send)
+        with done:
+            done.wait_for(lambda: outstanding[0] == 0)
+
+
+class SocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class HTTPHandler(BaseHTTPRequestHandler):
+    """
+    Converts a request POSTed to /convert, and lists the formats at /formats
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/formats":
+            self.send_json(200, list_formats())
+        else:
+            self.send_json(404, error_response(None, error_cqc.INVALID_REQUEST, "Not found"))
+
+    def do_POST(self):
+        if self.path != "/convert":
+            self.send_json(404, error_response(None, error_cqc.INVALID_REQUEST, "Not found"))
+            return
+        # The body is read to exactly its length, so a length which is missing or not a count is refused
+        # rather than read to the end of the connection
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, error_response(None, error_cqc.INVALID_REQUEST, "Content-Length required"))
+            self.close_connection = True
+            return
+        if length > MAX_REQUEST:
+            self.send_json(413, error_response(None, error_cqc.INVALID_REQUEST, "Request too large"))
+            self.close_connection = True
+            return
+        response = self.server.service.submit(parse_request(self.rfile.read(length))).result()
+        self.send_json(400 if "error" in response else 200, response)
+
+    def send_json(self, status, response):
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Requests are not logged, as an editor may send one every keystroke
+        pass
+
+
+class HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def create_server(service, socket_path=None, port=None):
+    """
+    Create a server for the service, listening on a Unix socket or a localhost HTTP port
+    :param service: ConversionService to convert requests with
+    :param socket_path: Path of Unix socket to listen on. A socket left by a server which was stopped is replaced
+    :param port: Localhost TCP port to serve HTTP on, if socket_path is not given (0 picks a free port)
+    :return: Server, with serve_forever and server_close
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.unlink(socket_path)
+        server = SocketServer(socket_path, SocketHandler)
+    else:
+        server = HTTPServer(("127.0.0.1", port or 0), HTTPHandler)
+    server.service = service
+    return server
+
+
+class Client:
+    """
+    Sends requests to a server listening on a Unix socket, one at a time. For notebooks and tests
+    """
+    def __init__(self, socket_path):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(socket_path)
+        self.reader = self.connection.makefile("rb")
+        self.next_id = 0
+
+    def convert(self, source, src="projectq", dst="qutip", **options):
+        """
+        :param source: Input script as a string
+        :param src: Format of input script
+        :param dst: Format to convert to
+        :param options: filename, mark, pep8, optimize or severity
+        :return: Response dictionary
+        """
+        self.next_id += 1
+        request = dict(options, id=self.next_id, source=source)
+        request["from"] = src
+        request["to"] = dst
+        self.connection.sendall((json.dumps(request) + "\n").encode())
+        return json.loads(self.reader.readline())
+
+    def close(self):
+        self.reader.close()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def main(argv):
+    """
+    Entry point for "convertqc serve"
+    :param argv: Arguments after the subcommand
+    :return: None
+    """
+    args = process_args(argv)
+    service = ConversionService(args.workers, not args.no_cache)
+    server = create_server(service, args.socket, args.port)
+    if args.socket is not None:
+        print("Serving on " + args.socket + ". Press Ctrl+C to stop")
+    else:
+        print("Serving on http://127.0.0.1:" + str(server.server_address[1]) + ". Press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped serving")
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+def process_args(argv):
+    """
+    Creates the ArgumentParser for the serve subcommand
+    :param argv: Arguments after the subcommand
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="convertqc serve",
+        description="Convert scripts sent over a Unix socket or localhost HTTP, keeping the converter running "
+                    "between requests")
+
+    listen = parser.add_mutually_exclusive_group(required=True)
+    listen.add_argument(
+        "--socket",
+        help="Unix socket to listen on, taking one JSON request per line")
+    listen.add_argument(
+        "--port",
+        help="localhost port to serve HTTP on, taking JSON requests POSTed to /convert",
+        type=int)
+    parser.add_argument(
+        "-j",
+        "--workers",
+        help="conversions run at once (default: one per CPU)",
+        type=int)
+    parser.add_argument(
+        "--no-cache",
+        help="do not reuse or store conversion results in the cache (default: ~/.cache/convertqc)",
+        action="store_true")
+
+    return parser.parse_args(argv)
@@ -0,0 +1,154 @@
+#    Streaming conversion of large scripts for ConvertQC
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import ast
+import re
+import shutil
+import tempfile
+
+from . import conversion, error_cqc, instrument
+
+# Lines gathered before looking for the end of a statement to split at
+CHUNK_LINES = 2000
+# Converted output is kept in memory up to this size, then moved to a temporary file
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Top level lines which continue the statement before them
+CONTINUATION = re.compile(r"(else|elif|except|finally)\b")
+
+
+def convert_stream(input_file, output_file, reader, writer, mark=True, error_log=None, chunk_lines=CHUNK_LINES,
+                   stats=None):
+    """
+    Convert a script a part at a time, so memory use does not grow with the size of the script.
+    The header needs the size of the whole circuit, so the converted body is spooled and written after it
+    :param input_file: Open input file, or any iterable of lines
+    :param output_file: Output file or conversion.OutputSink to write to
+    :param reader: ScriptReader of the input format
+    :param writer: Module of the output format, with header_lines, script_lines and footer_lines
+    :param mark: Add comments identifying untranslated lines
+    :param error_log: ErrorLog to add gates with no equivalent to
+    :param chunk_lines: Lines to gather before looking for the end of a statement
+    :param stats: instrument.Stats to add to (default: none kept)
+    :return: None
+    """
+    if stats is None:
+        stats = instrument.Stats()
+    tidier = conversion.BlankLineTidier()
+    # Blank lines after the header do not depend on its qubit count, so the body can be tidied before it is known
+    tidier.tidy(writer.header_lines(0))
+
+    with tempfile.SpooledTemporaryFile(SPOOL_SIZE, mode="w+") as body:
+        for first_line, source, tree in read_chunks(input_file, chunk_lines, reader, stats):
+            with stats.time(instrument.CONVERT):
+                part = reader.read_chunk(source, first_line, tree)
+            stats.count_gates(part)
+            with stats.time(instrument.EMIT):
+                write_tidied(body, tidier.tidy(writer.script_lines(part, mark, error_log)))
+        reader.finish()
+
+        with stats.time(instrument.EMIT):
+            write_tidied(body, tidier.tidy(writer.footer_lines()))
+            write_tidied(output_file, conversion.tidy_blank_lines(writer.header_lines(reader.circuit.num_qubits)))
+            body.seek(0)
+            shutil.copyfileobj(body, output_file)
+
+
+def write_tidied(output_file, lines):
+    if lines:
+        output_file.write("\n".join(lines) + "\n")
+
+
+def read_chunks(input_file, chunk_lines=CHUNK_LINES, reader=None, stats=None):
+    """
+    Split a script into parts made of whole top level statements, reading it a line at a time.
+    Comments and blank lines are kept in the same part as the statement after them
+    :param input_file: Open input file, or any iterable of lines
+    :param chunk_lines: Lines to gather before looking for the end of a statement
+    :param reader: Reader of the input format, which splits and parses it (default: Python)
+    :param stats: instrument.Stats to count lines and parses, and time parsing in (default: none kept)
+    :return: Generator of (first line number, source, parsed part) for each part
+    """
+    split = split_statements if reader is None else reader.split_statements
+    parse = ast.parse if reader is None else reader.parse
+    if stats is None:
+        stats = instrument.Stats()
+    parts = []
+    size = 0
+    first_line = 1
+    # A part which does not parse is only retried once it has doubled, so broken scripts stay linear
+    next_attempt = chunk_lines
+
+    for line_no, statement, num_lines in split(input_file):
+        if size >= next_attempt:
+            source = "".join(parts)
+            stats.count(instrument.PARSES)
+            try:
+                with stats.time(instrument.PRESCAN):
+                    tree = parse(source)
+            except SyntaxError:
+                next_attempt = size * 2
+            else:
+                yield first_line, source, tree
+                first_line = line_no
+                parts = []
+                size = 0
+                next_attempt = chunk_lines
+        parts.append(statement)
+        size += num_lines
+        stats.count(instrument.LINES, num_lines)
+
+    if parts:
+        source = "".join(parts)
+        stats.count(instrument.PARSES)
+        try:
+            with stats.time(instrument.PRESCAN):
+                tree = parse(source)
+        except SyntaxError:
+            raise error_cqc.InputSyntaxError()
+        yield first_line, source, tree
+
+
+def split_statements(input_file):
+    """
+    Split a script at every line which looks like the start of a top level statement, without parsing it.
+    Comments and blank lines go with the statement after them. As nothing is parsed, a part may
+    still end inside a bracket or string which a later part closes
+    :param input_file: Open input file, or any iterable of lines
+    :return: Generator of (first line number, source, number of lines) for each part
+    """
+    buffer = []
+    # Comments and blank lines since the last line of code
+    pending = []
+    first_line = 1
+
+    for line in input_file:
+        stripped = line.strip()
+        if not stripped or (stripped[0] == "#" and not line[0].isspace()):
+            pending.append(line)
+            continue
+
+        if buffer and not line[0].isspace() and not CONTINUATION.match(line) and not buffer[-1].startswith("@"):
+            yield first_line, "".join(buffer), len(buffer)
+            first_line += len(buffer)
+            buffer = []
+        buffer.extend(pending)
+        pending = []
+        buffer.append(line)
+
+    buffer.extend(pending)
+    if buffer:
+        yield first_line, "".join(buffer), len(buffer)
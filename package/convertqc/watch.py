@@ -0,0 +1,324 @@
+#    Watch mode for ConvertQC - reconverts scripts as they are saved
+#    Run "convertqc watch -h" for details.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import argparse
+import contextlib
+import ctypes
+import io
+import os
+import select
+import struct
+import sys
+import time
+
+from . import batch, converter, error_cqc, plugins
+
+# inotify event flags, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# Events arriving this soon after another are handled together, as editors often save in several steps
+SETTLE_TIME = 0.05
+
+
+def main(argv):
+    """
+    Entry point for "convertqc watch"
+    :param argv: Arguments after the subcommand
+    :return: None
+    """
+    args = process_args(argv)
+    if args.input_format == args.output_format:
+        error_cqc.process_error(error_cqc.MATCHING_INPUT_OUTPUT, True)
+    if not os.path.isdir(args.source_dir):
+        error_cqc.process_error(error_cqc.INPUT_DIRECTORY_NOT_FOUND, True)
+
+    # One converter is kept warm for the whole session
+    script_converter = converter.Converter(args.mark, args.pep8)
+    excluded = os.path.abspath(args.output_dir)
+    extension = plugins.get_format(args.input_format).extension
+    stale = [path for path in find_scripts(args.source_dir, excluded, extension)
+             if is_stale(args.source_dir, args.output_dir, path, args.output_format)]
+    convert_files(script_converter, args.source_dir, args.output_dir, stale, args.input_format, args.output_format)
+
+    watcher = create_watcher(args.source_dir, args.interval, extension)
+    print("Watching " + args.source_dir + " (" + type(watcher).__name__ + "). Press Ctrl+C to stop")
+    try:
+        while True:
+            changed = [path for path in watcher.poll() if not batch.is_excluded(args.source_dir, path, excluded)]
+            convert_files(script_converter, args.source_dir, args.output_dir, changed, args.input_format,
+                          args.output_format)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.close()
+
+
+def convert_files(script_converter, source_dir, output_dir, relative_paths, input_format, output_format):
+    """
+    Convert changed scripts, only translating the statements which changed in each where both formats can be
+    converted a statement at a time, and converting them whole where not
+    :param script_converter: Converter to use
+    :param source_dir: Directory of input scripts
+    :param output_dir: Directory to write converted scripts to
+    :param relative_paths: Paths of changed scripts, relative to source_dir
+    :param input_format: Format of input scripts
+    :param output_format: Format to convert to
+    :return: List of batch.FileResult
+    """
+    if plugins.get_format(input_format).streams and plugins.get_format(output_format).streams:
+        convert = script_converter.convert_incremental
+    else:
+        convert = script_converter.convert_file
+    results = []
+    for relative_path in relative_paths:
+        output_path = os.path.join(output_dir, batch.output_name(relative_path, output_format))
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = convert(os.path.join(source_dir, relative_path), output_path, input_format, output_format)
+        except error_cqc.ConversionError as e:
+            results.append(batch.FileResult(relative_path, e.code, str(e)))
+        except Exception as e:
+            results.append(batch.FileResult(relative_path, error_cqc.UNEXPECTED_CONVERSION_ERROR,
+                                            type(e).__name__ + ": " + str(e)))
+        else:
+            results.append(batch.FileResult(relative_path, error_lines=result.error_lines))
+
+    for result in results:
+        if result.failed:
+            print("FAILED " + result.relative_path + " - " + result.message)
+        else:
+            print("Converted " + result.relative_path + " (" + str(len(result.error_lines)) + " untranslated lines)")
+    return results
+
+
+def find_scripts(source_dir, excluded, extension=".py"):
+    """
+    Find every script below a directory, apart from those in the output directory
+    :param source_dir: Directory to search
+    :param excluded: Absolute path of output directory
+    :param extension: Extension of scripts
+    :return: Sorted list of paths relative to source_dir
+    """
+    return batch.find_scripts(source_dir, extension, excluded)
+
+
+def is_stale(source_dir, output_dir, relative_path, output_format):
+    """
+    Check whether a script has changed since it was last converted
+    :return: True if output is missing or older than the script
+    """
+    output_path = os.path.join(output_dir, batch.output_name(relative_path, output_format))
+    if not os.path.exists(output_path):
+        return True
+    return os.path.getmtime(os.path.join(source_dir, relative_path)) > os.path.getmtime(output_path)
+
+
+def create_watcher(source_dir, interval=1.0, extension=".py"):
+    """
+    Watch with inotify where the platform has it, otherwise poll for changes
+    :param source_dir: Directory to watch
+    :param interval: Seconds between polls, if polling
+    :param extension: Extension of scripts watched
+    :return: InotifyWatcher or PollingWatcher
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(source_dir, extension)
+        except OSError:
+            pass
+    return PollingWatcher(source_dir, interval, extension)
+
+
+class PollingWatcher:
+    """
+    Finds changed scripts by comparing modification times and sizes of every script in a directory
+    """
+    def __init__(self, source_dir, interval=1.0, extension=".py"):
+        """
+        :param source_dir: Directory to watch
+        :param interval: Seconds between polls
+        :param extension: Extension of scripts watched
+        """
+        self.source_dir = source_dir
+        self.interval = interval
+        self.extension = extension
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for relative_path in batch.find_scripts(self.source_dir, self.extension):
+            try:
+                stat = os.stat(os.path.join(self.source_dir, relative_path))
+            except OSError:
+                continue
+            snapshot[relative_path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self, timeout=None):
+        """
+        Wait for scripts to change
+        :param timeout: Seconds to wait, or None to wait until something changes
+        :return: Sorted list of changed paths relative to the directory, empty if timed out
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.scan()
+            changed = sorted(path for path, stamp in snapshot.items() if self.snapshot.get(path) != stamp)
+            self.snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Finds changed scripts using Linux inotify, through the C library, so nothing is scanned between saves
+    """
+    def __init__(self, source_dir, extension=".py"):
+        """
+        :param source_dir: Directory to watch
+        :param extension: Extension of scripts watched
+        :raises OSError: If inotify is not available
+        """
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify not available")
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.source_dir = source_dir
+        self.extension = extension
+        # Watch descriptor to watched directory, relative to source_dir
+        self.directories = {}
+        for root, dirs, files in os.walk(source_dir):
+            self.add_watch(os.path.relpath(root, source_dir))
+
+    def add_watch(self, relative_dir):
+        path = os.path.join(self.source_dir, relative_dir)
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.directories[wd] = os.path.normpath(relative_dir)
+
+    def poll(self, timeout=None):
+        """
+        Wait for scripts to change
+        :param timeout: Seconds to wait, or None to wait until something changes
+        :return: Sorted list of changed paths relative to the directory, empty if timed out
+        """
+        changed = set()
+        wait = timeout
+        while True:
+            ready, _, _ = select.select([self.fd], [], [], wait)
+            if not ready:
+                return sorted(changed)
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            if self.read_events(data, changed):
+                # Events were dropped - treat every script as changed
+                changed.update(batch.find_scripts(self.source_dir, self.extension))
+            if changed:
+                wait = SETTLE_TIME
+
+    def read_events(self, data, changed):
+        """
+        Add the scripts named by a buffer of inotify events to changed
+        :return: True if the event queue overflowed
+        """
+        overflowed = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b"\0"))
+            offset += 16 + length
+
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+            elif wd in self.directories:
+                relative_path = os.path.normpath(os.path.join(self.directories[wd], name))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self.add_watch(relative_path)
+                        # Scripts may have been written before the new directory was watched
+                        directory = os.path.join(self.source_dir, relative_path)
+                        changed.update(os.path.join(relative_path, path)
+                                       for path in batch.find_scripts(directory, self.extension))
+                elif name.endswith(self.extension) and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    changed.add(relative_path)
+        return overflowed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def process_args(argv):
+    """
+    Creates the ArgumentParser for the watch subcommand
+    :param argv: Arguments after the subcommand
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="convertqc watch",
+        description="Reconvert scripts in a directory tree whenever they are saved")
+
+    parser.add_argument("source_dir", help="directory of input scripts")
+    parser.add_argument("output_dir", help="directory to write converted scripts to")
+    parser.add_argument(
+        "--from",
+        dest="input_format",
+        help="input format of your scripts",
+        choices=list(converter.readers),
+        required=True)
+    parser.add_argument(
+        "--to",
+        dest="output_format",
+        help="output format of your scripts",
+        choices=list(converter.writers),
+        required=True)
+    parser.add_argument(
+        "--interval",
+        help="seconds between checks when inotify is not available (default: 1)",
+        type=float,
+        default=1.0)
+    parser.add_argument(
+        "-m",
+        "--mark",
+        help="disable comments in code to identify untranslated lines",
+        action="store_false")
+    parser.add_argument(
+        "-p",
+        "--pep8",
+        help="format output with autopep8 (must be installed)",
+        action="store_true")
+
+    return parser.parse_args(argv)
@@ -14,7 +14,7 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>
 
-from distutils.core import setup
+from setuptools import setup
 
 from os import path
 
@@ -39,5 +39,12 @@ setup(
     },
 
     packages=['convertqc'],
-    install_requires=['autopep8>=1.4.4', 'qutip>=4.3.1', 'projectq>=0.4.2', 'argcomplete>=1.9.2', ],
+    # Scripts are converted without importing the toolkits they are written for, so none are required
+    install_requires=[],
+    extras_require={
+        'pep8': ['autopep8>=1.4.4'],
+        'completion': ['argcomplete>=1.9.2'],
+        'projectq': ['projectq>=0.4.2'],
+        'qutip': ['qutip>=4.3.1'],
+    },
 )
@@ -0,0 +1,134 @@
+#    Unit tests for aio.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import asyncio
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import aio, converter, error_cqc
+
+print("RUNNING TESTS - aio.py")
+
+SCRIPT = "qureg = eng.allocate_qureg(2)\nH | qureg[0]\nCNOT | (qureg[0], qureg[1])\n"
+
+
+class BlockedConverter(converter.Converter):
+    """
+    Waits to be released before converting, so a conversion can be cancelled part way through
+    """
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.finished = threading.Event()
+
+    def convert(self, *args):
+        self.started.set()
+        self.release.wait()
+        return super().convert(*args)
+
+    def read_circuit_file(self, *args):
+        self.started.set()
+        self.release.wait()
+        result = super().read_circuit_file(*args)
+        self.finished.set()
+        return result
+
+
+class AioTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def write_script(self, name, source=SCRIPT):
+        with open(self.path(name), "w") as f:
+            f.write(source)
+        return self.path(name)
+
+    def testConvertFile(self):
+        input_filename = self.write_script("bell.py")
+        result = asyncio.run(aio.convert_file(input_filename, self.path("bell_qasm.qasm"), "projectq", "qasm"))
+        with open(self.path("bell_qasm.qasm")) as f:
+            self.assertEqual(f.read(), result.code)
+        self.assertEqual(result.code, converter.convert(SCRIPT, "projectq", "qasm").code)
+        self.assertEqual(asyncio.run(aio.convert(SCRIPT, "projectq", "qasm")).code, result.code)
+
+    def testTypedErrors(self):
+        with self.assertRaises(error_cqc.InputFileNotFoundError) as context:
+            asyncio.run(aio.convert_file(self.path("missing.py"), self.path("out.py")))
+        self.assertEqual(context.exception.code, error_cqc.INPUT_FILE_NOT_FOUND)
+        with self.assertRaises(error_cqc.InputSyntaxError):
+            asyncio.run(aio.convert("H |", "projectq", "qutip"))
+        # Errors keep their type and code when raised in a worker process
+        error = pickle.loads(pickle.dumps(error_cqc.UnsupportedFormatError()))
+        self.assertIsInstance(error, error_cqc.UnsupportedFormatError)
+        self.assertEqual(str(error), error_cqc.error_messages[error_cqc.UNSUPPORTED_FORMAT])
+
+    def testConvertMany(self):
+        files = [(self.write_script("a.py"), self.path("a_out.py")), (self.path("missing.py"), self.path("b_out.py")),
+                 (self.write_script("c.py"), self.path("c_out.py"))]
+        results = asyncio.run(aio.convert_many(files, limit=2, return_exceptions=True))
+        self.assertIsInstance(results[1], error_cqc.InputFileNotFoundError)
+        self.assertEqual(results[0].code, results[2].code)
+        self.assertTrue(os.path.exists(self.path("c_out.py")))
+        with self.assertRaises(error_cqc.InputFileNotFoundError):
+            asyncio.run(aio.convert_many(files))
+
+    def testCancel(self):
+        input_filename = self.write_script("bell.py")
+        script_converter = BlockedConverter()
+
+        async def cancel_part_way():
+            task = asyncio.ensure_future(aio.convert_file(input_filename, self.path("out.py"),
+                                                          script_converter=script_converter))
+            await asyncio.to_thread(script_converter.started.wait)
+            task.cancel()
+            try:
+                await task
+            finally:
+                script_converter.release.set()
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancel_part_way())
+        self.assertFalse(os.path.exists(self.path("out.py")))
+
+    def testCancelCircuitFile(self):
+        input_filename = self.write_script("bell.py")
+        script_converter = BlockedConverter()
+
+        async def cancel_part_way():
+            task = asyncio.ensure_future(aio.convert_file(input_filename, self.path("bell.cqc"), "projectq", "cqc",
+                                                          script_converter=script_converter))
+            await asyncio.to_thread(script_converter.started.wait)
+            task.cancel()
+            try:
+                await task
+            finally:
+                script_converter.release.set()
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancel_part_way())
+        # The circuit is still read on its thread, but never saved
+        self.assertTrue(script_converter.finished.wait(5))
+        self.assertFalse(os.path.exists(self.path("bell.cqc")))
@@ -0,0 +1,101 @@
+#    Unit tests for batch.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import batch, diagnostics
+
+print("RUNNING TESTS - batch.py")
+
+
+class ConvertDirectoryTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, "src")
+        self.output_dir = os.path.join(self.temp_dir.name, "dst")
+        os.makedirs(os.path.join(self.source_dir, "nested"))
+        self.write("good.py", "c = QubitCircuit(1)\nc.add_gate(\"SNOT\", 0)\n")
+        self.write("nested/also_good.py", "c = QubitCircuit(2)\nc.add_gate(\"ISWAP\", [0, 1])\n")
+        self.write("broken.py", "c = (\n")
+        self.write("notes.txt", "not a script")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, relative_path, text):
+        with open(os.path.join(self.source_dir, relative_path), "w") as f:
+            f.write(text)
+
+    def test_failure_does_not_abort_batch(self):
+        results = batch.convert_directory(self.source_dir, self.output_dir, "qutip", "projectq", jobs=1)
+        self.assertListEqual([result.relative_path for result in results],
+                             ["broken.py", "good.py", os.path.join("nested", "also_good.py")])
+        self.assertTrue(results[0].failed)
+        self.assertFalse(results[1].failed)
+        self.assertEqual(len(results[2].error_lines), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "nested", "also_good.py")))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "broken.py")))
+
+    def test_process_pool(self):
+        results = batch.convert_directory(self.source_dir, self.output_dir, "qutip", "projectq", jobs=2)
+        self.assertEqual([result.failed for result in results], [True, False, False])
+        with open(os.path.join(self.output_dir, "good.py")) as f:
+            self.assertIn("H | qureg[0]", f.read())
+
+    def test_diagnostics_written_per_file(self):
+        output = io.StringIO()
+        results = batch.convert_directory(self.source_dir, self.output_dir, "qutip", "projectq", jobs=1,
+                                          diagnostic_writer=diagnostics.DiagnosticWriter(output))
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertListEqual([(record["file"], record["line"], record["category"]) for record in records],
+                             [(os.path.join("nested", "also_good.py"), 2, diagnostics.NO_EQUIVALENT_GATE)])
+        self.assertEqual(results[2].counts, {diagnostics.NO_EQUIVALENT_GATE: 1})
+        self.assertListEqual(results[2].records, [])
+
+    def test_format_extensions(self):
+        # Scripts are found by the input format's extension, and written with the output format's
+        self.write("circuit.qasm", "OPENQASM 2.0;\nqreg q[1];\nh q[0];\n")
+        results = batch.convert_directory(self.source_dir, self.output_dir, "qasm", "qutip", jobs=1)
+        self.assertListEqual([result.relative_path for result in results], ["circuit.qasm"])
+        self.assertFalse(results[0].failed)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "circuit.py")))
+
+        results = batch.convert_directory(self.source_dir, self.output_dir, "qutip", "qasm", jobs=1)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "good.qasm")))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "good.py")))
+
+    def test_output_directory_failure_is_per_file(self):
+        # A file where the output of nested/ needs a directory only fails the files inside it
+        os.makedirs(self.output_dir)
+        with open(os.path.join(self.output_dir, "nested"), "w") as f:
+            f.write("")
+        results = batch.convert_directory(self.source_dir, self.output_dir, "qutip", "projectq", jobs=1)
+        self.assertEqual([result.failed for result in results], [True, False, True])
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "good.py")))
+
+    def test_output_inside_source_not_converted(self):
+        output_dir = os.path.join(self.source_dir, "converted")
+        first = batch.convert_directory(self.source_dir, output_dir, "qutip", "projectq", jobs=1)
+        second = batch.convert_directory(self.source_dir, output_dir, "qutip", "projectq", jobs=1)
+        self.assertTrue(os.path.exists(os.path.join(output_dir, "good.py")))
+        self.assertListEqual([result.relative_path for result in second],
+                             [result.relative_path for result in first])
@@ -0,0 +1,64 @@
+#    Unit tests for the benchmark harness.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import sys
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from benchmark import benchmark, generate, startup
+from convertqc import converter
+
+print("RUNNING TESTS - benchmark.py")
+
+
+class GenerateTests(unittest.TestCase):
+    def testProjectQScript(self):
+        result = converter.convert(generate.projectq_script(num_qubits=5, num_functions=3, gates_per_block=7,
+                                                            nesting=0))
+        self.assertEqual(result.circuit.num_qubits, 5)
+        self.assertEqual(result.circuit.gate_count(), 21)
+        self.assertListEqual(result.error_lines, [])
+
+    def testQuTiPScripts(self):
+        result = converter.convert(generate.qutip_script(num_qubits=4, num_functions=2, gates_per_block=7,
+                                                         nesting=3), "qutip", "projectq")
+        self.assertEqual(result.circuit.gate_count(), 56)
+        self.assertListEqual(result.error_lines, [])
+        flat = converter.convert(generate.flat_qutip_script(num_qubits=3, num_gates=100), "qutip", "projectq")
+        self.assertEqual(flat.circuit.gate_count(), 100)
+
+
+class BenchmarkTests(unittest.TestCase):
+    def testRunAndCompare(self):
+        results = benchmark.run_benchmarks(repeat=1, only=["example_qutip", "qutip_flat"])
+        self.assertListEqual([result["name"] for result in results["results"]], ["example_qutip", "qutip_flat"])
+        self.assertListEqual(sorted(results["results"][1]["stages"]), sorted(benchmark.STAGES))
+        self.assertListEqual(benchmark.compare(results, results, 1.2), [])
+
+        slower = {"results": [dict(result, total=result["total"] / 2) for result in results["results"]]}
+        regressions = benchmark.compare(results, slower, 1.2)
+        self.assertTrue(any(regression.startswith("qutip_flat total") for regression in regressions))
+
+
+class StartupTests(unittest.TestCase):
+    def testOnlyUsedModulesImported(self):
+        results = startup.run_benchmarks(repeat=1, only=["help", "qutip_projectq"])
+        help_run, conversion_run = results["results"]
+        self.assertNotIn("convertqc.process_projectq", help_run["modules"])
+        self.assertIn("convertqc.process_qutip", conversion_run["modules"])
+        self.assertNotIn("convertqc.process_qiskit", conversion_run["modules"])
+        self.assertNotIn("convertqc.optimize", conversion_run["modules"])
+        self.assertListEqual(startup.compare(results, results, 1.2), [])
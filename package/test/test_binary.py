@@ -0,0 +1,125 @@
+#    Unit tests for binary.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import binary, circuit, converter, error_cqc
+
+print("RUNNING TESTS - binary.py")
+
+SCRIPT = "q0 = eng.allocate_qubit()\nq1 = eng.allocate_qubit()\nH | q0\nRz(pi / 3) | q1\nCNOT | (q0, q1)\n" \
+         "UnknownGate | q0\n"
+
+
+class BinaryTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.temp_dir.name, "circuit.cqc")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def testRoundTrip(self):
+        source = circuit.Circuit()
+        source.qubit_names = ["a", "b"]
+        source.add_text(circuit.COMMENT, "# Bell pair")
+        source.add_gate(circuit.H, [0])
+        source.add_gate(circuit.X, [1], [0], depth=1, line=7)
+        source.add_gate(circuit.RZ, ["qb"], param="theta")
+        binary.save_circuit(source, self.filename, "projectq", ["6 - UnknownGate | q0"])
+
+        loaded, input_format, error_lines = binary.load_circuit(self.filename)
+        self.addCleanup(loaded.close)
+        self.assertEqual(input_format, "projectq")
+        self.assertEqual(error_lines, ["6 - UnknownGate | q0"])
+        self.assertEqual(loaded.num_qubits, 2)
+        self.assertEqual(list(loaded.qubit_names), ["a", "b"])
+        self.assertEqual(len(loaded), len(source))
+        for i in range(len(source)):
+            self.assertEqual(loaded.ops[i], source.ops[i])
+            self.assertEqual(loaded.depths[i], source.depths[i])
+            self.assertEqual(loaded.lines[i], source.lines[i])
+            self.assertEqual(loaded.text(i), source.text(i))
+            if source.ops[i] >= circuit.FIRST_GATE:
+                self.assertEqual(loaded.qubits(i), source.qubits(i))
+        self.assertFalse(os.path.exists(self.filename + ".part"))
+
+    def testEmptyCircuit(self):
+        binary.save_circuit(circuit.Circuit(), self.filename)
+        loaded, input_format, error_lines = binary.load_circuit(self.filename)
+        self.assertEqual((len(loaded), input_format, error_lines), (0, "", []))
+
+    def testCloseUnmapsFile(self):
+        binary.save_circuit(circuit.Circuit(2), self.filename, "qasm")
+        loaded, input_format, error_lines = binary.load_circuit(self.filename)
+        with loaded:
+            self.assertEqual(list(loaded.qubit_names), [])
+        self.assertTrue(loaded.mapping.closed)
+        self.assertRaises(ValueError, len, loaded)
+
+    def testFailedSaveReportsOriginalError(self):
+        filename = os.path.join(self.temp_dir.name, "missing", "circuit.cqc")
+        with self.assertRaises(FileNotFoundError) as context:
+            binary.save_circuit(circuit.Circuit(), filename)
+        self.assertEqual(context.exception.filename, filename + ".part")
+        self.assertIsNone(context.exception.__context__)
+
+    def testInvalidFile(self):
+        with open(self.filename, "wb") as f:
+            f.write(b"H | q0\n")
+        self.assertRaises(ValueError, binary.load_circuit, self.filename)
+        binary.save_circuit(circuit.Circuit(), self.filename)
+        with open(self.filename, "r+b") as f:
+            f.truncate(os.path.getsize(self.filename) - 4)
+        self.assertRaises(ValueError, binary.load_circuit, self.filename)
+
+    def testCorruptFile(self):
+        for column, value in (("ops", 200), ("params", 5), ("qubit_args", -3)):
+            corrupt = circuit.Circuit()
+            corrupt.add_gate(circuit.RZ, [0], param="theta")
+            getattr(corrupt, column)[0] = value
+            binary.save_circuit(corrupt, self.filename)
+            self.assertRaises(ValueError, binary.load_circuit, self.filename)
+        with self.assertRaises(error_cqc.ConversionError) as context:
+            converter.Converter().convert_file(self.filename, self.filename + ".py", binary.FORMAT, "qutip")
+        self.assertEqual(context.exception.code, error_cqc.INVALID_CIRCUIT_FILE)
+
+    def testConvertThroughCircuitFile(self):
+        input_filename = os.path.join(self.temp_dir.name, "input.py")
+        output_filename = os.path.join(self.temp_dir.name, "output.py")
+        with open(input_filename, "w") as f:
+            f.write(SCRIPT)
+        script_converter = converter.Converter()
+        direct = script_converter.convert(SCRIPT, "projectq", "qutip")
+        script_converter.convert_file(input_filename, self.filename, "projectq", binary.FORMAT)
+        result = script_converter.convert_file(self.filename, output_filename, binary.FORMAT, "qutip")
+        self.assertEqual(result.code, direct.code)
+        self.assertEqual(result.error_lines, direct.error_lines)
+        self.assertEqual(result.input_format, "projectq")
+
+    def testOnlyFileConversions(self):
+        with self.assertRaises(error_cqc.ConversionError) as context:
+            converter.convert(SCRIPT, "projectq", binary.FORMAT)
+        self.assertEqual(context.exception.code, error_cqc.UNSUPPORTED_FORMAT)
+        with open(self.filename, "w") as f:
+            f.write(SCRIPT)
+        with self.assertRaises(error_cqc.ConversionError) as context:
+            converter.Converter().convert_file(self.filename, self.filename + ".py", binary.FORMAT, "qutip")
+        self.assertEqual(context.exception.code, error_cqc.INVALID_CIRCUIT_FILE)
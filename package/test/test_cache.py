@@ -0,0 +1,106 @@
+#    Unit tests for cache.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, '../convertqc')
+from convertqc import cache, converter
+
+print("RUNNING TESTS - cache.py")
+
+SCRIPT = "q = eng.allocate_qubit()\nH | q\nUnknownGate | q\n"
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = cache.ResultCache(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def testKeyCoversEverythingAffectingOutput(self):
+        key = self.cache.key(SCRIPT, "projectq", "qutip", (True, False))
+        self.assertEqual(key, self.cache.key(SCRIPT, "projectq", "qutip", (True, False)))
+        self.assertNotEqual(key, self.cache.key(SCRIPT + "\n", "projectq", "qutip", (True, False)))
+        self.assertNotEqual(key, self.cache.key(SCRIPT, "projectq", "qiskit", (True, False)))
+        self.assertNotEqual(key, self.cache.key(SCRIPT, "projectq", "qutip", (False, False)))
+
+    def testStoreAndLoad(self):
+        self.assertIsNone(self.cache.get("missing"))
+        self.cache.put("key", "converted", ["3 - UnknownGate | q"])
+        self.assertEqual(self.cache.get("key"), ("converted", ["3 - UnknownGate | q"]))
+
+    def testCorruptEntryIgnored(self):
+        with open(self.cache.path("key"), "w") as f:
+            f.write("{")
+        self.assertIsNone(self.cache.get("key"))
+
+    def testLeastRecentlyUsedEvicted(self):
+        for name, age in (("old", 300), ("used", 200), ("new", 100)):
+            self.cache.put(name, "x" * 80, [])
+            os.utime(self.cache.path(name), (0, 1000 - age))
+        self.cache.max_bytes = os.path.getsize(self.cache.path("new")) * 3
+        # Reading a result makes it the most recently used
+        self.cache.get("old")
+        self.cache.put("newest", "x" * 80, [])
+        self.assertIsNone(self.cache.get("used"))
+        self.assertIsNotNone(self.cache.get("old"))
+        self.assertIsNotNone(self.cache.get("newest"))
+
+    def testDirectoryOnlyScannedWhenFull(self):
+        scans = []
+        scan = self.cache.scan
+        self.cache.scan = lambda: scans.append(1) or scan()
+        for number in range(10):
+            self.cache.put(str(number), "x" * 80, [])
+        self.assertEqual(len(scans), 1)
+        self.assertEqual(self.cache.size, sum(os.path.getsize(self.cache.path(str(number))) for number in range(10)))
+
+        # Once full, it is emptied down to EVICT_TO of its size, so the next stores do not scan again
+        self.cache.max_bytes = self.cache.size
+        self.cache.put("full", "x" * 80, [])
+        self.assertEqual(len(scans), 2)
+        self.assertLessEqual(self.cache.size, self.cache.max_bytes * cache.EVICT_TO)
+        self.cache.put("next", "x" * 80, [])
+        self.assertEqual(len(scans), 2)
+
+    def testSizeKeptAcrossThreads(self):
+        self.cache.put("first", "x", [])
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda number: self.cache.put(str(number), "x" * number, []), range(200)))
+        total = sum(entry.stat().st_size for entry in os.scandir(self.temp_dir.name))
+        self.assertEqual(self.cache.size, total)
+
+    def testUnstorableResultSkipped(self):
+        self.cache.put("key", "converted", [object()])
+        self.assertIsNone(self.cache.get("key"))
+        self.assertListEqual(os.listdir(self.temp_dir.name), [])
+
+    def testConverterReusesResult(self):
+        script_converter = converter.Converter(result_cache=self.cache)
+        first = script_converter.convert(SCRIPT)
+        second = script_converter.convert(SCRIPT)
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertIsNone(second.circuit)
+        self.assertEqual(first.code, second.code)
+        self.assertListEqual(first.error_lines, second.error_lines)
+        self.assertFalse(converter.Converter(mark=False, result_cache=self.cache).convert(SCRIPT).cached)
@@ -0,0 +1,64 @@
+#    Unit tests for circuit.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import sys
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import circuit
+
+print("RUNNING TESTS - circuit.py")
+
+
+class CircuitTests(unittest.TestCase):
+    def test_add_gate(self):
+        result = circuit.Circuit()
+        index = result.add_gate(circuit.RX, [3], param="pi / 2", depth=1, line=7)
+        self.assertEqual(index, 0)
+        self.assertEqual(result.ops[0], circuit.RX)
+        self.assertEqual(result.param(0), "pi / 2")
+        self.assertEqual(result.depths[0], 1)
+        self.assertEqual(result.lines[0], 7)
+        self.assertEqual(result.num_qubits, 4)
+
+    def test_controls_and_symbols(self):
+        result = circuit.Circuit(2)
+        result.add_gate(circuit.X, ["qb"], [0, 1])
+        self.assertEqual(result.qubits(0), ((0, 1), ("qb",)))
+        self.assertEqual(result.controls[0], 2)
+        self.assertEqual(result.num_qubits, 2)
+
+    def test_pool_shared(self):
+        result = circuit.Circuit()
+        result.add_gate(circuit.RZ, [0], param="pi")
+        result.add_gate(circuit.RX, [0], param="pi")
+        result.add_text(circuit.COMMENT, "# comment")
+        self.assertEqual(result.params[0], result.params[1])
+        self.assertEqual(result.text(2), "# comment")
+        self.assertEqual(len(result.pool), 2)
+        self.assertEqual(result.gate_count(), 2)
+
+    def test_compile_gate_table(self):
+        table = circuit.compile_gate_table([
+            (("RX", 1), circuit.RX, circuit.ANGLE),
+            (("RX", 1), circuit.X, circuit.NO_ANGLE),
+            (("H", 1), circuit.H, circuit.ANY_ANGLE)
+        ])
+        self.assertEqual(table["RX", 1, True], (circuit.RX, True))
+        self.assertEqual(table["RX", 1, False], (circuit.X, False))
+        self.assertEqual(table["H", 1, True], (circuit.H, False))
+        self.assertEqual(table["H", 1, False], (circuit.H, False))
+        self.assertNotIn(("RX", 2, True), table)
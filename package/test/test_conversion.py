@@ -14,6 +14,8 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <https://www.gnu.org/licenses/>
 
+import contextlib
+import io
 import sys
 import os
 import unittest
@@ -73,23 +75,6 @@ class FileIOTests(unittest.TestCase):
         self.assertTrue(file.closed)
 
 
-class ErrorLogTests(unittest.TestCase):
-    def test_successful_add_error_line(self):
-        cur_line_no = 7
-        text = "Test"
-        conversion.add_new_error_line(cur_line_no, text)
-
-        list = conversion.get_error_lines()
-        self.assertEqual("7 - Test", list[0])
-
-    @unittest.expectedFailure
-    def test_unsuccessful_add_error_line(self):
-        cur_line_no = 7
-        text = "Test"
-        conversion.add_new_error_line(text)
-        conversion.add_new_error_line(cur_line_no)
-
-
 class CopyrightTests(unittest.TestCase):
     def test_writing_copyright(self):
         expected_copyright_notice = [
@@ -123,3 +108,66 @@ class CopyrightTests(unittest.TestCase):
             input[i] = conversion.chomp(each)
 
         self.assertListEqual(input, expected_copyright_notice)
+
+
+class LogOutputTests(unittest.TestCase):
+    def test_arguments_formatted_when_printed(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            conversion.verbose_print(3, "Found register %s of %d qubits", "q", 2)
+            conversion.debug_print(4, "100% literal")
+        self.assertEqual(output.getvalue(), "3: Found register q of 2 qubits\n4 DEBUG: 100% literal\n")
+
+
+class TidyBlankLinesTests(unittest.TestCase):
+    def test_definitions_separated(self):
+        lines = ["x = 1", "# comment on f", "def f():", "", "    pass", "y = 2"]
+        expected = ["x = 1", "", "", "# comment on f", "def f():", "    pass", "", "", "y = 2"]
+        self.assertListEqual(conversion.tidy_blank_lines(lines), expected)
+
+    def test_blank_lines_collapsed(self):
+        lines = ["x = 1", "", "", "", "", "if x:", "    y = 1", "", "", "    z = 1", "", ""]
+        expected = ["x = 1", "", "", "if x:", "    y = 1", "", "    z = 1"]
+        self.assertListEqual(conversion.tidy_blank_lines(lines), expected)
+
+    def test_decorated_definition_separated(self):
+        # A decorated header is one entry, decorators and all, and is not attached to the line after its body
+        lines = ["x = 1", "@decorator\ndef f(eng, a):", "    y = 1", "try:", "    z = 2", "except E:", "    pass"]
+        expected = ["x = 1", "", "", "@decorator\ndef f(eng, a):", "    y = 1", "", "", "try:", "    z = 2",
+                    "except E:", "    pass"]
+        self.assertListEqual(conversion.tidy_blank_lines(lines), expected)
+        lines = ["@decorator", "def f():", "    pass", "x = 1"]
+        expected = ["@decorator", "def f():", "    pass", "", "", "x = 1"]
+        self.assertListEqual(conversion.tidy_blank_lines(lines), expected)
+
+
+class OutputSinkTests(unittest.TestCase):
+    def test_output_kept_in_memory(self):
+        output = conversion.OutputSink(buffer_size=8)
+        output.write("x = 1\n")
+        output.write_lines(["y = 2", "z = 3"])
+        self.assertEqual(output.getvalue(), "x = 1\ny = 2\nz = 3\n")
+
+    def test_file_replaced_on_close(self):
+        filename = "test_output.txt"
+        with open(filename, "w") as f:
+            f.write("old\n")
+        with conversion.OutputSink(filename) as output:
+            output.write("new\n")
+            with open(filename) as f:
+                self.assertEqual(f.read(), "old\n")
+        with open(filename) as f:
+            self.assertEqual(f.read(), "new\n")
+        self.assertFalse(os.path.exists(filename + ".part"))
+
+    def test_file_kept_on_failure(self):
+        filename = "test_output.txt"
+        with open(filename, "w") as f:
+            f.write("old\n")
+        with self.assertRaises(ValueError):
+            with conversion.OutputSink(filename) as output:
+                output.write("new\n")
+                raise ValueError
+        with open(filename) as f:
+            self.assertEqual(f.read(), "old\n")
+        self.assertFalse(os.path.exists(filename + ".part"))
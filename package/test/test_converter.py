@@ -0,0 +1,88 @@
+#    Unit tests for converter.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, '../convertqc')
+from benchmark import generate
+from convertqc import converter, error_cqc
+
+print("RUNNING TESTS - converter.py")
+
+
+def projectq_script(num_qubits):
+    """
+    ProjectQ script allocating num_qubits qubits, with one untranslateable line
+    """
+    lines = ["q" + str(i) + " = eng.allocate_qubit()" for i in range(num_qubits)]
+    lines.append("H | q0")
+    lines.append("UnknownGate | q0")
+    return "\n".join(lines) + "\n"
+
+
+class ConverterTests(unittest.TestCase):
+    def testConvert(self):
+        result = converter.convert(projectq_script(2), "projectq", "qutip")
+        self.assertIn("quantum_circuit = QubitCircuit(2)", result.code)
+        self.assertIn("quantum_circuit.add_gate(\"SNOT\", targets=0)", result.code)
+        self.assertListEqual(result.error_lines, ["4 - UnknownGate | q0"])
+        self.assertEqual(result.circuit.num_qubits, 2)
+
+    def testRepeatedConversionsDoNotShareState(self):
+        conversion = converter.Converter()
+        first = conversion.convert(projectq_script(3))
+        second = conversion.convert(projectq_script(1))
+        self.assertIn("QubitCircuit(1)", second.code)
+        self.assertEqual(len(first.error_lines), 1)
+        self.assertEqual(len(second.error_lines), 1)
+
+    def testConcurrentConversions(self):
+        conversion = converter.Converter()
+        sizes = [1 + i % 5 for i in range(40)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda size: conversion.convert(projectq_script(size)), sizes))
+        for size, result in zip(sizes, results):
+            self.assertIn("QubitCircuit(" + str(size) + ")", result.code)
+            self.assertListEqual(result.error_lines, [str(size + 2) + " - UnknownGate | q0"])
+
+    def testErrorsRaised(self):
+        with self.assertRaises(error_cqc.ConversionError) as context:
+            converter.convert("c = (\n")
+        self.assertEqual(context.exception.code, error_cqc.INPUT_FILE_SYNTAX_ERROR)
+        with self.assertRaises(error_cqc.ConversionError) as context:
+            converter.convert("", "qutip", "qutip")
+        self.assertEqual(context.exception.code, error_cqc.MATCHING_INPUT_OUTPUT)
+
+    def testMappedFileConvertedAsText(self):
+        # QuTiP files are memory mapped, and must convert exactly as the same script held in memory
+        scripts = [generate.flat_qutip_script(8, 200), generate.qutip_script(),
+                   "c = QubitCircuit(2)\nx = \"\"\"\nc.add_gate(\"SNOT\", targets=0)\n\"\"\"\nc.add_gate(\"ABC\", 0)\n"]
+        with tempfile.TemporaryDirectory() as directory:
+            input_filename = os.path.join(directory, "input.py")
+            output_filename = os.path.join(directory, "output.py")
+            for script in scripts:
+                with open(input_filename, "w") as f:
+                    f.write(script)
+                result = converter.Converter().convert_file(input_filename, output_filename, "qutip", "projectq")
+                expected = converter.Converter().convert(script, "qutip", "projectq", input_filename)
+                self.assertEqual(result.code, expected.code)
+                self.assertListEqual([diagnostic.to_dict() for diagnostic in result.diagnostics],
+                                     [diagnostic.to_dict() for diagnostic in expected.diagnostics])
+                self.assertEqual(result.stats.counters["lines"], expected.stats.counters["lines"])
@@ -0,0 +1,93 @@
+#    Unit tests for diagnostics.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import cache, converter, diagnostics
+
+print("RUNNING TESTS - diagnostics.py")
+
+SCRIPT = "a = eng.allocate_qubit()\nfor i in range(2):\n    UnknownGate | a\nH | missing\n"
+
+
+class ErrorLogTests(unittest.TestCase):
+    def testRecordFields(self):
+        error_log = diagnostics.ErrorLog("in.py")
+        error_log.add(7, "  UnknownGate | a\n  more", diagnostics.UNTRANSLATED_STATEMENT, 3)
+        diagnostic = error_log.records[0]
+        self.assertEqual(diagnostic.to_dict(), {
+            "file": "in.py", "line": 7, "column": 3, "category": diagnostics.UNTRANSLATED_STATEMENT,
+            "severity": diagnostics.ERROR, "source": "UnknownGate | a",
+            "suggestion": diagnostics.SUGGESTIONS[diagnostics.UNTRANSLATED_STATEMENT]})
+        self.assertListEqual(error_log.lines, ["7 - UnknownGate | a"])
+
+    def testSeverityFilter(self):
+        error_log = diagnostics.ErrorLog(severity=diagnostics.ERROR)
+        error_log.add(1, "q", diagnostics.UNRESOLVED_QUBIT, severity=diagnostics.WARNING)
+        error_log.add(2, "X | q")
+        self.assertListEqual([diagnostic.line for diagnostic in error_log.records], [2])
+        self.assertEqual(dict(error_log.counts), {diagnostics.UNTRANSLATED_STATEMENT: 1})
+
+    def testBoundedButCountedAndWritten(self):
+        output = io.StringIO()
+        error_log = diagnostics.ErrorLog(writer=diagnostics.DiagnosticWriter(output), limit=2)
+        for line_no in range(5):
+            error_log.add(line_no, "X | q", diagnostics.NO_EQUIVALENT_GATE)
+        self.assertEqual((len(error_log.records), error_log.dropped), (2, 3))
+        self.assertEqual(error_log.counts[diagnostics.NO_EQUIVALENT_GATE], 5)
+        self.assertEqual([json.loads(line)["line"] for line in output.getvalue().splitlines()], [0, 1, 2, 3, 4])
+
+    def testExtendMovesLines(self):
+        stored = diagnostics.ErrorLog("old.py")
+        stored.add(3, "X | q")
+        error_log = diagnostics.ErrorLog("new.py")
+        error_log.extend(stored.to_list(), 10)
+        self.assertEqual((error_log.records[0].file, error_log.records[0].line), ("new.py", 13))
+
+
+class ConverterTests(unittest.TestCase):
+    def testCategoriesAndColumns(self):
+        result = converter.convert(SCRIPT, "projectq", "qasm")
+        self.assertListEqual([(diagnostic.line, diagnostic.column, diagnostic.category)
+                              for diagnostic in result.diagnostics],
+                             [(3, 5, diagnostics.UNTRANSLATED_STATEMENT),
+                              (4, 5, diagnostics.UNRESOLVED_QUBIT),
+                              (2, 0, diagnostics.NO_EQUIVALENT_STATEMENT),
+                              (4, 0, diagnostics.NO_EQUIVALENT_GATE)])
+        self.assertEqual(result.error_lines, ["3 - UnknownGate | a", "2 - for i in range(2):",
+                                              "4 - No equivalent gate: H on qubits missing"])
+
+    def testCachedResultReportsDiagnostics(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_filename = os.path.join(directory, "in.py")
+            with open(input_filename, "w") as f:
+                f.write(SCRIPT)
+            output = io.StringIO()
+            script_converter = converter.Converter(result_cache=cache.ResultCache(directory),
+                                                   diagnostic_writer=diagnostics.DiagnosticWriter(output))
+            first = script_converter.convert_file(input_filename, os.path.join(directory, "out.py"))
+            second = script_converter.convert_file(input_filename, os.path.join(directory, "out.py"))
+        self.assertTrue(second.cached)
+        self.assertEqual(second.counts, first.counts)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(len(records), 2 * len(first.diagnostics))
+        self.assertTrue(all(record["file"] == input_filename for record in records))
@@ -0,0 +1,96 @@
+#    Unit tests for incremental.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import converter, incremental, process_projectq, process_qutip
+
+print("RUNNING TESTS - incremental.py")
+
+SCRIPT = """a = eng.allocate_qubit()
+b = eng.allocate_qubit()
+
+
+def first(eng):
+    H | a
+    UnknownGate | a
+
+
+def second(eng):
+    CNOT | (a, b)
+"""
+
+
+class ConvertUnitsTests(unittest.TestCase):
+    def convert(self, source, units):
+        reader = process_projectq.Reader("")
+        return incremental.convert_units(io.StringIO(source), reader, process_qutip, units)
+
+    def testUnchangedUnitsReused(self):
+        lines, units = self.convert(SCRIPT, {})
+        # Reused units are never parsed, so a reader which cannot lower anything gives the same result
+        reader = process_projectq.Reader("")
+        reader.read_chunk = None
+        self.assertEqual(incremental.convert_units(io.StringIO(SCRIPT), reader, process_qutip, units)[0], lines)
+
+    def testReaderStateInKey(self):
+        units = self.convert(SCRIPT, {})[1]
+        # Same statements after an extra allocation use different qubits, so are translated again
+        changed_lines = self.convert("c = eng.allocate_qubit()\n" + SCRIPT, units)[0]
+        self.assertIn("    quantum_circuit.add_gate(\"SNOT\", targets=1)", changed_lines)
+
+    def testStateOnlyKeptWhereChanged(self):
+        units = self.convert(SCRIPT, {})[1]
+        # Only the two allocations change the reader state - every other unit only has a digest
+        self.assertEqual(len(units), 4)
+        self.assertEqual(sum("delta" in unit for unit in units.values()), 2)
+        self.assertEqual(len(set(unit["digest"] for unit in units.values())), 2)
+
+
+class ConvertIncrementalTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_filename = os.path.join(self.temp_dir.name, "input.py")
+        self.output_filename = os.path.join(self.temp_dir.name, "output.py")
+        self.converter = converter.Converter()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_input(self, source):
+        with open(self.input_filename, "w") as input_file:
+            input_file.write(source)
+
+    def testMatchesWholeConversion(self):
+        self.write_input(SCRIPT)
+        first = self.converter.convert_incremental(self.input_filename, self.output_filename)
+        self.assertTrue(os.path.exists(incremental.manifest_filename(self.output_filename)))
+
+        edited = SCRIPT.replace("    H | a\n", "    X | a\n    Y | b\n")
+        self.write_input(edited)
+        result = self.converter.convert_incremental(self.input_filename, self.output_filename)
+        whole = self.converter.convert(edited)
+        self.assertEqual(result.code, whole.code)
+        self.assertNotEqual(result.code, first.code)
+        with open(self.output_filename) as output_file:
+            self.assertEqual(output_file.read(), whole.code)
+        # Error lines follow statements which moved
+        self.assertListEqual(result.error_lines, ["8 - UnknownGate | a"])
@@ -0,0 +1,85 @@
+#    Unit tests for instrument.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import circuit, converter, instrument
+
+print("RUNNING TESTS - instrument.py")
+
+SCRIPT = "a = eng.allocate_qureg(2)\nH | a[0]\nCNOT | (a[0], a[1])\nH | a[1]\nUnknownGate | a\n"
+
+
+class StatsTests(unittest.TestCase):
+    def testCountGatesByType(self):
+        source = circuit.Circuit()
+        source.add_text(circuit.COMMENT, "# c")
+        source.add_gate(circuit.X, [1], [0])
+        source.add_gate(circuit.X, [0])
+        source.add_gate(circuit.X, [1], [0])
+        stats = instrument.Stats()
+        stats.count_gates(source)
+        self.assertEqual(stats.counters[instrument.GATES], 3)
+        self.assertEqual(stats.counters["gates.C-X"], 2)
+        self.assertEqual(stats.counters["gates.X"], 1)
+
+    def testTimeAddsUp(self):
+        stats = instrument.Stats()
+        for _ in range(2):
+            with stats.time(instrument.EMIT):
+                pass
+        self.assertGreater(stats.timers[instrument.EMIT], 0)
+        self.assertEqual(stats.timers[instrument.FORMAT], 0)
+
+    def testMergeAndFormat(self):
+        total = instrument.Stats()
+        for _ in range(2):
+            stats = instrument.Stats()
+            stats.count(instrument.PARSES)
+            stats.count_lines("a\nb")
+            total.merge(stats.to_dict())
+        self.assertEqual(json.loads(total.format("json"))["counters"], {instrument.PARSES: 2, instrument.LINES: 4})
+        self.assertIn("parses                 2", total.format("table").split("\n"))
+
+    def testCountLines(self):
+        stats = instrument.Stats()
+        for source in ["a\nb", "a\nb\n", b"a\nb", b"a\nb\n", ""]:
+            stats.count_lines(source)
+        self.assertEqual(stats.counters[instrument.LINES], 8)
+
+
+class ConverterTests(unittest.TestCase):
+    def testEveryModeCounts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_filename = os.path.join(directory, "in.py")
+            with open(input_filename, "w") as f:
+                f.write(SCRIPT)
+            script_converter = converter.Converter()
+            output_filename = os.path.join(directory, "out.py")
+            results = [script_converter.convert_file(input_filename, output_filename),
+                       script_converter.convert_stream(input_filename, output_filename),
+                       script_converter.convert_incremental(input_filename, output_filename)]
+        # Incremental conversion parses each statement on its own
+        for result, parses in zip(results, [1, 1, 5]):
+            counters = result.stats.counters
+            self.assertEqual((counters[instrument.LINES], counters[instrument.PARSES], counters[instrument.GATES],
+                              counters["gates.H"], counters[instrument.UNTRANSLATED]), (5, parses, 3, 2, 1))
+        self.assertGreater(results[0].stats.timers[instrument.READ], 0)
@@ -0,0 +1,101 @@
+#    Unit tests for optimize.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import sys
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import circuit, converter, optimize
+
+print("RUNNING TESTS - optimize.py")
+
+
+def gates(circuit_in):
+    return [(circuit_in.ops[i], circuit_in.qubits(i), circuit_in.param(i)) for i in range(len(circuit_in))
+            if circuit_in.ops[i] >= circuit.FIRST_GATE]
+
+
+class OptimizeTests(unittest.TestCase):
+    def testCancelNested(self):
+        source = circuit.Circuit()
+        source.add_gate(circuit.H, [0])
+        source.add_gate(circuit.X, [1], [0])
+        source.add_gate(circuit.Z, [2])
+        source.add_gate(circuit.X, [1], [0])
+        source.add_gate(circuit.H, [0])
+        result, stats = optimize.optimize_circuit(source)
+        self.assertEqual(gates(result), [(circuit.Z, ((), (2,)), None)])
+        self.assertEqual(stats, {"cancel": 4, "merge": 0, "identity": 0})
+
+    def testInversePairs(self):
+        source = circuit.Circuit()
+        source.add_gate(circuit.T, [0])
+        source.add_gate(circuit.TDAG, [0])
+        source.add_gate(circuit.SWAP, [0, 1])
+        source.add_gate(circuit.SWAP, [1, 0])
+        source.add_gate(circuit.S, [0])
+        source.add_gate(circuit.S, [0])
+        result, stats = optimize.optimize_circuit(source)
+        self.assertEqual([op for op, qubits, param in gates(result)], [circuit.S, circuit.S])
+
+    def testMergeRotations(self):
+        source = circuit.Circuit()
+        source.add_gate(circuit.RZ, [0], param="pi / 4")
+        source.add_gate(circuit.RZ, [0], param="pi / 2")
+        source.add_gate(circuit.RX, [1], param="theta")
+        source.add_gate(circuit.RX, [1], param="-phi")
+        source.add_gate(circuit.RY, [2], param="0.5")
+        source.add_gate(circuit.RY, [2], param="-0.5")
+        source.add_gate(circuit.PHASE, [2], param="2 * pi")
+        result, stats = optimize.optimize_circuit(source)
+        self.assertEqual(gates(result), [(circuit.RZ, ((), (0,)), "3 * pi / 4"),
+                                         (circuit.RX, ((), (1,)), "theta + -phi")])
+        self.assertEqual(stats, {"cancel": 0, "merge": 3, "identity": 2})
+
+    def testStatementsSeparateGates(self):
+        source = circuit.Circuit()
+        source.add_gate(circuit.X, [0])
+        source.add_text(circuit.STATEMENT, "measure(q0)")
+        source.add_gate(circuit.X, [0])
+        source.add_gate(circuit.H, [0], depth=1)
+        source.add_gate(circuit.H, [0])
+        result, stats = optimize.optimize_circuit(source)
+        self.assertEqual(len(result), len(source))
+
+    def testSymbolicQubits(self):
+        source = circuit.Circuit()
+        source.add_gate(circuit.H, [0])
+        source.add_gate(circuit.X, ["qb"])
+        source.add_gate(circuit.H, [0])
+        source.add_gate(circuit.X, ["qb"])
+        result, stats = optimize.optimize_circuit(source)
+        self.assertEqual(len(result), len(source))
+
+    def testSelectedPasses(self):
+        source = circuit.Circuit()
+        source.add_gate(circuit.X, [0])
+        source.add_gate(circuit.X, [0])
+        source.add_gate(circuit.RZ, [0], param="0")
+        result, stats = optimize.optimize_circuit(source, [optimize.IDENTITY])
+        self.assertEqual(len(result), 2)
+        self.assertEqual(stats, {"identity": 1})
+
+    def testConvert(self):
+        source = "q0 = eng.allocate_qubit()\nH | q0\nH | q0\nif x:\n    X | q0\n    X | q0\n"
+        result = converter.convert(source, "projectq", "qutip", passes=optimize.PASSES)
+        self.assertNotIn("SNOT", result.code)
+        self.assertIn("if x:\n    pass\n", result.code)
+        self.assertEqual(result.optimization["cancel"], 4)
@@ -0,0 +1,117 @@
+#    Unit tests for plugins.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import argparse
+import contextlib
+import importlib.metadata
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import converter, convertqc, error_cqc, plugins, process_qasm
+
+print("RUNNING TESTS - plugins.py")
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# An installed package adding a format which only writes, as a directory on sys.path
+PLUGIN_MODULE = """from convertqc import plugins
+FORMAT = plugins.Format("convertqc.process_qasm", "Plugin QASM", ".qasm", reads=False, streams=False, gates=["H"])
+"""
+PLUGIN_ENTRY_POINTS = """[convertqc.formats]
+pluginqasm = convertqc_test_plugin:FORMAT
+"""
+
+
+class RegistryTests(unittest.TestCase):
+    def tearDown(self):
+        plugins.formats.pop("openqasm", None)
+
+    def testRegister(self):
+        plugins.register("openqasm", "convertqc.process_qasm", "OpenQASM", ".qasm")
+        self.assertIn("openqasm", converter.readers)
+        self.assertIs(converter.frontends["openqasm"], process_qasm)
+        result = converter.convert("qureg = eng.allocate_qureg(1)\nH | qureg[0]\n", "projectq", "openqasm")
+        self.assertIn("// Output format: OpenQASM ", result.code)
+        self.assertIn("\nh q[0];\n", result.code)
+
+    def testUnknownFormat(self):
+        self.assertNotIn("openqasm", converter.writers)
+        with self.assertRaises(KeyError):
+            plugins.load("openqasm")
+
+    def testEntryPoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "convertqc_test_plugin.py"), "w") as f:
+                f.write(PLUGIN_MODULE)
+            dist_info = os.path.join(directory, "convertqc_test_plugin-1.0.dist-info")
+            os.mkdir(dist_info)
+            with open(os.path.join(dist_info, "METADATA"), "w") as f:
+                f.write("Metadata-Version: 2.1\nName: convertqc-test-plugin\nVersion: 1.0\n")
+            with open(os.path.join(dist_info, "entry_points.txt"), "w") as f:
+                f.write(PLUGIN_ENTRY_POINTS)
+            sys.path.insert(0, directory)
+            plugins.entry_points = None
+            try:
+                self.assertIn("pluginqasm", plugins.names())
+                self.assertIn("pluginqasm", converter.writers)
+                self.assertNotIn("pluginqasm", converter.readers)
+                self.assertEqual(plugins.supported_gates("pluginqasm"), ["H"])
+                result = converter.convert("qureg = eng.allocate_qureg(1)\nH | qureg[0]\n", "projectq", "pluginqasm")
+                self.assertIn("// Output format: Plugin QASM ", result.code)
+                with self.assertRaises(error_cqc.ConversionError) as context:
+                    converter.Converter().convert_stream("in.py", "out.qasm", "projectq", "pluginqasm")
+                self.assertEqual(context.exception.code, error_cqc.UNSUPPORTED_STREAMING)
+            finally:
+                sys.path.remove(directory)
+                plugins.entry_points = None
+                plugins.formats.pop("pluginqasm", None)
+                sys.modules.pop("convertqc_test_plugin", None)
+
+    def testBrokenEntryPoint(self):
+        # An installed package whose module cannot be imported is reported, rather than raising from a lookup
+        plugins.entry_points = {"brokenqasm": importlib.metadata.EntryPoint(
+            "brokenqasm", "convertqc_missing_plugin:FORMAT", plugins.ENTRY_POINT_GROUP)}
+        try:
+            self.assertNotIn("brokenqasm", converter.readers)
+            self.assertNotIn("brokenqasm", list(converter.writers))
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr), self.assertRaises(SystemExit):
+                convertqc.check_format(argparse.ArgumentParser(), "brokenqasm")
+            self.assertIn("format 'brokenqasm' could not be loaded", stderr.getvalue())
+        finally:
+            plugins.entry_points = None
+
+    def testOnlyUsedFormatsImported(self):
+        # A new interpreter, as every format is imported by the other tests
+        code = ("import sys\nfrom convertqc import converter\nconverter.convert('H | q[0]', 'projectq', 'qutip')\n"
+                "print(' '.join(sorted(name for name in sys.modules if name.startswith(('convertqc.process', "
+                "'argcomplete')))))")
+        output = subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_DIR, stdout=subprocess.PIPE,
+                                universal_newlines=True, check=True).stdout
+        self.assertEqual(output.split(), ["convertqc.process_projectq", "convertqc.process_qutip"])
+
+    def testQiskitLoadedAlone(self):
+        code = ("import sys\nfrom convertqc import converter\nconverter.convert('qc = QuantumCircuit(1)\\nqc.h(0)', "
+                "'qiskit', 'qutip')\nprint(' '.join(sorted(name for name in sys.modules "
+                "if name.startswith('convertqc.process'))))")
+        output = subprocess.run([sys.executable, "-c", code], cwd=PACKAGE_DIR, stdout=subprocess.PIPE,
+                                universal_newlines=True, check=True).stdout
+        self.assertEqual(output.split(), ["convertqc.process_qiskit", "convertqc.process_qutip"])
@@ -1,72 +1,169 @@
 import sys
-import os
 import unittest
-import argparse
-from unittest import mock
 
 sys.path.insert(0, '../convertqc')
-from convertqc import process_projectq
-
-output_file = None
-args = None
+from convertqc import circuit, conversion, diagnostics, process_projectq
 
 print("RUNNING TESTS - process_projectq.py")
 
 
-def process_args():
+def write_body(circuit_in):
     """
-    Creates the ArgumentParser to handle input arguments.
-    Future arguments are easily added with a new .add_argument() line
-    :return: None
+    Write a circuit's entries as ProjectQ, without the imports and engine lines
+    :param circuit_in: Circuit to write
+    :return: Output lines
     """
-
-    global args
-    parser = argparse.ArgumentParser(
-        description="Convert quantum circuits into different environments")
-
-    # Optional - user defined output name
-    parser.add_argument(
-        "-o",
-        "--output_filename",
-        help="set output filename, without file extension (default: convertqc_result.<filetype>")
-    # Optional - verbose mode
-    parser.add_argument(
-        "-v",
-        "--verbose",
-        help="run in verbose mode",
-        action="store_true")
-    # Optional - remove code comments identifying untranslated lines
-    parser.add_argument(
-        "-m",
-        "--mark",
-        help="disable comments in code to identify untranslated lines",
-        action="store_false")
-    # Optional - disable output of error log
-    parser.add_argument(
-        "-e",
-        "--error_log",
-        help="disable outputting error log to file",
-        action="store_false")
-    # Optional - debug mode
-    parser.add_argument(
-        "-d",
-        "--debug",
-        help="enable debug mode",
-        action="store_true")
-
-    args = parser.parse_args()
-
-    if args.debug:
-        args.verbose = True
+    return conversion.script_lines(circuit_in, process_projectq.write_gate)
 
 
 class ConvertGateTests(unittest.TestCase):
     def testPauliXGate(self):
-        global output_file
-        process_args()
-        output_file = open("test_output.txt", "w+")
+        source = "qubit = eng.allocate_qubit()\nX | qubit\n"
+        result = process_projectq.read_script(source)
+        self.assertEqual(result.num_qubits, 1)
+        self.assertEqual(result.ops[0], circuit.X)
+        self.assertEqual(result.qubits(0), ((), (0,)))
+
+    def testCNOTGate(self):
+        source = "a = eng.allocate_qubit()\nb = eng.allocate_qubit()\nCNOT | (a, b)\n"
+        result = process_projectq.read_script(source)
+        self.assertEqual(result.num_qubits, 2)
+        self.assertEqual(result.ops[0], circuit.X)
+        self.assertEqual(result.qubits(0), ((0,), (1,)))
+        self.assertListEqual(result.qubit_names, ["a", "b"])
+
+    def testFunctionParameterQubit(self):
+        source = "def create_state(eng, qb):\n    Rz(1.21) | qb\n"
+        result = process_projectq.read_script(source)
+        self.assertEqual(result.ops[1], circuit.RZ)
+        self.assertEqual(result.depths[1], 1)
+        self.assertEqual(result.qubits(1), ((), ("qb",)))
+        self.assertEqual(result.param(1), "1.21")
+
+
+class ConvertScriptTests(unittest.TestCase):
+    def testMultiLineStatement(self):
+        source = "q = eng.allocate_qubit()\nprint('Measured',\n      int(q))\nH | q\n"
+        result = process_projectq.read_script(source)
+        self.assertListEqual(list(result.ops), [circuit.STATEMENT, circuit.H])
+        self.assertEqual(result.text(0), "print('Measured', int(q))")
+
+    def testCommentsKept(self):
+        source = "# allocate\nq = eng.allocate_qubit()\nif True:\n    # gate\n    H | q\n"
+        result = process_projectq.read_script(source)
+        self.assertListEqual(list(result.ops), [circuit.COMMENT, circuit.BLOCK, circuit.COMMENT, circuit.H])
+        self.assertListEqual(list(result.depths), [0, 0, 1, 1])
+
+    def testUntranslatedGateMarked(self):
+        source = "q = eng.allocate_qubit()\nUnknownGate | q\n"
+        result = process_projectq.read_script(source)
+        self.assertEqual(result.ops[0], circuit.UNTRANSLATED)
+        self.assertListEqual(write_body(result), [conversion.MARK_COMMENT, "UnknownGate | q"])
+
+
+class WriteGateTests(unittest.TestCase):
+    def testControlledGates(self):
+        result = circuit.Circuit()
+        result.add_gate(circuit.X, [1], [0])
+        result.add_gate(circuit.RZ, [1], [0], "pi / 2")
+        result.add_gate(circuit.H, ["i"])
+        self.assertListEqual(write_body(result), ["CNOT | (qureg[0], qureg[1])",
+                                                  "C(Rz(pi / 2), 1) | (qureg[0], qureg[1])",
+                                                  "H | qureg[i]"])
+
+    def testMeasurementNotControlled(self):
+        result = circuit.Circuit()
+        result.add_gate(circuit.MEASURE, [1], [0])
+        self.assertListEqual(write_body(result), ["# *!* ERROR - COULD NOT TRANSFER LINE BELOW COMMENT. PLEASE CHECK "
+                                                  "MANUALLY: *!*",
+                                                  "# No equivalent gate: C-MEASURE on qubits 0, 1"])
+
+    def testEmptyBlockGetsPass(self):
+        source = "def allocate(eng):\n    q = eng.allocate_qubit()\nallocate(eng)\n"
+        self.assertListEqual(write_body(process_projectq.read_script(source)),
+                             ["def allocate(eng):", "    pass", "allocate(eng)"])
+
+
+class SymbolTableTests(unittest.TestCase):
+    def testQuregIndicesAndSlices(self):
+        source = "a = eng.allocate_qubit()\nreg = eng.allocate_qureg(4)\nCNOT | (a, reg[3])\nAll(H) | reg[1:3]\n" \
+                 "X | reg[-1]\nZ | reg[i]\n"
+        result = process_projectq.read_script(source)
+        self.assertEqual(result.num_qubits, 5)
+        self.assertListEqual(result.qubit_names, ["a", "reg[0]", "reg[1]", "reg[2]", "reg[3]"])
+        self.assertEqual(result.qubits(0), ((0,), (4,)))
+        self.assertEqual(result.qubits(1), ((), (2,)))
+        self.assertEqual(result.qubits(2), ((), (3,)))
+        self.assertEqual(result.qubits(3), ((), (4,)))
+        # Index only known when the script runs - kept relative to the start of the qureg
+        self.assertEqual(result.qubits(4), ((), ("1 + i",)))
+
+    def testParametersShadowAllocations(self):
+        source = "qb = eng.allocate_qubit()\ndef f(eng, qb):\n    H | qb\nH | qb\n"
+        result = process_projectq.read_script(source)
+        self.assertEqual(result.qubits(1), ((), ("qb",)))
+        self.assertEqual(result.qubits(2), ((), (0,)))
+
+    def testUnallocatableRegisterReported(self):
+        reader = process_projectq.Reader("r = eng.allocate_qureg(-1)\nq = eng.allocate_qureg(0)\n")
+        result = reader.read()
+        self.assertEqual(result.num_qubits, 0)
+        self.assertListEqual(list(result.ops), [circuit.STATEMENT, circuit.STATEMENT])
+        self.assertListEqual([(diagnostic.category, diagnostic.severity) for diagnostic in reader.error_log.records],
+                             [(diagnostics.UNRESOLVED_SIZE, diagnostics.ERROR)] * 2)
+        self.assertListEqual(reader.error_log.lines,
+                             ["1 - r = eng.allocate_qureg(-1)", "2 - q = eng.allocate_qureg(0)"])
+
+    def testUnresolvedReported(self):
+        reader = process_projectq.Reader("reg = eng.allocate_qureg(2)\nH | missing\nH | reg[5]\n")
+        reader.read()
+        self.assertListEqual([(diagnostic.line, diagnostic.column, diagnostic.source, diagnostic.severity)
+                              for diagnostic in reader.error_log.records],
+                             [(2, 5, "missing", diagnostics.WARNING), (3, 5, "reg[5]", diagnostics.WARNING)])
+        self.assertListEqual(reader.error_log.lines, [])
+
+
+class MetaBlockTests(unittest.TestCase):
+    def testControlUnrolled(self):
+        source = "a = eng.allocate_qubit()\nb = eng.allocate_qubit()\nwith Control(eng, a):\n    X | b\n" \
+                 "    Rz(0.5) | b\n"
+        self.assertListEqual(write_body(process_projectq.read_script(source)),
+                             ["# with Control(eng, a): - unrolled",
+                              "CNOT | (qureg[0], qureg[1])",
+                              "C(Rz(0.5), 1) | (qureg[0], qureg[1])"])
+
+    def testNestedDaggerInverted(self):
+        source = "a = eng.allocate_qubit()\nb = eng.allocate_qubit()\nwith Dagger(eng):\n    H | a\n" \
+                 "    # rotate\n    S | a\n    Rx(pi / 2) | b\n    with Control(eng, b):\n        T | a\n"
+        self.assertListEqual(write_body(process_projectq.read_script(source)),
+                             ["# with Dagger(eng): - unrolled",
+                              "# with Control(eng, b): - unrolled",
+                              "C(Tdag, 1) | (qureg[1], qureg[0])",
+                              "# rotate",
+                              "Rx(-(pi / 2)) | qureg[1]",
+                              "Sdag | qureg[0]",
+                              "H | qureg[0]"])
 
-        line = "X | Qubit"
-        process_projectq.convert_gate(line)
+    def testUnrollableBlockKept(self):
+        source = "a = eng.allocate_qubit()\nwith Dagger(eng):\n    H | a\n    SqrtX | a\n" \
+                 "with Dagger(eng):\n    prepare(eng, a)\n"
+        reader = process_projectq.Reader(source)
+        result = reader.read()
+        self.assertListEqual(list(result.ops), [circuit.UNTRANSLATED_BLOCK, circuit.H, circuit.SQRTX,
+                                                circuit.UNTRANSLATED_BLOCK, circuit.STATEMENT])
+        self.assertListEqual(reader.error_log.lines, ["2 - with Dagger(eng):", "5 - with Dagger(eng):"])
 
+    def testControlledMeasurementKept(self):
+        source = "c = eng.allocate_qubit()\nq = eng.allocate_qubit()\nwith Control(eng, c):\n    Measure | q\n"
+        reader = process_projectq.Reader(source)
+        result = reader.read()
+        self.assertListEqual(list(result.ops), [circuit.UNTRANSLATED_BLOCK, circuit.MEASURE])
+        self.assertListEqual(reader.error_log.lines, ["3 - with Control(eng, c):"])
 
+    def testControlOverlappingTargetReported(self):
+        source = "r = eng.allocate_qureg(3)\nwith Control(eng, r[0]):\n    with Dagger(eng):\n        X | r[0]\n"
+        reader = process_projectq.Reader(source)
+        result = reader.read()
+        self.assertListEqual(list(result.ops), [circuit.UNTRANSLATED_BLOCK, circuit.COMMENT, circuit.X])
+        self.assertListEqual([(diagnostic.line, diagnostic.category) for diagnostic in reader.error_log.records],
+                             [(4, diagnostics.OVERLAPPING_QUBITS), (2, diagnostics.UNTRANSLATED_BLOCK)])
@@ -0,0 +1,104 @@
+import io
+import sys
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import circuit, conversion, converter, process_qasm, process_qasm3, streaming
+
+print("RUNNING TESTS - process_qasm.py")
+
+SCRIPT = """OPENQASM 2.0;
+include "qelib1.inc";
+// Bell pair
+qreg q[2];
+qreg anc[1];
+creg c[3];
+h q[0]; cx q[0], q[1];  // entangle
+rz(pi / 4) q;
+gate g a {
+    h a;
+}
+measure q -> c;
+"""
+
+
+class ReadTests(unittest.TestCase):
+    def testRegistersAndBroadcast(self):
+        result = process_qasm.read_script(SCRIPT)
+        self.assertEqual(result.num_qubits, 3)
+        self.assertEqual(result.qubit_names, ["q[0]", "q[1]", "anc[0]"])
+        gates = [(result.ops[i], result.qubits(i), result.param(i)) for i in range(len(result))
+                 if result.ops[i] >= circuit.FIRST_GATE]
+        self.assertListEqual(gates, [(circuit.H, ((), (0,)), None),
+                                     (circuit.X, ((0,), (1,)), None),
+                                     (circuit.RZ, ((), (0,)), "pi / 4"),
+                                     (circuit.RZ, ((), (1,)), "pi / 4"),
+                                     (circuit.MEASURE, ((), (0,)), None),
+                                     (circuit.MEASURE, ((), (1,)), None)])
+
+    def testCommentsAndUntranslated(self):
+        error_log = conversion.ErrorLog()
+        result = process_qasm.read_script(SCRIPT, error_log=error_log)
+        comments = [result.text(i) for i in range(len(result)) if result.ops[i] == circuit.COMMENT]
+        self.assertListEqual(comments, ["# Bell pair", "# entangle"])
+        self.assertEqual(error_log.lines, ["9 - gate g a {"])
+        untranslated = [result.text(i) for i in range(len(result)) if result.ops[i] == circuit.UNTRANSLATED]
+        self.assertListEqual(untranslated, ["# gate g a {\n#     h a;\n# }"])
+
+    def testQasm3(self):
+        source = "OPENQASM 3.0;\nqubit[2] q;\nqubit a;\nbit[2] c;\ncp(π / 2) q[0], a;\nc[1] = measure q[1];\n"
+        result = process_qasm.read_script(source)
+        self.assertListEqual(list(result.ops), [circuit.PHASE, circuit.MEASURE])
+        self.assertEqual(result.qubits(0), ((0,), (2,)))
+        self.assertEqual(result.param(0), "pi / 2")
+
+    def testUndeclaredQubit(self):
+        error_log = conversion.ErrorLog()
+        result = process_qasm.read_script("qreg q[1];\nx q[1];\nx r[0];\n", error_log=error_log)
+        self.assertListEqual(list(result.ops), [circuit.UNTRANSLATED, circuit.UNTRANSLATED])
+
+    def testSplitStatements(self):
+        reader = process_qasm.Reader("")
+        source = "// c\nqreg q[1];\nh q[0]; x q[0];\ngate g a {\n  h a;\n}\n"
+        parts = list(reader.split_statements(io.StringIO(source)))
+        self.assertListEqual([(line_no, num_lines) for line_no, text, num_lines in parts], [(1, 2), (3, 1), (4, 3)])
+
+
+class WriteTests(unittest.TestCase):
+    def testGates(self):
+        result = circuit.Circuit()
+        result.add_gate(circuit.H, [0])
+        result.add_gate(circuit.PHASE, [1], [0], "np.pi / 2")
+        result.add_gate(circuit.MEASURE, [1])
+        self.assertListEqual(process_qasm.script_lines(result), ["h q[0];", "cu1(pi / 2) q[0], q[1];",
+                                                                 "measure q[1] -> c[1];"])
+        self.assertListEqual(process_qasm3.script_lines(result), ["h q[0];", "cp(pi / 2) q[0], q[1];",
+                                                                  "c[1] = measure q[1];"])
+
+    def testStatementsCommentedOut(self):
+        result = circuit.Circuit()
+        result.add_text(circuit.BLOCK, "for i in range(2):")
+        result.add_gate(circuit.H, [0], depth=1)
+        result.add_gate(circuit.X, ["qb"])
+        error_log = conversion.ErrorLog()
+        self.assertListEqual(process_qasm.script_lines(result, False, error_log),
+                             ["// for i in range(2):", "//     h q[0];", "// No equivalent gate: X on qubits qb"])
+        self.assertEqual(len(error_log.lines), 3)
+
+
+class ConvertTests(unittest.TestCase):
+    def testRoundTrip(self):
+        qutip = converter.convert(SCRIPT, "qasm", "qutip")
+        self.assertIn("quantum_circuit = QubitCircuit(3)", qutip.code)
+        qasm = converter.convert(qutip.code, "qutip", "qasm3")
+        self.assertTrue(qasm.code.startswith("//####"))
+        self.assertIn("h q[0];\ncx q[0], q[1];\n// entangle\nrz(pi / 4) q[0];\nrz(pi / 4) q[1];\n", qasm.code)
+        self.assertIn("// gate g a {\n//     h a;\n// }\n", qasm.code)
+
+    def testStreamMatchesWholeScript(self):
+        expected = converter.convert(SCRIPT, "qasm", "projectq").code
+        output = io.StringIO()
+        conversion.write_output_copyright(output, "OpenQASM 2.0", "ProjectQ")
+        streaming.convert_stream(io.StringIO(SCRIPT), output, process_qasm.Reader(""), converter.frontends["projectq"],
+                                 chunk_lines=1)
+        self.assertEqual(output.getvalue(), expected)
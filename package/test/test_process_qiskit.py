@@ -0,0 +1,116 @@
+import io
+import sys
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import circuit, conversion, converter, diagnostics, process_qiskit, streaming
+
+print("RUNNING TESTS - process_qiskit.py")
+
+SCRIPT = """from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
+from numpy import pi
+
+qr = QuantumRegister(2, 'q')
+anc = QuantumRegister(1, 'anc')
+cr = ClassicalRegister(3, 'c')
+qc = QuantumCircuit(qr, anc, cr)
+qc.h(qr[0])
+qc.cx(qr[0], qr[1])  # entangle
+qc.rz(pi / 4, qr)
+qc.ccx(0, 1, 2)
+qc.u(1, 2, 3, 0)
+qc.measure(qr, cr[0:2])
+"""
+
+
+def get_gates(circuit_in):
+    return [(circuit_in.ops[i], circuit_in.qubits(i), circuit_in.param(i)) for i in range(len(circuit_in))
+            if circuit_in.ops[i] >= circuit.FIRST_GATE]
+
+
+class ReadTests(unittest.TestCase):
+    def testRegistersAndBroadcast(self):
+        error_log = conversion.ErrorLog()
+        result = process_qiskit.read_script(SCRIPT, error_log=error_log)
+        self.assertEqual(result.num_qubits, 3)
+        self.assertEqual(result.qubit_names, ["qr[0]", "qr[1]", "anc"])
+        self.assertListEqual(get_gates(result), [(circuit.H, ((), (0,)), None),
+                                                 (circuit.X, ((0,), (1,)), None),
+                                                 (circuit.RZ, ((), (0,)), "pi / 4"),
+                                                 (circuit.RZ, ((), (1,)), "pi / 4"),
+                                                 (circuit.X, ((0, 1), (2,)), None),
+                                                 (circuit.MEASURE, ((), (0,)), None),
+                                                 (circuit.MEASURE, ((), (1,)), None)])
+        self.assertEqual(error_log.lines, ["12 - qc.u(1, 2, 3, 0)"])
+
+    def testCircuitOfSize(self):
+        source = "qc = QuantumCircuit(2, 2)\nqc.swap(0, 1)\nqc.barrier()\nqc.measure_all()\n"
+        result = process_qiskit.read_script(source)
+        self.assertEqual(result.num_qubits, 2)
+        self.assertListEqual(list(result.ops), [circuit.SWAP, circuit.BARRIER, circuit.BARRIER, circuit.MEASURE,
+                                                circuit.MEASURE])
+        self.assertEqual(result.qubits(0), ((), (0, 1)))
+        self.assertEqual(result.qubits(1), ((), (0, 1)))
+
+    def testFunctionParameters(self):
+        source = "qr = QuantumRegister(2)\nqc = QuantumCircuit(qr)\n\n\ndef layer(circ, q):\n    circ.h(q)\n"
+        result = process_qiskit.read_script(source)
+        self.assertListEqual(list(result.ops), [circuit.BLANK, circuit.BLANK, circuit.BLOCK, circuit.H])
+        self.assertEqual(result.qubits(3), ((), ("q",)))
+
+    def testPositionsInCircuitParameter(self):
+        # The circuit passed in could be any circuit, so positions in it are not register positions
+        error_log = conversion.ErrorLog()
+        source = "qc = QuantumCircuit(3)\n\n\ndef layer(circ):\n    circ.cx(0, 2)\n"
+        result = process_qiskit.read_script(source, error_log=error_log)
+        self.assertEqual(result.qubits(3), (("circ.qubits[0]",), ("circ.qubits[2]",)))
+        self.assertListEqual([(diagnostic.line, diagnostic.source, diagnostic.severity)
+                              for diagnostic in error_log.records],
+                             [(5, "circ.qubits[0]", diagnostics.WARNING), (5, "circ.qubits[2]", diagnostics.WARNING)])
+
+    def testQubitOutsideCircuit(self):
+        result = process_qiskit.read_script("qc = QuantumCircuit(1)\nqc.x(1)\nqc.x(0, label='x')\n")
+        self.assertListEqual(list(result.ops), [circuit.UNTRANSLATED, circuit.UNTRANSLATED])
+
+
+class WriteTests(unittest.TestCase):
+    def testGates(self):
+        result = circuit.Circuit()
+        result.add_gate(circuit.H, [0])
+        result.add_gate(circuit.PHASE, [1], [0], "pi / 2")
+        result.add_gate(circuit.BARRIER, [0, 1])
+        result.add_gate(circuit.MEASURE, [1])
+        self.assertListEqual(process_qiskit.script_lines(result), [
+            "quantum_circuit.h(qreg[0])",
+            "quantum_circuit.cp(pi / 2, qreg[0], qreg[1])",
+            "quantum_circuit.barrier(qreg[0], qreg[1])",
+            "quantum_circuit.measure(qreg[1], creg[1])"
+        ])
+
+    def testNoEquivalent(self):
+        result = circuit.Circuit()
+        result.add_gate(circuit.SQRTSWAP, [0, 1])
+        result.add_gate(circuit.Z, [2], [0, 1])
+        error_log = conversion.ErrorLog()
+        self.assertListEqual(process_qiskit.script_lines(result, False, error_log),
+                             ["# No equivalent gate: SQRTSWAP on qubits 0, 1",
+                              "# No equivalent gate: CC-Z on qubits 0, 1, 2"])
+        self.assertEqual(len(error_log.lines), 2)
+
+
+class ConvertTests(unittest.TestCase):
+    def testRoundTrip(self):
+        projectq = converter.convert(SCRIPT, "qiskit", "projectq")
+        self.assertIn("Toffoli | (qureg[0], qureg[1], qureg[2])", projectq.code)
+        qiskit = converter.convert(projectq.code, "projectq", "qiskit")
+        self.assertIn("quantum_circuit = QuantumCircuit(qreg, creg)", qiskit.code)
+        self.assertIn("quantum_circuit.rz(pi / 4, qreg[1])\nquantum_circuit.ccx(qreg[0], qreg[1], qreg[2])\n",
+                      qiskit.code)
+
+    def testStreamMatchesWholeScript(self):
+        expected = converter.convert(SCRIPT, "qiskit", "qutip").code
+        output = io.StringIO()
+        conversion.write_output_copyright(output, "Qiskit", "QuTiP")
+        streaming.convert_stream(io.StringIO(SCRIPT), output, process_qiskit.Reader(""), converter.frontends["qutip"],
+                                 chunk_lines=1)
+        self.assertEqual(output.getvalue(), expected)
@@ -0,0 +1,133 @@
+import sys
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import circuit, conversion, diagnostics, instrument, process_qutip
+
+print("RUNNING TESTS - process_qutip.py")
+
+
+def write_body(circuit_in):
+    """
+    Write a circuit's entries as QuTiP, without the imports and circuit definition
+    :param circuit_in: Circuit to write
+    :return: Output lines
+    """
+    return conversion.script_lines(circuit_in, process_qutip.write_gate)
+
+
+class ProcessGateTests(unittest.TestCase):
+    def testCircuitDefinition(self):
+        result = process_qutip.read_script("from qutip import *\ncircuit = QubitCircuit(3)\n")
+        self.assertEqual(result.num_qubits, 3)
+        self.assertEqual(len(result), 0)
+
+    def testUnknownSizeKept(self):
+        for size in ("\"a\"", "-1", "n"):
+            error_log = conversion.ErrorLog()
+            result = process_qutip.read_script("c = QubitCircuit(" + size + ")\n", error_log=error_log)
+            self.assertEqual(result.num_qubits, 0)
+            self.assertEqual(result.ops[0], circuit.STATEMENT)
+            self.assertListEqual([(diagnostic.category, diagnostic.severity) for diagnostic in error_log.records],
+                                 [(diagnostics.UNRESOLVED_SIZE, diagnostics.WARNING)])
+
+    def testPositionalAndKeywordParameters(self):
+        source = "c = QubitCircuit(2)\nc.add_gate(\"CNOT\", 1, 0)\nc.add_gate(\"CNOT\", controls=1, targets=0)\n"
+        result = process_qutip.read_script(source)
+        self.assertEqual(result.qubits(0), ((0,), (1,)))
+        self.assertEqual(result.qubits(1), ((1,), (0,)))
+
+    def testRotationGate(self):
+        source = "c = QubitCircuit(1)\nc.add_gate(\"RZ\", 0, None, pi / 2, r\"\\pi/2\")\nc.add_gate(\"RX\", 0)\n"
+        result = process_qutip.read_script(source)
+        self.assertListEqual(list(result.ops), [circuit.RZ, circuit.X])
+        self.assertEqual(result.param(0), "pi / 2")
+
+    def testMultiLineGate(self):
+        source = "c = QubitCircuit(2)\nc.add_gate(\"SWAP\",\n           [0, 1])\n"
+        result = process_qutip.read_script(source)
+        self.assertEqual(result.ops[0], circuit.SWAP)
+        self.assertEqual(result.qubits(0), ((), (0, 1)))
+
+
+def read_both(source):
+    """
+    Read a script as text, and as bytes as a memory mapped file is read
+    :param source: Input script
+    :return: Tuple of circuit and diagnostics read as text, and as bytes (None if read_mapped gave up)
+    """
+    text_log = diagnostics.ErrorLog()
+    text_circuit = process_qutip.Reader(source, error_log=text_log).read()
+    mapped_log = diagnostics.ErrorLog()
+    mapped_circuit = process_qutip.Reader("", error_log=mapped_log).read_mapped(source.encode())
+    return (text_circuit, text_log.to_list()), (mapped_circuit, mapped_log.to_list())
+
+
+def entries(circuit_in):
+    return [(circuit_in.ops[index], circuit_in.depths[index], circuit_in.lines[index], circuit_in.qubits(index),
+             circuit_in.text(index)) for index in range(len(circuit_in))]
+
+
+class ReadMappedTests(unittest.TestCase):
+    def assertReadSame(self, source):
+        (text_circuit, text_log), (mapped_circuit, mapped_log) = read_both(source)
+        self.assertIsNotNone(mapped_circuit)
+        self.assertListEqual(entries(mapped_circuit), entries(text_circuit))
+        self.assertEqual(mapped_circuit.num_qubits, text_circuit.num_qubits)
+        self.assertListEqual(mapped_log, text_log)
+
+    def testSimpleGates(self):
+        self.assertReadSame("from qutip import *\n\nc = QubitCircuit(3)\n# Gates\nc.add_gate(\"SNOT\", targets=0)\n"
+                            "c.add_gate(\"CNOT\", 1, 0)  # comment\nc.add_gate(gate='SWAP', targets=[0, 2],)\n"
+                            "c.add_gate(\"RX\", targets=1, arg_value=pi/2)\nc.add_gate(\"RX\", 2, None, None)\n\n")
+
+    def testOtherStatements(self):
+        self.assertReadSame("c = QubitCircuit(2)\ndef f():\n    c.add_gate(\"SNOT\", targets=0)\n    # inner\n"
+                            "# outer\n\nc.add_gate(\"SNOT\", targets=q)\nc.add_gate(\"UNKNOWN\", targets=0)\n"
+                            "c.add_gate(\"SWAP\",\n           [0, 1])\nprint(c)")
+
+    def testGatesNotParsed(self):
+        source = "c = QubitCircuit(2)\n" + "c.add_gate(\"CNOT\", controls=0, targets=1)\n" * 10
+        stats = instrument.Stats()
+        process_qutip.Reader("").read_mapped(source.encode(), stats)
+        self.assertEqual(stats.counters[instrument.PARSES], 1)
+
+    def testWindowsLineEndings(self):
+        source = "c = QubitCircuit(2)\r\n\r\n# Gates\r\nc.add_gate(\"SNOT\", targets=0)\r\nprint(c)\r\n"
+        text_circuit = process_qutip.Reader(source.replace("\r\n", "\n")).read()
+        mapped_circuit = process_qutip.Reader("").read_mapped(source.encode())
+        self.assertListEqual(entries(mapped_circuit), entries(text_circuit))
+
+    def testGateInsideString(self):
+        # The lines either side of the gate do not parse on their own, so are parsed with it
+        self.assertReadSame("c = QubitCircuit(2)\nc.add_gate(\"UNKNOWN\", targets=0)\nx = \"\"\"\n"
+                            "c.add_gate(\"SNOT\", targets=0)\n\"\"\"\nc.add_gate(\"SNOT\", targets=1)\n"
+                            "y = (1,\nc.add_gate(\"SNOT\", targets=0))\n" + "c.add_gate(\"SNOT\", targets=1)\n" * 5)
+
+    def testSyntaxError(self):
+        # Diagnostics found before the error have already been reported
+        source = ("c = QubitCircuit(2)\nc.add_gate(\"UNKNOWN\", targets=0)\nc.add_gate(\"SNOT\", targets=0)\n"
+                  "if x:\nc.add_gate(\"SNOT\", targets=0)\n")
+        log = diagnostics.ErrorLog()
+        with self.assertRaises(SyntaxError):
+            process_qutip.Reader("", error_log=log).read_mapped(source.encode())
+        self.assertEqual(log.errors, 1)
+
+
+class WriteGateTests(unittest.TestCase):
+    def testGates(self):
+        result = circuit.Circuit()
+        result.add_gate(circuit.H, [0])
+        result.add_gate(circuit.X, [1], [0])
+        result.add_gate(circuit.Z, ["qb"])
+        result.add_gate(circuit.MEASURE, [0])
+        self.assertListEqual(write_body(result), ["quantum_circuit.add_gate(\"SNOT\", targets=0)",
+                                                  "quantum_circuit.add_gate(\"CNOT\", controls=0, targets=1)",
+                                                  "quantum_circuit.add_gate(\"RZ\", targets=qb, arg_value=pi)"])
+
+    def testNoEquivalentGate(self):
+        result = circuit.Circuit()
+        result.add_gate(circuit.H, [2], [0, 1])
+        lines = write_body(result)
+        self.assertEqual(lines[0], conversion.MARK_COMMENT)
+        self.assertTrue(lines[1].startswith("# No equivalent gate: CC-H"))
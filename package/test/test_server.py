@@ -0,0 +1,109 @@
+#    Unit tests for server.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, '../convertqc')
+from convertqc import converter, error_cqc, server
+
+print("RUNNING TESTS - server.py")
+
+SCRIPT = "qureg = eng.allocate_qureg(2)\nH | qureg[0]\nCNOT | (qureg[0], qureg[1])\nUnknownGate | qureg\n"
+
+
+class ServerTest(unittest.TestCase):
+    def start(self, socket_path=None):
+        self.service = server.ConversionService(workers=4, use_cache=False)
+        self.server = server.create_server(self.service, socket_path, 0)
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.service.close)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+
+class SocketTests(ServerTest):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.socket_path = os.path.join(self.directory.name, "cqc.sock")
+        self.start(self.socket_path)
+
+    def testConvert(self):
+        with server.Client(self.socket_path) as client:
+            response = client.convert(SCRIPT, "projectq", "qutip", filename="bell.py")
+            self.assertEqual(response["code"], converter.convert(SCRIPT, "projectq", "qutip").code)
+            self.assertEqual(response["id"], 1)
+            self.assertEqual(response["counts"], {"untranslated-statement": 1})
+            self.assertEqual((response["diagnostics"][0]["file"], response["diagnostics"][0]["line"]), ("bell.py", 4))
+            self.assertEqual(client.convert(SCRIPT, "projectq", "cirq")["error"]["code"], error_cqc.UNSUPPORTED_FORMAT)
+
+    def testManyRequestsAtOnce(self):
+        formats = ["qutip", "qiskit", "qasm", "qasm3"] * 5
+        lines = "".join(json.dumps({"id": i, "source": SCRIPT, "from": "projectq", "to": dst}) + "\n"
+                        for i, dst in enumerate(formats))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(self.socket_path)
+            connection.sendall(("not json\n" + lines).encode())
+            connection.shutdown(socket.SHUT_WR)
+            with connection.makefile() as reader:
+                responses = [json.loads(line) for line in reader]
+        self.assertEqual(len(responses), len(formats) + 1)
+        by_id = {response["id"]: response for response in responses}
+        self.assertEqual(by_id[None]["error"]["code"], error_cqc.INVALID_REQUEST)
+        for i, dst in enumerate(formats):
+            self.assertEqual(by_id[i]["code"], converter.convert(SCRIPT, "projectq", dst).code)
+
+
+class HTTPTests(ServerTest):
+    def setUp(self):
+        self.start()
+        self.url = "http://127.0.0.1:" + str(self.server.server_address[1])
+
+    def post(self, request):
+        data = json.dumps(request).encode()
+        try:
+            with urllib.request.urlopen(self.url + "/convert", data) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return json.loads(e.read())
+
+    def testConvert(self):
+        response = self.post({"source": SCRIPT, "from": "projectq", "to": "qasm", "mark": False})
+        self.assertEqual(response["code"], converter.convert(SCRIPT, "projectq", "qasm", mark=False).code)
+        self.assertEqual(self.post({"source": SCRIPT})["error"]["code"], error_cqc.INVALID_REQUEST)
+
+    def testFormats(self):
+        with urllib.request.urlopen(self.url + "/formats") as response:
+            formats = json.loads(response.read())["formats"]
+        self.assertTrue(formats["qiskit"]["writes"])
+
+    def testInvalidContentLength(self):
+        for header in ("Content-Length: -1\r\n", "Content-Length: many\r\n", ""):
+            with socket.create_connection(self.server.server_address, timeout=5) as connection:
+                # The connection is left open, so a read to the end of the body would never return
+                connection.sendall(b"POST /convert HTTP/1.1\r\nHost: localhost\r\n" + header.encode() + b"\r\n")
+                status = connection.makefile("rb").readline()
+            self.assertEqual(status.split()[1], b"400")
@@ -0,0 +1,93 @@
+#    Unit tests for streaming.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import conversion, converter, error_cqc, process_projectq, process_qutip, streaming
+
+print("RUNNING TESTS - streaming.py")
+
+SCRIPT = """a = eng.allocate_qubit()
+if True:
+    H | a
+else:
+    X | a
+# kept with f
+
+@decorator
+def f(q):
+    Rz(0.5) | q
+s = \"\"\"
+# inside a string
+\"\"\"
+b = eng.allocate_qubit()
+CNOT | (a, b)
+Unknown | b
+"""
+
+
+def stream(source, chunk_lines):
+    """
+    Stream a ProjectQ script to QuTiP
+    :return: Converted script and error log
+    """
+    output = io.StringIO()
+    error_log = conversion.ErrorLog()
+    reader = process_projectq.Reader("", error_log=error_log)
+    streaming.convert_stream(io.StringIO(source), output, reader, process_qutip, True, error_log, chunk_lines)
+    return output.getvalue(), error_log.lines
+
+
+class ReadChunksTests(unittest.TestCase):
+    def testChunksSplitBetweenStatements(self):
+        chunks = list(streaming.read_chunks(io.StringIO(SCRIPT), 1))
+        self.assertEqual("".join(source for first_line, source, tree in chunks), SCRIPT)
+        starts = [first_line for first_line, source, tree in chunks]
+        # else stays with its if, comments and decorators with their def, strings are never split
+        self.assertListEqual(starts, [1, 2, 6, 11, 14, 15, 16])
+
+    def testSyntaxError(self):
+        with self.assertRaises(error_cqc.ConversionError):
+            list(streaming.read_chunks(io.StringIO("a = 1\nb = (\nc = 2\n"), 1))
+
+
+class ConvertStreamTests(unittest.TestCase):
+    def testMatchesWholeConversion(self):
+        whole = io.StringIO()
+        error_log = conversion.ErrorLog()
+        process_qutip.write_script(process_projectq.read_script(SCRIPT, error_log=error_log), whole, True, error_log)
+        for chunk_lines in (1, 2, 1000):
+            self.assertEqual(stream(SCRIPT, chunk_lines), (whole.getvalue(), error_log.lines))
+
+    def testQubitCountPatchedIntoHeader(self):
+        code, error_lines = stream(SCRIPT, 1)
+        self.assertIn("quantum_circuit = QubitCircuit(2)", code)
+        self.assertListEqual(error_lines, ["16 - Unknown | b"])
+
+    def testFailedStreamLeavesNoOutput(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_filename = os.path.join(temp_dir, "input.py")
+            output_filename = os.path.join(temp_dir, "output.py")
+            with open(input_filename, "w") as input_file:
+                input_file.write("H | q\n")
+            with self.assertRaises(error_cqc.ConversionError):
+                converter.Converter().convert_stream(input_filename, output_filename, "qutip", "projectq")
+            self.assertListEqual(os.listdir(temp_dir), ["input.py"])
@@ -0,0 +1,101 @@
+#    Unit tests for watch.py.
+#    Copyright (C) 2019  Harry Adams (convertqc@gmail.com)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <https://www.gnu.org/licenses/>
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, '../convertqc')
+from convertqc import converter, plugins, watch
+
+print("RUNNING TESTS - watch.py")
+
+SCRIPT = "c = QubitCircuit(1)\nc.add_gate(\"SNOT\", 0)\n"
+
+
+class WatchTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, "src")
+        self.output_dir = os.path.join(self.source_dir, "converted")
+        os.makedirs(os.path.join(self.source_dir, "nested"))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, relative_path, text, mtime=None):
+        path = os.path.join(self.source_dir, relative_path)
+        with open(path, "w") as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def testPollingWatcher(self):
+        self.write("a.py", SCRIPT, 1000)
+        watcher = watch.PollingWatcher(self.source_dir, 0.01)
+        self.assertListEqual(watcher.poll(0), [])
+        self.write("a.py", SCRIPT, 2000)
+        self.write("nested/b.py", SCRIPT)
+        self.assertListEqual(watcher.poll(0), ["a.py", os.path.join("nested", "b.py")])
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is only on Linux")
+    def testInotifyWatcher(self):
+        watcher = watch.InotifyWatcher(self.source_dir)
+        try:
+            self.assertListEqual(watcher.poll(0), [])
+            self.write("nested/b.py", SCRIPT)
+            self.write("notes.txt", "not a script")
+            self.assertListEqual(watcher.poll(1), [os.path.join("nested", "b.py")])
+        finally:
+            watcher.close()
+
+    def testOnlyStaleScriptsConverted(self):
+        self.write("a.py", SCRIPT, 1000)
+        self.write("nested/b.py", "c = (\n", 1000)
+        excluded = os.path.abspath(self.output_dir)
+        stale = [path for path in watch.find_scripts(self.source_dir, excluded)
+                 if watch.is_stale(self.source_dir, self.output_dir, path, "projectq")]
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = watch.convert_files(converter.Converter(), self.source_dir, self.output_dir, stale,
+                                          "qutip", "projectq")
+        self.assertListEqual([result.failed for result in results], [False, True])
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "a.py")))
+
+        # Converted scripts are in the watched directory, but are never converted again themselves
+        self.assertListEqual(watch.find_scripts(self.source_dir, excluded), ["a.py", os.path.join("nested", "b.py")])
+        self.assertFalse(watch.is_stale(self.source_dir, self.output_dir, "a.py", "projectq"))
+
+    def testFormatExtensions(self):
+        self.write("a.py", SCRIPT, 1000)
+        self.write("nested/b.qasm", "OPENQASM 2.0;\nqreg q[1];\nh q[0];\n", 1000)
+        excluded = os.path.abspath(self.output_dir)
+        self.assertListEqual(watch.find_scripts(self.source_dir, excluded, ".qasm"), [os.path.join("nested", "b.qasm")])
+        # Formats which cannot be converted a statement at a time are converted whole
+        plugins.register("wholeqasm", "convertqc.process_qasm", "OpenQASM 2.0", ".qasm", streams=False)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = watch.convert_files(converter.Converter(), self.source_dir, self.output_dir, ["a.py"],
+                                              "qutip", "wholeqasm")
+        finally:
+            plugins.formats.pop("wholeqasm")
+        self.assertFalse(results[0].failed)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "a.qasm")))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "a.qasm.cqc.json")))
+        self.assertFalse(watch.is_stale(self.source_dir, self.output_dir, "a.py", "qasm"))
+        self.assertTrue(watch.is_stale(self.source_dir, self.output_dir, "a.py", "projectq"))